@@ -0,0 +1,162 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from metrics import LIMITER_IN_FLIGHT, LIMITER_QUEUED
+
+# Admission control for the endpoints that call Gemini generation: an
+# opt-in per-client token bucket in front, and a concurrency limiter with a
+# bounded wait queue around the LLM calls. Both reject with a Retry-After
+# estimate instead of letting requests pile up behind the Gemini quota.
+#
+# Clients are told apart by the connecting address. The frontend and the
+# Slack bot share a few addresses, so X-Forwarded-For and X-Api-Key are
+# only believed from the proxies listed in TRUSTED_PROXIES; from anyone
+# else they would let a client pick its own bucket.
+
+GENERATION_MAX_CONCURRENT = int(os.getenv("GENERATION_MAX_CONCURRENT", "8"))
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "16"))
+GENERATION_QUEUE_TIMEOUT = float(os.getenv("GENERATION_QUEUE_TIMEOUT", "5"))  # Seconds
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))  # 0 disables rate limiting
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+# Comma-separated addresses of reverse proxies whose client headers are trusted
+TRUSTED_PROXIES = {host.strip() for host in os.getenv("TRUSTED_PROXIES", "").split(",") if host.strip()}
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after  # Whole seconds, for the Retry-After header
+
+
+class ConcurrencyLimiter:
+    """At most max_concurrent holders; up to max_queue more wait in FIFO
+    order for at most queue_timeout seconds. Anything beyond that is
+    rejected immediately."""
+
+    def __init__(self, name, max_concurrent=GENERATION_MAX_CONCURRENT, max_queue=GENERATION_MAX_QUEUE,
+                 queue_timeout=GENERATION_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = deque()
+        self._avg_hold = 1.0  # Moving average of seconds a slot is held, for Retry-After
+
+    def _update_gauges(self):
+        LIMITER_IN_FLIGHT.set(self._active, limiter=self.name)
+        LIMITER_QUEUED.set(len(self._waiters), limiter=self.name)
+
+    def retry_after(self):
+        # Time for the current queue plus one more request to drain through the slots
+        waves = (len(self._waiters) + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(self._avg_hold * waves))
+
+    async def acquire(self):
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded("queue full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up, pass it on
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            self._update_gauges()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Overloaded("queue timeout", self.retry_after())
+
+    def release(self):
+        # Hand the slot straight to the next live waiter, if any
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.perf_counter() - start)
+            self.release()
+
+    def stats(self):
+        return {
+            "in_flight": self._active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        }
+
+
+class TokenBucketLimiter:
+    """One token bucket per client key, refilled at rate_per_minute up to
+    burst. The least recently seen clients are forgotten beyond max_clients."""
+
+    def __init__(self, rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, max_clients=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # key -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def check(self, key, cost=1.0):
+        """Take cost tokens for key. Returns 0 if allowed, otherwise the
+        number of seconds until enough tokens will be available."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0
+            else:
+                retry_after = max(1, math.ceil((cost - tokens) / self.rate))
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+def client_key(request, trusted_proxies=TRUSTED_PROXIES):
+    """Who a request is accounted to: the connecting address, or when that is
+    a trusted proxy, the API key it passes on or the nearest untrusted hop
+    of X-Forwarded-For"""
+    host = request.client.host if request.client else "unknown"
+    if host not in trusted_proxies:
+        return f"ip:{host}"
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return f"key:{api_key}"
+    # Walk back from the proxy that connected; earlier entries can be forged by the client
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return f"ip:{hop}"
+    return f"ip:{hops[0] if hops else host}"
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+# In-memory cache of generated answers keyed by query embedding. A new query
+# whose embedding is within the cosine threshold of a cached query in the
+# same scope (endpoint, version, resource filter, retrieval and context
+# packing options) reuses that answer and skips both retrieval and
+# generation. Entries are evicted by LRU and age, and the whole cache is
+# dropped when the corpus generation changes.
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def answer_cache_scope(endpoint, request):
+    """Everything besides the query text that changes the answer: retrieval
+    options and how the retrieved context is packed for the summary"""
+    return (endpoint, request.version, request.include_resources, request.n_results, request.rerank, request.rerank_top_k,
+            request.mmr_lambda, request.max_per_parent, request.pack_context, request.context_token_budget)
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_SIZE, max_age=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.generation = None
+        self._entries = OrderedDict()  # key -> entry, least recently used first
+        self._scope_index = {}         # scope -> (keys, matrix), rebuilt lazily
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0.0
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                print(f"Corpus generation changed ({self.generation} -> {generation}), clearing answer cache")
+                self.invalidations += 1
+            self._entries.clear()
+            self._scope_index.clear()
+            self.generation = generation
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._scope_index.pop(entry["scope"], None)
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.max_age]
+        for key in expired:
+            self._remove(key)
+
+    def _index_for(self, scope):
+        index = self._scope_index.get(scope)
+        if index is None:
+            keys = [key for key, entry in self._entries.items() if entry["scope"] == scope]
+            matrix = np.stack([self._entries[key]["vector"] for key in keys]) if keys else None
+            index = (keys, matrix)
+            self._scope_index[scope] = index
+        return index
+
+    def lookup(self, embedding, scope, generation):
+        """Return (cached answer, similarity) or (None, best similarity)"""
+        with self._lock:
+            self._check_generation(generation)
+            self._expire(time.time())
+            keys, matrix = self._index_for(scope)
+            if matrix is None:
+                self.misses += 1
+                return None, None
+
+            similarities = matrix @ _normalize(embedding)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+
+            key = keys[best]
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.latency_saved_ms += entry["latency_ms"]
+            cached = dict(entry["answer"])
+            cached["cache"] = {
+                "hit": True,
+                "similarity": similarity,
+                "cached_query": entry["query"],
+                "age_seconds": round(time.time() - entry["created_at"], 1),
+            }
+            return cached, similarity
+
+    def store(self, embedding, scope, generation, query, answer, latency_ms):
+        with self._lock:
+            self._check_generation(generation)
+            key = str(uuid.uuid4())
+            self._entries[key] = {
+                "vector": _normalize(embedding),
+                "scope": scope,
+                "query": query,
+                "answer": answer,
+                "latency_ms": latency_ms,
+                "created_at": time.time(),
+            }
+            self._scope_index.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scope_index.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_age_seconds": self.max_age,
+                "threshold": self.threshold,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "latency_saved_ms": round(self.latency_saved_ms, 1),
+            }
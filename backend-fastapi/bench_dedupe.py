@@ -0,0 +1,48 @@
+import sys
+import time
+
+from preprocess import load_yaml_docs, iter_chunk_records, metadata_versions
+
+# Measure how much cross-version deduplication shrinks the index for a
+# scraped YAML file: chunks before and after, and estimated embedding and
+# vector memory saved. No embedding calls are made.
+#
+# Usage: python bench_dedupe.py [vitess_docs.yaml]
+
+EMBEDDING_DIM = 768
+
+if __name__ == "__main__":
+    yaml_path = sys.argv[1] if len(sys.argv) > 1 else "vitess_docs.yaml"
+    start = time.perf_counter()
+    docs = load_yaml_docs(yaml_path)
+
+    total_chunks = 0
+    total_chars = 0
+    unique = {}  # chunk ID -> (chars, set of versions)
+    for record in iter_chunk_records(docs):
+        total_chunks += 1
+        total_chars += len(record.document)
+        chars, versions = unique.setdefault(record.id, (len(record.document), set()))
+        versions.update(metadata_versions(record.metadata))
+
+    unique_chars = sum(chars for chars, _ in unique.values())
+    elapsed = time.perf_counter() - start
+
+    print(f"Entries in {yaml_path}: {len(docs)}")
+    print(f"Chunks before dedupe: {total_chunks}")
+    print(f"Unique chunks after dedupe: {len(unique)}")
+    if unique:
+        print(f"Dedupe ratio: {total_chunks / len(unique):.2f}x")
+        print(f"Embedded characters: {total_chars} -> {unique_chars} "
+              f"({100 * (1 - unique_chars / total_chars):.1f}% fewer billable characters)")
+        vector_bytes = EMBEDDING_DIM * 4
+        print(f"float32 vector memory: {total_chunks * vector_bytes / 2**20:.1f} MiB -> "
+              f"{len(unique) * vector_bytes / 2**20:.1f} MiB")
+
+        histogram = {}
+        for _, versions in unique.values():
+            histogram[len(versions)] = histogram.get(len(versions), 0) + 1
+        print("\nUnique chunks by number of versions sharing them:")
+        for count in sorted(histogram):
+            print(f"  {count:>2} versions: {histogram[count]}")
+    print(f"\nCompleted in {elapsed:.2f}s")
@@ -0,0 +1,74 @@
+import sys
+import time
+
+from bench_workers import children, memory_kib
+from fixture_site import PAGES, serve_fixture_site
+from html_extract import html_to_markdown
+from vitess_scrapper import DriverSession, get_page_content, setup_driver
+
+# Pages/minute and Chrome memory of the scraper's browser profiles on the
+# local fixture site: the original setup_driver (full page load, every
+# image, font, stylesheet and analytics script), and DriverSession (eager
+# page load, non-document resources blocked over CDP, one browser reused
+# and recycled every recycle_pages pages). Memory is the RSS and PSS summed
+# over chromedriver and every Chrome process under it, sampled after each
+# page; the peak is reported. Needs Chrome and chromedriver; Linux only.
+#
+# Usage: python bench_driver.py [pages] [recycle_pages] [latency_ms] [analytics_ms]
+
+
+def chrome_memory(driver):
+    """(RSS, PSS) in MiB of chromedriver and all its descendant processes"""
+    pending = [driver.service.process.pid]
+    rss = pss = 0
+    while pending:
+        pid = pending.pop()
+        try:
+            stats = memory_kib(pid)
+        except FileNotFoundError:
+            continue
+        rss += stats.get("VmRSS", 0)
+        pss += stats.get("Pss", 0)
+        pending.extend(children(pid))
+    return rss / 1024, pss / 1024
+
+
+def run(name, urls, fetch, current_driver):
+    peak_rss = peak_pss = 0.0
+    empty = 0
+    start = time.perf_counter()
+    for url in urls:
+        if not fetch(url):
+            empty += 1
+        rss, pss = chrome_memory(current_driver())
+        peak_rss, peak_pss = max(peak_rss, rss), max(peak_pss, pss)
+    seconds = time.perf_counter() - start
+    print(f"{name:<34} {len(urls) / seconds * 60:>10.1f} {peak_rss:>14.1f} {peak_pss:>14.1f} {empty:>6}")
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    recycle_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+    analytics_ms = float(sys.argv[4]) if len(sys.argv) > 4 else 300
+
+    with serve_fixture_site(latency_ms=latency_ms, analytics_ms=analytics_ms) as base_url:
+        docs = [f"{base_url}/{path}" for path in PAGES]
+        urls = [docs[i % len(docs)] for i in range(pages)]
+        print(f"{pages} page loads of {len(docs)} fixture pages, {latency_ms:.0f} ms per request, "
+              f"{analytics_ms:.0f} ms analytics")
+        print(f"{'profile':<34} {'pages/min':>10} {'peak RSS MiB':>14} {'peak PSS MiB':>14} {'empty':>6}")
+
+        driver = setup_driver(headless=True)
+        try:
+            run("setup_driver (baseline)", urls, lambda url: get_page_content(driver, url), lambda: driver)
+        finally:
+            driver.quit()
+
+        session = DriverSession(headless=True, recycle_pages=recycle_pages)
+        try:
+            run(f"DriverSession, recycle every {recycle_pages}", urls, lambda url: html_to_markdown(session.fetch(url)),
+                lambda: session.driver)
+        finally:
+            session.close()
+        print(f"DriverSession launched {session.launches} browsers")
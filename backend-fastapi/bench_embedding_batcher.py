@@ -0,0 +1,91 @@
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_batcher import EmbeddingBatcher
+
+# Throughput vs tail latency of query embedding at different batching
+# windows, against a simulated upstream: each call costs a fixed round trip
+# plus a small per-text cost, and only a few calls may be in flight at once
+# (connection pool / quota). No network access is needed.
+#
+# Usage: python bench_embedding_batcher.py [concurrency,...] [seconds]
+
+ROUND_TRIP_MS = 60.0
+PER_TEXT_MS = 0.5
+MAX_IN_FLIGHT = 8
+WINDOWS_MS = [0, 2, 5, 10, 20]
+
+_in_flight = threading.Semaphore(MAX_IN_FLIGHT)
+upstream_calls = 0
+
+
+def fake_embed_batch(texts, title, dimensionality=768):
+    global upstream_calls
+    with _in_flight:
+        upstream_calls += 1
+        time.sleep((ROUND_TRIP_MS + PER_TEXT_MS * len(texts)) / 1000.0)
+    return [[float(len(text))] * 8 for text in texts]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(window_ms, concurrency, seconds):
+    global upstream_calls
+    upstream_calls = 0
+    batcher = EmbeddingBatcher(fake_embed_batch, window_ms=window_ms, max_batch_size=32)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(client_id):
+        n = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            text = f"query {client_id} {n}"
+            if window_ms is None:
+                await asyncio.to_thread(fake_embed_batch, [text], "Vitess Documentation")
+            else:
+                await batcher.embed(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+            n += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "qps": len(latencies) / elapsed,
+        "upstream_calls": upstream_calls,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def main():
+    concurrencies = [int(c) for c in (sys.argv[1] if len(sys.argv) > 1 else "4,64").split(",")]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    # Enough threads for every client in the unbatched case
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(concurrencies) + 4))
+
+    print(f"Simulated upstream: {ROUND_TRIP_MS}ms + {PER_TEXT_MS}ms/text, {MAX_IN_FLIGHT} calls in flight, "
+          f"{seconds}s per run")
+    for concurrency in concurrencies:
+        print(f"\n{concurrency} concurrent clients")
+        print(f"{'window':>10} {'qps':>8} {'upstream calls':>15} {'texts/call':>11} {'p50 ms':>8} {'p99 ms':>8}")
+        for window_ms in [None] + WINDOWS_MS:
+            stats = await run(window_ms, concurrency, seconds)
+            label = "unbatched" if window_ms is None else f"{window_ms}ms"
+            per_call = stats["requests"] / stats["upstream_calls"] if stats["upstream_calls"] else 0
+            print(f"{label:>10} {stats['qps']:>8.0f} {stats['upstream_calls']:>15} {per_call:>11.1f} "
+                  f"{stats['p50']:>8.1f} {stats['p99']:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
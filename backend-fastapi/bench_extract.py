@@ -0,0 +1,88 @@
+import gzip
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+from fixture_site import render_sidebar
+from html_extract import html_to_markdown
+
+# Throughput of the HTML -> Markdown extractor over a corpus of cached
+# pages, single process and with a process pool. Reads *.html / *.html.gz
+# files from a directory, or generates pages shaped like the archived docs
+# (full sidebar, several sections with highlighted code and tables, ~100 KB
+# of HTML each). The target is the whole archived corpus in under a minute.
+#
+# Usage: python bench_extract.py [pages|html_dir] [workers]
+
+WORDS = ["vtgate", "vttablet", "keyspace", "shard", "reshard", "MoveTables", "VReplication", "the", "a",
+         "to", "of", "and", "tablet", "primary", "replica", "schema", "query", "workflow", "backup", "cell"]
+
+
+def synthetic_page(i, rng):
+    sections = []
+    for s in range(rng.randint(4, 12)):
+        paragraphs = "".join(
+            f"<p>{' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))} <code>--flag-{s}</code> "
+            f"<a href=\"/docs/faq/\">link</a>.</p>" for _ in range(rng.randint(1, 5))
+        )
+        code = "".join(
+            f'<span class="line"><span class="cl">vtctldclient --server localhost:15999 '
+            f'<span class="nt">{rng.choice(WORDS)}</span> {n}\n</span></span>' for n in range(rng.randint(3, 40))
+        )
+        rows = "".join(f"<tr><td><code>--{rng.choice(WORDS)}</code></td><td>{rng.randint(1, 99)}s</td>"
+                       f"<td>{' '.join(rng.choice(WORDS) for _ in range(12))}</td></tr>" for _ in range(rng.randint(0, 15)))
+        sections.append(
+            f'<h2 id="section-{s}">Section {s} <a class="anchor" href="#section-{s}">#</a></h2>{paragraphs}'
+            f'<div class="highlight"><pre tabindex="0" class="chroma"><code class="language-sh" data-lang="sh">'
+            f'{code}</code></pre></div>'
+            + (f"<table><thead><tr><th>Flag</th><th>Default</th><th>Description</th></tr></thead>"
+               f"<tbody>{rows}</tbody></table>" if rows else "")
+            + f"<h3>Notes for {s}</h3><ul>" + "".join(f"<li>{rng.choice(WORDS)} item</li>" for _ in range(5)) + "</ul>"
+        )
+    # Archived pages carry the whole sidebar of their version
+    sidebar = render_sidebar("docs/22.0/overview/") * 20
+    return (f"<!DOCTYPE html><html><head><title>Page {i}</title><script>var x = 1;</script></head><body>"
+            f"{sidebar}<article class=\"docs-content\"><h1>Page {i}</h1>{''.join(sections)}</article>"
+            f"<footer>footer</footer></body></html>")
+
+
+def load_pages(source):
+    if os.path.isdir(source):
+        pages = []
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if name.endswith(".html.gz"):
+                with gzip.open(path, "rt", encoding="utf-8") as file:
+                    pages.append(file.read())
+            elif name.endswith(".html"):
+                with open(path, "r", encoding="utf-8") as file:
+                    pages.append(file.read())
+        return pages
+    rng = random.Random(42)
+    return [synthetic_page(i, rng) for i in range(int(source))]
+
+
+def run(pages, workers):
+    start = time.perf_counter()
+    if workers <= 1:
+        markdown = [html_to_markdown(page) for page in pages]
+    else:
+        with Pool(processes=workers) as pool:
+            markdown = pool.map(html_to_markdown, pages, chunksize=16)
+    return time.perf_counter() - start, markdown
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "2000"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    pages = load_pages(source)
+    html_mb = sum(len(page) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {html_mb:.1f} MB of HTML")
+
+    for count in sorted({1, workers}):
+        seconds, markdown = run(pages, count)
+        markdown_mb = sum(len(text) for text in markdown) / 1e6
+        print(f"{count:>3} workers: {seconds:.2f}s, {len(pages) / seconds:.0f} pages/s, "
+              f"{html_mb / seconds:.1f} MB/s of HTML -> {markdown_mb:.1f} MB of Markdown")
@@ -0,0 +1,108 @@
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from preprocess import VERSION_FLAG_PREFIX
+from snapshot import Snapshot, export_snapshot
+
+# Flat vs two-stage (page -> chunk) vector search through Snapshot.vector_search,
+# on a synthetic corpus shaped like the deduplicated docs: pages of 1-16
+# chunks whose vectors scatter around a per-page direction, each page in a
+# run of consecutive versions. Queries are noisy copies of random chunks.
+# Reports latency, chunks scored, distinct pages in the top k, how often
+# the query's source page is in the top k, and overlap with the flat top k.
+# Runs without Chroma or an API key; for recall on real queries use the
+# "pages" backend of bench_retrieval.py.
+#
+# Usage: python bench_pages.py [pages] [page_candidates,...] [k] [dim]
+
+VERSIONS = [f"v{major}.0" for major in range(8, 23)]
+QUERIES = 200
+
+
+class ArrayCollection:
+    """Just enough of a Chroma collection for export_snapshot"""
+
+    def __init__(self, name, ids, documents, metadatas, embeddings):
+        self.name = name
+        self.metadata = {"embedding_dtype": "float32"}
+        self._columns = {"ids": ids, "documents": documents, "metadatas": metadatas, "embeddings": embeddings}
+
+    def get(self, include, limit, offset):
+        return {name: values[offset:offset + limit] for name, values in self._columns.items()}
+
+
+def synthetic_corpus(pages, dim, rng):
+    ids, documents, metadatas, vectors = [], [], [], []
+    centers = rng.standard_normal((pages, dim)).astype(np.float32)
+    for page in range(pages):
+        first = int(rng.integers(len(VERSIONS)))
+        versions = VERSIONS[first:first + int(rng.integers(1, 6))]
+        for chunk in range(int(rng.integers(1, 17))):
+            ids.append(f"{page}-{chunk}")
+            documents.append(f"page {page} chunk {chunk}")
+            metadata = {"title": f"Page {page}", "url": f"https://vitess.io/docs/page-{page}/",
+                        "page_key": f"/page-{page}", "id_parent": str(page), "versions": "|".join(versions)}
+            for version in versions:
+                metadata[VERSION_FLAG_PREFIX + version] = True
+            metadatas.append(metadata)
+            vectors.append(centers[page] + rng.standard_normal(dim).astype(np.float32) * 1.2)
+    return ids, documents, metadatas, np.asarray(vectors, dtype=np.float32)
+
+
+def run(snapshot, queries, k, n_pages):
+    latencies, distinct, hits, results = [], [], 0, []
+    for query, version, source_page in queries:
+        start = time.perf_counter()
+        found = snapshot.vector_search(query, k, version, False, n_pages)
+        latencies.append((time.perf_counter() - start) * 1000)
+        pages = [result['metadata']['page_key'] for result in found]
+        distinct.append(len(set(pages)))
+        hits += source_page in pages
+        results.append([result['document'] for result in found])
+    return latencies, statistics.mean(distinct), hits / len(queries), results
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    candidate_counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [10, 20, 50]
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    dim = int(sys.argv[4]) if len(sys.argv) > 4 else 768
+
+    rng = np.random.default_rng(7)
+    ids, documents, metadatas, vectors = synthetic_corpus(pages, dim, rng)
+    directory = tempfile.mkdtemp(prefix="bench_pages_")
+    try:
+        export_start = time.perf_counter()
+        export_snapshot(ArrayCollection("bench_g0", ids, documents, metadatas, vectors), directory)
+        snapshot = Snapshot(os.path.join(directory, "bench_g0"))
+        print(f"{pages} pages, {len(ids)} chunks, {dim}-d; snapshot with page index in "
+              f"{time.perf_counter() - export_start:.1f}s")
+
+        queries = []
+        for row in rng.integers(len(ids), size=QUERIES):
+            versions = metadatas[row]["versions"].split("|")
+            query = vectors[row] + rng.standard_normal(dim).astype(np.float32)
+            queries.append((query, versions[int(rng.integers(len(versions)))], metadatas[row]["page_key"]))
+
+        print(f"{'search':<16} {'scored':>8} {'p50 ms':>8} {'p95 ms':>8} {'pages@' + str(k):>9} "
+              f"{'source@' + str(k):>10} {'flat overlap':>13}")
+        run(snapshot, queries[:10], k, 0)  # Warm up the mmap'd arrays and version masks
+        latencies, distinct, source, flat_results = run(snapshot, queries, k, 0)
+        print(f"{'flat':<16} {len(ids):>8} {statistics.median(latencies):>8.2f} "
+              f"{sorted(latencies)[int(len(latencies) * 0.95)]:>8.2f} {distinct:>9.2f} {source:>10.2f} {1.0:>13.2f}")
+        for n_pages in candidate_counts:
+            latencies, distinct, source, results = run(snapshot, queries, k, n_pages)
+            scored = statistics.mean(len(snapshot.pages.candidate_rows(query, n_pages, version, False))
+                                     for query, version, _ in queries)
+            overlap = statistics.mean(len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(flat_results, results))
+            print(f"{f'{n_pages} pages':<16} {scored:>8.0f} {statistics.median(latencies):>8.2f} "
+                  f"{sorted(latencies)[int(len(latencies) * 0.95)]:>8.2f} {distinct:>9.2f} {source:>10.2f} "
+                  f"{overlap:>13.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import time
+
+from preprocess import load_yaml_docs, iter_chunk_records
+
+# Benchmark the preprocessing stage of ingestion (normalize, chunk, hash,
+# metadata) at different process pool sizes. No embedding calls are made.
+#
+# Usage: python bench_preprocess.py [vitess_docs.yaml]
+
+
+def synthetic_docs(count=3000, seed=7):
+    """Random documents shaped like the scraped YAML entries"""
+    rng = random.Random(seed)
+    words = ["vitess", "keyspace", "shard", "vtgate", "vttablet", "tablet", "MoveTables",
+             "Reshard", "VReplication", "schema", "query", "mysql", "topology", "cell",
+             "--keyspace", "--tablet_types", "replica", "primary", "backup", "restore"]
+    docs = []
+    for i in range(count):
+        lines = []
+        for _ in range(rng.randint(20, 600)):
+            lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(3, 15))))
+        content = "\n".join(lines)
+        docs.append({
+            "id_parent": i + 1,
+            "title": f"Page {i + 1}",
+            "url": f"https://vitess.io/docs/22.0/page-{i + 1}/",
+            "content": content,
+            "version_or_commonresource": "v22.0 (Development)",
+            "char_count": len(content),
+            "approx_token_count": (len(content) + 3) // 4
+        })
+    return docs
+
+
+def run(docs, workers):
+    start = time.perf_counter()
+    ids = [record.id for record in iter_chunk_records(docs, workers=workers)]
+    elapsed = time.perf_counter() - start
+    return elapsed, ids
+
+
+if __name__ == "__main__":
+    yaml_path = sys.argv[1] if len(sys.argv) > 1 else "vitess_docs.yaml"
+    if os.path.exists(yaml_path):
+        start = time.perf_counter()
+        docs = load_yaml_docs(yaml_path)
+        print(f"Loaded {len(docs)} entries from {yaml_path} in {time.perf_counter() - start:.2f}s")
+    else:
+        docs = synthetic_docs()
+        print(f"{yaml_path} not found, using {len(docs)} synthetic entries")
+
+    cpu_count = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cpu_count})
+    baseline_time, baseline_ids = run(docs, 1)
+    print(f"workers=1: {baseline_time:.2f}s, {len(baseline_ids)} chunks, "
+          f"{len(baseline_ids) / baseline_time:.0f} chunks/sec")
+
+    for workers in worker_counts:
+        if workers == 1:
+            continue
+        elapsed, ids = run(docs, workers)
+        print(f"workers={workers}: {elapsed:.2f}s, {len(ids) / elapsed:.0f} chunks/sec, "
+              f"speedup {baseline_time / elapsed:.2f}x, "
+              f"same ID order: {ids == baseline_ids}")
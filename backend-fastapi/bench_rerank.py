@@ -0,0 +1,81 @@
+import statistics
+import sys
+
+from main import chroma_client, get_embedding
+from context_packing import format_snippets
+from rerank import rerank_results
+
+# Compare the summarization prompt size for the plain top-n_results path
+# against over-fetching + reranking down to rerank_top_k.
+# Needs GEMINI_API_KEY and a populated Chroma server, like main.py.
+#
+# Usage: python bench_rerank.py [n_results] [rerank_candidates] [rerank_top_k]
+
+QUERIES = [
+    "How do I move tables from one keyspace to another?",
+    "How do I reshard a keyspace?",
+    "What is vtgate?",
+    "How do I take a backup of a tablet?",
+    "How does online DDL work?",
+    "What flags does vtctldclient MoveTables create accept?",
+    "How do I enable query consolidation?",
+    "What is a cell in Vitess topology?",
+    "How do I configure a vindex for sharding?",
+    "How do I upgrade Vitess to a new version?",
+]
+
+VERSION = "v22.0 (Development)"
+
+
+def estimate_tokens(text):
+    # Same 4 characters per token approximation used by the scraper
+    return (len(text) + 3) // 4
+
+
+def fetch(collection, query_embedding, n_results):
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        where={"version_or_commonresource": VERSION},
+        include=['documents', 'metadatas', 'distances']
+    )
+    formatted_results = []
+    if results['documents'] and results['documents'][0]:
+        for i in range(len(results['documents'][0])):
+            formatted_results.append({
+                'document': results['documents'][0][i],
+                'metadata': results['metadatas'][0][i],
+                'similarity_score': 1 - results['distances'][0][i]
+            })
+    return formatted_results
+
+
+if __name__ == "__main__":
+    n_results = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rerank_candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rerank_top_k = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    collection = chroma_client.get_collection("vitess_docs_v1")
+    saved = []
+    rerank_ms = []
+
+    for query in QUERIES:
+        query_embedding = get_embedding(query)
+        baseline = fetch(collection, query_embedding, n_results)
+        candidates = fetch(collection, query_embedding, rerank_candidates)
+        reranked, stats = rerank_results(query, candidates, rerank_top_k, version=VERSION)
+
+        baseline_tokens = estimate_tokens(format_snippets(baseline))
+        reranked_tokens = estimate_tokens(format_snippets(reranked))
+        saved.append(baseline_tokens - reranked_tokens)
+        rerank_ms.append(stats["elapsed_ms"])
+
+        print(f"{query}")
+        print(f"  top-{n_results}: {baseline_tokens} prompt tokens | "
+              f"rerank {len(candidates)}->{len(reranked)}: {reranked_tokens} prompt tokens | "
+              f"saved {baseline_tokens - reranked_tokens} | rerank {stats['elapsed_ms']:.2f}ms")
+
+    print("\n===== Rerank Summary =====")
+    print(f"Mean prompt tokens saved per answer: {statistics.mean(saved):.0f}")
+    print(f"Median prompt tokens saved per answer: {statistics.median(saved):.0f}")
+    print(f"Mean rerank time: {statistics.mean(rerank_ms):.2f}ms, max {max(rerank_ms):.2f}ms")
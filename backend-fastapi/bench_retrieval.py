@@ -0,0 +1,348 @@
+import hashlib
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import yaml
+
+from page_index import PAGE_SEARCH_PAGES, PageIndex
+from preprocess import build_where_filter, matches_version, page_key, resolve_version_metadata
+from rerank import rerank_results
+from vectors import normalize_rows, top_k
+
+# Retrieval quality and latency benchmark over the golden query set.
+#
+#   python bench_retrieval.py freeze
+#       Snapshot the active generation (ids, documents, metadata, vectors)
+#       and embed the golden queries into retrieval_fixture.npz. This is the
+#       only step that needs GEMINI_API_KEY and the Chroma server.
+#
+#   python bench_retrieval.py [k] [report.json] [backends]
+#       Run every backend (default exact,chroma,rerank,pages) against the
+#       frozen fixture with no network access, print recall@k, MRR, distinct
+#       pages in the top k, chunks scored per query, latency percentiles and
+#       QPS, and write a JSON report for comparing runs. "pages" is the
+#       two-stage page -> chunk search, to compare against flat "exact".
+#
+# To compare chunking or ingestion changes, build a generation with the new
+# code, freeze it, and diff the two reports.
+
+FIXTURE_FILE = "retrieval_fixture.npz"
+GOLDEN_FILE = "golden_queries.yaml"
+BACKENDS = ["exact", "chroma", "rerank", "pages"]
+RERANK_CANDIDATES = 50
+PAGE_CANDIDATES = PAGE_SEARCH_PAGES or 20
+REPEATS = 3
+
+
+def load_golden(path=GOLDEN_FILE):
+    with open(path, 'r', encoding='utf-8') as file:
+        golden = yaml.safe_load(file)
+    default_version = golden.get("version", "")
+    include_resources = golden.get("include_resources", True)
+    return [{
+        "query": entry["query"],
+        "version": entry.get("version", default_version),
+        "include_resources": entry.get("include_resources", include_resources),
+        "relevant": list(entry["relevant"]),
+    } for entry in golden["queries"]]
+
+
+def golden_digest(queries):
+    return hashlib.sha256(json.dumps(queries, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def freeze():
+    from main import generation_alias, get_embedding
+
+    queries = load_golden()
+    collection = generation_alias.active_collection()
+    if collection is None:
+        raise SystemExit("No active generation to freeze")
+    dimensionality = int((collection.metadata or {}).get("embedding_dim", 768))
+
+    print(f"Snapshotting {collection.name}...")
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=['documents', 'metadatas', 'embeddings'], limit=1000, offset=offset)
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        embeddings.extend(page['embeddings'])
+        offset += len(page['ids'])
+
+    print(f"Embedding {len(queries)} golden queries...")
+    query_embeddings = [get_embedding(q["query"], dimensionality=dimensionality) for q in queries]
+
+    records = {
+        "generation": collection.name,
+        "embedding_dim": dimensionality,
+        "frozen_at": datetime.now(timezone.utc).isoformat(),
+        "golden_digest": golden_digest(queries),
+        "ids": ids,
+        "documents": documents,
+        "metadatas": metadatas,
+        "queries": [q["query"] for q in queries],
+    }
+    np.savez_compressed(
+        FIXTURE_FILE,
+        embeddings=np.asarray(embeddings, dtype=np.float32),
+        query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+        records=np.array(json.dumps(records)),
+    )
+    print(f"Wrote {FIXTURE_FILE}: {len(ids)} chunks, {len(queries)} queries")
+
+
+def load_fixture():
+    fixture = np.load(FIXTURE_FILE, allow_pickle=False)
+    records = json.loads(str(fixture["records"]))
+    return records, fixture["embeddings"], fixture["query_embeddings"]
+
+
+class ExactBackend:
+    """Brute-force cosine search over the frozen vectors, filtered like the
+    Chroma where clause"""
+
+    def __init__(self, records, embeddings):
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self.corpus = normalize_rows(embeddings)
+        self.candidates = 0  # Chunks scored by the last search
+        self._subsets = {}
+
+    def _subset(self, version, include_resources):
+        key = (version, include_resources)
+        if key not in self._subsets:
+            rows = np.array([i for i, metadata in enumerate(self.metadatas)
+                             if matches_version(metadata, version, include_resources)], dtype=np.int64)
+            self._subsets[key] = (rows, self.corpus[rows])
+        return self._subsets[key]
+
+    def search(self, query, query_embedding, version, include_resources, k):
+        rows, corpus = self._subset(version, include_resources)
+        self.candidates = len(rows)
+        if len(rows) == 0:
+            return []
+        indices, scores = top_k(corpus, normalize_rows(query_embedding[None, :]), k)
+        return [{
+            'document': self.documents[rows[i]],
+            'metadata': resolve_version_metadata(self.metadatas[rows[i]], version),
+            'similarity_score': float(score)
+        } for i, score in zip(indices[0], scores[0])]
+
+
+class ChromaBackend:
+    """The production index type, loaded into an in-process ephemeral client"""
+
+    def __init__(self, records, embeddings):
+        import chromadb
+
+        client = chromadb.EphemeralClient()
+        self.collection = client.create_collection(
+            name=f"bench_{int(time.time())}",
+            metadata={"hnsw:space": "cosine"}
+        )
+        batch_size = 1000
+        for start in range(0, len(records["ids"]), batch_size):
+            end = start + batch_size
+            self.collection.add(
+                ids=records["ids"][start:end],
+                documents=records["documents"][start:end],
+                metadatas=records["metadatas"][start:end],
+                embeddings=embeddings[start:end].tolist()
+            )
+
+    def search(self, query, query_embedding, version, include_resources, k):
+        where_filter = build_where_filter(version, include_resources)
+        results = self.collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=k,
+            where=where_filter if where_filter else None,
+            include=['documents', 'metadatas', 'distances']
+        )
+        return [{
+            'document': document,
+            'metadata': resolve_version_metadata(metadata, version),
+            'similarity_score': 1 - distance
+        } for document, metadata, distance in zip(
+            results['documents'][0], results['metadatas'][0], results['distances'][0])]
+
+
+class RerankBackend:
+    """Exact over-fetch followed by the second-stage reranker"""
+
+    def __init__(self, records, embeddings):
+        self.exact = ExactBackend(records, embeddings)
+
+    def search(self, query, query_embedding, version, include_resources, k):
+        candidates = self.exact.search(query, query_embedding, version, include_resources,
+                                       max(k, RERANK_CANDIDATES))
+        reranked, _ = rerank_results(query, candidates, k, version=version)
+        return reranked
+
+
+class PagesBackend:
+    """Two-stage search: the PAGE_CANDIDATES pages closest to the query by
+    mean chunk vector, then exact search over only those pages' chunks"""
+
+    def __init__(self, records, embeddings):
+        self.exact = ExactBackend(records, embeddings)
+        self.pages = PageIndex.from_chunks(records["generation"], self.exact.corpus, records["metadatas"])
+        self.candidates = 0
+        self._visible = {}
+
+    def _visible_rows(self, version, include_resources):
+        key = (version, include_resources)
+        if key not in self._visible:
+            self._visible[key] = np.array([matches_version(metadata, version, include_resources)
+                                           for metadata in self.exact.metadatas], dtype=bool)
+        return self._visible[key]
+
+    def search(self, query, query_embedding, version, include_resources, k):
+        rows = self.pages.candidate_rows(query_embedding, PAGE_CANDIDATES, version, include_resources)
+        rows = rows[self._visible_rows(version, include_resources)[rows]]
+        self.candidates = len(rows)
+        if len(rows) == 0:
+            return []
+        indices, scores = top_k(self.exact.corpus[rows], normalize_rows(query_embedding[None, :]), k)
+        return [{
+            'document': self.exact.documents[rows[i]],
+            'metadata': resolve_version_metadata(self.exact.metadatas[rows[i]], version),
+            'similarity_score': float(score)
+        } for i, score in zip(indices[0], scores[0])]
+
+
+BACKEND_CLASSES = {"exact": ExactBackend, "chroma": ChromaBackend, "rerank": RerankBackend, "pages": PagesBackend}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def score_results(results, relevant, k):
+    """(reciprocal rank of the first relevant chunk, share of relevant pages
+    found in the top k, page keys of the top k)"""
+    pages = [page_key(r['metadata'].get('url', '')) for r in results[:k]]
+    reciprocal_rank = 0.0
+    for rank, page in enumerate(pages, start=1):
+        if page in relevant:
+            reciprocal_rank = 1.0 / rank
+            break
+    recall = len(set(pages) & set(relevant)) / len(relevant) if relevant else 0.0
+    return reciprocal_rank, recall, pages
+
+
+def run_backend(backend, queries, query_embeddings, k):
+    # Warm-up pass so lazily built filter subsets and index pages aren't timed
+    for golden, query_embedding in zip(queries, query_embeddings):
+        backend.search(golden["query"], query_embedding, golden["version"], golden["include_resources"], k)
+
+    latencies = []
+    per_query = []
+    candidates = []
+    start = time.perf_counter()
+    for repeat in range(REPEATS):
+        for golden, query_embedding in zip(queries, query_embeddings):
+            call_start = time.perf_counter()
+            results = backend.search(golden["query"], query_embedding, golden["version"],
+                                     golden["include_resources"], k)
+            latencies.append((time.perf_counter() - call_start) * 1000)
+            if repeat == 0:
+                reciprocal_rank, recall, pages = score_results(results, golden["relevant"], k)
+                per_query.append({
+                    "query": golden["query"],
+                    "reciprocal_rank": reciprocal_rank,
+                    "recall": recall,
+                    "distinct_pages": len(set(pages)),
+                    "top_pages": pages,
+                })
+                if hasattr(backend, "candidates"):
+                    candidates.append(backend.candidates)
+    elapsed = time.perf_counter() - start
+
+    return {
+        f"recall@{k}": statistics.mean(q["recall"] for q in per_query),
+        "mrr": statistics.mean(q["reciprocal_rank"] for q in per_query),
+        f"distinct_pages@{k}": statistics.mean(q["distinct_pages"] for q in per_query),
+        # Chunks scored per query; the HNSW index in Chroma doesn't report it
+        "candidates": statistics.mean(candidates) if candidates else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.mean(latencies),
+        },
+        "qps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "queries": per_query,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(k, report_path, backend_names):
+    queries = load_golden()
+    records, embeddings, query_embeddings = load_fixture()
+    if records["golden_digest"] != golden_digest(queries):
+        raise SystemExit(f"{GOLDEN_FILE} changed since {FIXTURE_FILE} was frozen, "
+                         "run `python bench_retrieval.py freeze` again")
+
+    print(f"Fixture: {records['generation']} ({len(records['ids'])} chunks, "
+          f"{records['embedding_dim']}-d), {len(queries)} golden queries, k={k}\n")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "k": k,
+        "fixture": {
+            "generation": records["generation"],
+            "frozen_at": records["frozen_at"],
+            "chunks": len(records["ids"]),
+            "embedding_dim": records["embedding_dim"],
+            "golden_digest": records["golden_digest"],
+        },
+        "backends": {},
+    }
+
+    print(f"{'backend':>8} {'recall@' + str(k):>10} {'MRR':>6} {'pages':>6} {'scored':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'QPS':>9}")
+    for name in backend_names:
+        try:
+            backend = BACKEND_CLASSES[name](records, embeddings)
+        except ImportError as e:
+            print(f"{name:>8} skipped: {e}")
+            continue
+        stats = run_backend(backend, queries, query_embeddings, k)
+        report["backends"][name] = stats
+        latency = stats["latency_ms"]
+        scored = f"{stats['candidates']:.0f}" if stats['candidates'] is not None else "-"
+        print(f"{name:>8} {stats[f'recall@{k}']:>10.3f} {stats['mrr']:>6.3f} {stats[f'distinct_pages@{k}']:>6.2f} "
+              f"{scored:>8} {latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} {stats['qps']:>9.1f}")
+
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "freeze":
+        freeze()
+    else:
+        k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+        report_path = sys.argv[2] if len(sys.argv) > 2 else "retrieval_report.json"
+        backend_names = sys.argv[3].split(",") if len(sys.argv) > 3 else BACKENDS
+        run(k, report_path, backend_names)
@@ -0,0 +1,100 @@
+import gzip
+import json
+import random
+import statistics
+import sys
+import time
+
+from serialization import brotli, compress, dumps, orjson, shape_results
+
+# Response size and serialization time for a /rawquery-cli style response
+# (n_results hits of ~8000 char chunks with metadata) and a /test style
+# 768-float embedding, before and after: FastAPI's default path
+# (jsonable_encoder + json.dumps) versus FastJSONResponse, and full results
+# versus include_documents=false and fields=[url, title, similarity_score].
+# No services are needed.
+#
+# Usage: python bench_serialization.py [n_results] [iterations]
+
+WORDS = ["vtgate", "vttablet", "keyspace", "shard", "reshard", "movetables", "vreplication", "the", "a",
+         "to", "of", "and", "tablet", "primary", "replica", "schema", "query", "workflow", "backup", "cell"]
+
+
+def make_rawquery_response(n_results):
+    rng = random.Random(42)
+    results = []
+    for i in range(n_results):
+        words = []
+        while sum(len(w) + 1 for w in words) < 8000:
+            words.append(rng.choice(WORDS))
+        results.append({
+            "document": " ".join(words),
+            "metadata": {
+                "title": f"Page {i}",
+                "url": f"https://vitess.io/docs/22.0/reference/page-{i}/",
+                "id_parent": str(1000 + i),
+                "version_or_commonresource": "v22.0 (Development)",
+                "versions": "v20.0|v21.0|v22.0 (Development)",
+                "page_key": f"/reference/page-{i}",
+                "chunk_index": "0",
+                "total_chunks": "1",
+                "content_hash": "%016x" % rng.getrandbits(64),
+            },
+            "similarity_score": rng.random(),
+        })
+    return {
+        "summary": " ".join(rng.choice(WORDS) for _ in range(300)),
+        "results": results,
+        "filter_used": {"in:v22.0 (Development)": True},
+        "rerank": None,
+        "context": None,
+        "cache": {"hit": False},
+        "degraded": False,
+        "degraded_reason": None,
+    }
+
+
+def default_render(content):
+    # What FastAPI does for a returned dict: jsonable_encoder, then Starlette's JSONResponse.render
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def time_ms(fn, content, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def report(name, content, iterations):
+    body = dumps(content)
+    sizes = [f"raw {len(body) / 1024:.1f} KiB", f"gzip {len(gzip.compress(body, 5)) / 1024:.1f} KiB"]
+    if brotli is not None:
+        sizes.append(f"br {len(compress(body, 'br')) / 1024:.1f} KiB")
+    before = time_ms(default_render, content, iterations)
+    after = time_ms(dumps, content, iterations)
+    gzip_ms = time_ms(lambda c: compress(dumps(c), "gzip"), content, iterations) - after
+    print(f"{name}")
+    print(f"  size: {', '.join(sizes)}")
+    print(f"  serialize: default {before:.3f} ms -> {'orjson' if orjson else 'json'} {after:.3f} ms "
+          f"({before / after:.1f}x), gzip adds {gzip_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    n_results = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    response = make_rawquery_response(n_results)
+    report(f"/rawquery-cli, {n_results} results", response, iterations)
+    report("/rawquery-cli, include_documents=false",
+           {**response, "results": shape_results(response["results"], include_documents=False)}, iterations)
+    report("/rawquery-cli, fields=[url, title, similarity_score]",
+           {**response, "results": shape_results(response["results"], fields=["url", "title", "similarity_score"])},
+           iterations)
+
+    rng = random.Random(7)
+    report("/test, 768-d embedding", {"embedding": [rng.uniform(-0.1, 0.1) for _ in range(768)]}, iterations)
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+import yaml
+
+# Memory and throughput of serve.py with 1..N workers: per-worker RSS split
+# into anonymous (private) and file-backed (mmap'd snapshot, shared) pages,
+# the summed PSS (each shared page counted once across workers), and
+# aggregate /query QPS under a closed loop of concurrent clients. Linux only
+# (reads /proc).
+#
+# Run against the Gemini stub so the embedding API is not the bottleneck:
+#   python stub_server.py &      # then STUB_EMBED_LATENCY_MS=0 for pure CPU scaling
+#   GEMINI_BASE_URL=http://localhost:8081 python bench_workers.py 1,2,4 20 64
+#
+# Usage: python bench_workers.py [worker counts] [seconds] [concurrency]
+
+PORT = 8765
+STARTUP_TIMEOUT = 300
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            return [int(child) for child in file.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def memory_kib(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                stats[key] = int(value.split()[0])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    stats["Pss"] = int(line.split()[1])
+    except FileNotFoundError:
+        stats["Pss"] = stats.get("VmRSS", 0)
+    return stats
+
+
+def worker_pids(server_pid):
+    # uvicorn's supervisor spawns one process per worker (plus a resource tracker)
+    pids = []
+    for pid in children(server_pid):
+        with open(f"/proc/{pid}/cmdline", "rb") as file:
+            if b"resource_tracker" not in file.read():
+                pids.append(pid)
+    return pids
+
+
+async def wait_ready(client, workers):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    ready = set()
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/local-index")
+            info = response.json()
+            if info["snapshot"] is not None:
+                ready.add(info["pid"])
+                if len(ready) >= workers:
+                    return True
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def drive(client, questions, seconds, concurrency):
+    completed = 0
+    errors = 0
+    stop = time.monotonic() + seconds
+
+    async def loop():
+        nonlocal completed, errors
+        while time.monotonic() < stop:
+            response = await client.post("/query", json={
+                "query": random.choice(questions), "include_documents": False
+            })
+            if response.status_code == 200:
+                completed += 1
+            else:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*[loop() for _ in range(concurrency)])
+    return completed / (time.monotonic() - start), errors
+
+
+async def measure(workers, seconds, concurrency, questions):
+    env = dict(os.environ, RATE_LIMIT_PER_MINUTE="0")
+    server = subprocess.Popen([sys.executable, "serve.py", str(workers), str(PORT)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=30.0,
+                                     limits=httpx.Limits(max_connections=concurrency)) as client:
+            if not await wait_ready(client, workers):
+                raise SystemExit(f"{workers} workers did not come up with a snapshot mapped")
+            # Warm the page cache and per-worker masks before measuring
+            await drive(client, questions, 2, concurrency)
+            qps, errors = await drive(client, questions, seconds, concurrency)
+        memory = [memory_kib(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    return qps, errors, memory
+
+
+if __name__ == "__main__":
+    worker_counts = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 2, 4]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    with open("golden_queries.yaml", "r", encoding="utf-8") as file:
+        questions = [entry["query"] for entry in yaml.safe_load(file)["queries"]]
+
+    print(f"{'workers':>7} {'QPS':>8} {'errors':>7} {'RSS/worker MiB':>15} {'anon MiB':>9} "
+          f"{'file MiB':>9} {'sum PSS MiB':>12}")
+    baseline = None
+    for workers in worker_counts:
+        qps, errors, memory = asyncio.run(measure(workers, seconds, concurrency, questions))
+        baseline = baseline or qps
+        count = max(1, len(memory))
+        rss = sum(m["VmRSS"] for m in memory) / count / 1024
+        anon = sum(m.get("RssAnon", 0) for m in memory) / count / 1024
+        file_backed = sum(m.get("RssFile", 0) for m in memory) / count / 1024
+        pss = sum(m["Pss"] for m in memory) / 1024
+        print(f"{workers:>7} {qps:>8.1f} {errors:>7} {rss:>15.1f} {anon:>9.1f} {file_backed:>9.1f} {pss:>12.1f}"
+              f"   ({qps / baseline:.2f}x)")
@@ -0,0 +1,110 @@
+import math
+import os
+import threading
+import time
+
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+# Per-upstream circuit breakers. After CIRCUIT_FAILURE_THRESHOLD consecutive
+# failed or slow calls the circuit opens and calls fail immediately with
+# CircuitOpenError for CIRCUIT_RESET_SECONDS; then a single trial call is let
+# through (half-open) and its outcome closes or re-opens the circuit.
+# Calls slower than the operation's slow-call limit count as failures, so a
+# hanging upstream trips the breaker just like an erroring one.
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Seconds after which a successful call still counts as a failure
+SLOW_CALL_SECONDS = {
+    "embed_content": float(os.getenv("SLOW_EMBED_SECONDS", "3")),
+    "embed_content_ingest": float(os.getenv("SLOW_INGEST_EMBED_SECONDS", "30")),  # Batches of chunks
+    "generate_content": float(os.getenv("SLOW_GENERATE_SECONDS", "30")),
+}
+DEFAULT_SLOW_CALL_SECONDS = 10.0
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, upstream, operation, retry_after):
+        super().__init__(f"{upstream} {operation} circuit open")
+        self.reason = f"{upstream} circuit open"
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, upstream, operation, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds=CIRCUIT_RESET_SECONDS, slow_call_seconds=None):
+        self.upstream = upstream
+        self.operation = operation
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds or SLOW_CALL_SECONDS.get(operation, DEFAULT_SLOW_CALL_SECONDS)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"Circuit {self.upstream} {self.operation}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], upstream=self.upstream, operation=self.operation)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    CIRCUIT_REJECTED.inc(upstream=self.upstream, operation=self.operation)
+                    raise CircuitOpenError(self.upstream, self.operation, max(1, math.ceil(remaining)))
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_in_flight:
+                    CIRCUIT_REJECTED.inc(upstream=self.upstream, operation=self.operation)
+                    raise CircuitOpenError(self.upstream, self.operation, 1)
+                self._trial_in_flight = True
+
+    def record(self, ok, elapsed):
+        with self._lock:
+            self._trial_in_flight = False
+            if ok and elapsed <= self.slow_call_seconds:
+                self.failures = 0
+                self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def is_open(self):
+        return self.state == OPEN
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "slow_call_seconds": self.slow_call_seconds,
+        }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream, operation):
+    key = (upstream, operation)
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(upstream, operation)
+        return _breakers[key]
+
+
+def breaker_stats():
+    with _breakers_lock:
+        return {f"{upstream}:{operation}": breaker.stats() for (upstream, operation), breaker in _breakers.items()}
@@ -0,0 +1,57 @@
+import importlib
+import os
+
+import chromadb
+from google import genai
+from google.genai.types import HttpOptions
+
+# Factories for the upstream clients used by main.py. By default they build
+# the production clients from the environment; for offline runs and load
+# tests they can be pointed at local stand-ins:
+#
+#   GEMINI_BASE_URL=http://localhost:8081   Gemini SDK talks to stub_server.py
+#   CHROMA_MODE=ephemeral|persistent|http   in-process Chroma instead of the server
+#   GEMINI_CLIENT_FACTORY=module:callable   replace a factory entirely
+#   CHROMA_CLIENT_FACTORY=module:callable
+#
+# The environment is read when a client is made, after main.py has loaded .env.
+
+
+def _load_factory(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def default_gemini_client():
+    # Per-request HTTP timeout, so a hung call fails instead of holding a worker thread
+    timeout_ms = int(os.getenv("GEMINI_TIMEOUT_MS", "30000"))
+    base_url = os.getenv("GEMINI_BASE_URL")
+    if base_url:
+        # The stub server doesn't check keys, so none is required
+        return genai.Client(
+            api_key=os.getenv("GEMINI_API_KEY", "stub"),
+            http_options=HttpOptions(base_url=base_url, timeout=timeout_ms)
+        )
+    return genai.Client(api_key=os.environ["GEMINI_API_KEY"], http_options=HttpOptions(timeout=timeout_ms))
+
+
+def default_chroma_client():
+    mode = os.getenv("CHROMA_MODE", "http")
+    if mode == "ephemeral":
+        return chromadb.EphemeralClient()
+    if mode == "persistent":
+        return chromadb.PersistentClient(path=os.getenv("CHROMA_PERSIST_PATH", "vitess_chroma_db"))
+    return chromadb.HttpClient(
+        host=os.getenv("CHROMA_SERVER_HOST"),
+        port=int(os.getenv("CHROMA_SERVER_PORT", "8000"))
+    )
+
+
+def make_gemini_client():
+    spec = os.getenv("GEMINI_CLIENT_FACTORY")
+    return _load_factory(spec)() if spec else default_gemini_client()
+
+
+def make_chroma_client():
+    spec = os.getenv("CHROMA_CLIENT_FACTORY")
+    return _load_factory(spec)() if spec else default_chroma_client()
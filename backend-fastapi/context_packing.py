@@ -0,0 +1,187 @@
+import os
+import re
+import zlib
+
+# Builds the documentation snippet block for the summarization prompt.
+# Search hits often contain the same page from several versions, or
+# neighbouring chunks of one page, so before formatting we
+#   1. drop near-duplicate and overlapping chunks (word shingle similarity),
+#   2. merge adjacent chunk_index chunks of the same id_parent,
+#   3. fit what is left into a token budget, in ranking order.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 5
+MIN_TRUNCATED_TOKENS = 200
+
+_HEADING_RE = re.compile(r"^#{1,6} \S")
+
+
+def estimate_tokens(text):
+    # Same 4 characters per token approximation used by the scraper
+    return (len(text) + 3) // 4
+
+
+def format_snippet(index, result):
+    return f"""
+Document {index + 1}: {result['metadata']['title']}
+Content: {result['document']}
+URL: {result['metadata'].get('section_url') or result['metadata']['url']}
+Version: {result['metadata']['version_or_commonresource']}
+Similarity Score: {(result['similarity_score'] * 100):.1f}%
+"""
+
+
+def format_snippets(formatted_results):
+    """Format search results into the snippet block used in summarization prompts"""
+    return "".join(format_snippet(index, result) for index, result in enumerate(formatted_results))
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = text.lower().split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode('utf-8'))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def _is_duplicate(candidate, kept):
+    """True if the candidate's shingles are mostly covered by a kept chunk.
+    Uses containment rather than Jaccard so a short chunk that overlaps a
+    longer one is also caught."""
+    smaller = min(len(candidate), len(kept))
+    if smaller == 0:
+        return False
+    return len(candidate & kept) / smaller >= DUPLICATE_THRESHOLD
+
+
+def _chunk_index(result):
+    try:
+        return int(result['metadata'].get('chunk_index', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def dedupe_results(results):
+    kept = []
+    kept_shingles = []
+    for result in results:
+        result_shingles = shingles(result['document'])
+        if any(_is_duplicate(result_shingles, other) for other in kept_shingles):
+            continue
+        kept.append(result)
+        kept_shingles.append(result_shingles)
+    return kept
+
+
+def merge_adjacent_chunks(results):
+    """Merge runs of consecutive chunks from the same page into one snippet.
+    The merged snippet takes the rank of its best chunk."""
+    groups = {}
+    for rank, result in enumerate(results):
+        id_parent = result['metadata'].get('id_parent')
+        groups.setdefault(id_parent, []).append((rank, result))
+
+    merged = []
+    for id_parent, members in groups.items():
+        if id_parent is None:
+            merged.extend(members)
+            continue
+        members.sort(key=lambda member: _chunk_index(member[1]))
+        run = [members[0]]
+        for member in members[1:]:
+            if _chunk_index(member[1]) == _chunk_index(run[-1][1]) + 1:
+                run.append(member)
+            else:
+                merged.append(_merge_run(run))
+                run = [member]
+        merged.append(_merge_run(run))
+
+    merged.sort(key=lambda member: member[0])
+    return [result for _, result in merged]
+
+
+def _last_heading(markdown):
+    """The last Markdown heading line outside code blocks, or None"""
+    heading, in_fence = None, False
+    for line in markdown.split("\n"):
+        if line.startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING_RE.match(line):
+            heading = line
+    return heading
+
+
+def join_chunks(documents):
+    """Join consecutive chunks of a page as Markdown blocks. A chunk that
+    continues the section the previous one ended in starts by repeating its
+    heading (see split_markdown_sections); that copy is dropped."""
+    text = documents[0]
+    for document in documents[1:]:
+        first_line, _, rest = document.partition("\n")
+        if _HEADING_RE.match(first_line) and first_line == _last_heading(text):
+            document = rest.lstrip("\n")
+        text = text.rstrip("\n") + "\n\n" + document
+    return text
+
+
+def _merge_run(run):
+    if len(run) == 1:
+        return run[0]
+    best_rank = min(rank for rank, _ in run)
+    first = run[0][1]
+    metadata = dict(first['metadata'])
+    metadata['chunk_index'] = f"{_chunk_index(first)}-{_chunk_index(run[-1][1])}"
+    merged = dict(first)
+    merged['document'] = join_chunks([result['document'] for _, result in run])
+    merged['metadata'] = metadata
+    merged['similarity_score'] = max(result['similarity_score'] for _, result in run)
+    return best_rank, merged
+
+
+def fit_to_budget(results, token_budget):
+    """Keep snippets in rank order until the budget is spent, truncating the
+    last one at a word boundary if enough room is left for it to be useful."""
+    packed = []
+    used = 0
+    for result in results:
+        tokens = estimate_tokens(format_snippet(len(packed), result))
+        if used + tokens <= token_budget:
+            packed.append(result)
+            used += tokens
+            continue
+
+        remaining = token_budget - used
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            overhead = tokens - estimate_tokens(result['document'])
+            max_chars = max(0, (remaining - overhead) * 4 - 3)
+            document = result['document'][:max_chars]
+            if ' ' in document:
+                document = document[:document.rfind(' ')]
+            truncated = dict(result)
+            truncated['document'] = document + " ..."
+            packed.append(truncated)
+        break
+    return packed
+
+
+def pack_context(results, token_budget=None):
+    """Return (snippet block for the prompt, packing stats)"""
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+
+    tokens_before = estimate_tokens(format_snippets(results))
+    deduped = dedupe_results(results)
+    merged = merge_adjacent_chunks(deduped)
+    packed = fit_to_budget(merged, token_budget)
+    formatted_content = format_snippets(packed)
+
+    stats = {
+        "snippets_before": len(results),
+        "duplicates_removed": len(results) - len(deduped),
+        "chunks_merged": len(deduped) - len(merged),
+        "snippets_after": len(packed),
+        "token_budget": token_budget,
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(formatted_content),
+    }
+    return formatted_content, stats
@@ -0,0 +1,217 @@
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Persistent crawl frontier in a local SQLite database (WAL mode). Every
+# discovered page is a row that goes pending -> in_progress -> done, or back
+# to pending with its attempt count bumped when a fetch fails, until it is
+# marked failed after CRAWL_MAX_ATTEMPTS. A restarted crawl carries on from
+# the rows that aren't done, without re-reading vitess_docs.yaml, and any
+# number of crawler processes can claim pages from the same database.
+#
+# Claims are leases: a page held by a process that died is handed out again
+# once its lease runs out, or right away when the dead process was on this
+# host; every claim checks for both. Either way the attempt counts, so a
+# page that keeps killing its crawler ends up failed instead of being
+# handed out forever. Completing a page runs the caller's save first and
+# then marks the row done in a short transaction of its own, so the write
+# lock is never held while output is written; savers serialize their own
+# writes (see rebuild_docs.DocsYamlAppender) and must tolerate a page saved
+# twice, which happens when a crawler dies between the two steps.
+#
+# Usage: python crawl_queue.py [stats|retry-failed|requeue] [db]
+
+CRAWL_DB = os.getenv("CRAWL_DB", "crawl_queue.sqlite3")
+CRAWL_MAX_ATTEMPTS = int(os.getenv("CRAWL_MAX_ATTEMPTS", "3"))
+CRAWL_LEASE_SECONDS = float(os.getenv("CRAWL_LEASE_SECONDS", "300"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    section_path TEXT NOT NULL,
+    version TEXT NOT NULL,
+    is_archived INTEGER NOT NULL DEFAULT 0,
+    source TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    lease_until REAL,
+    last_error TEXT,
+    id_parent INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_status ON pages (status, url);
+"""
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class CrawlQueue:
+    def __init__(self, path=CRAWL_DB, max_attempts=CRAWL_MAX_ATTEMPTS, lease_seconds=CRAWL_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()  # One connection per thread
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA busy_timeout=30000")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent claimers
+        # queue on busy_timeout instead of failing on lock upgrades
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def add(self, entries):
+        """Queue frontier entries; URLs already known keep their state. Returns how many were new."""
+        now = time.time()
+        with self._write() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO pages (url, section_path, version, is_archived, source, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(entry["url"], json.dumps(entry["section_path"]), entry["version"], int(entry["is_archived"]),
+                  entry.get("source"), now) for entry in entries]
+            )
+            return db.total_changes - before
+
+    def mark_done(self, urls):
+        """Record pages finished outside the queue, e.g. by a crawl from before it existed"""
+        with self._write() as db:
+            db.executemany("UPDATE pages SET status = 'done', updated_at = ? WHERE url = ?",
+                           [(time.time(), url) for url in urls])
+
+    def _release_stale(self, db, now):
+        """Put in_progress pages whose lease ran out, or whose owner on this
+        host is gone, back to pending, or to failed once out of attempts.
+        Returns how many were released."""
+        host = socket.gethostname()
+        stale = []
+        for row in db.execute("SELECT url, claimed_by, lease_until FROM pages WHERE status = 'in_progress'").fetchall():
+            claimed_host, _, rest = (row["claimed_by"] or "").partition(":")
+            pid = rest.split(":")[0]
+            dead = claimed_host == host and pid.isdigit() and not _pid_alive(int(pid))
+            if dead or (row["lease_until"] or 0) < now:
+                stale.append((row["url"], "crawler died" if dead else "lease expired"))
+        db.executemany(
+            "UPDATE pages SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "claimed_by = NULL, lease_until = NULL, last_error = ?, updated_at = ? WHERE url = ?",
+            [(self.max_attempts, error, now, url) for url, error in stale]
+        )
+        return len(stale)
+
+    def claim(self):
+        """Lease the next pending page to the calling thread, or None when nothing is left to hand out"""
+        now = time.time()
+        with self._write() as db:
+            self._release_stale(db, now)
+            row = db.execute("SELECT * FROM pages WHERE status = 'pending' ORDER BY url LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE pages SET status = 'in_progress', claimed_by = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE url = ?", (worker_id(), now + self.lease_seconds, now, row["url"])
+            )
+        return {
+            "url": row["url"],
+            "section_path": json.loads(row["section_path"]),
+            "version": row["version"],
+            "is_archived": bool(row["is_archived"]),
+            "source": row["source"],
+            "attempts": row["attempts"] + 1,
+        }
+
+    def complete(self, entry, save):
+        """Run save(), then mark the page done"""
+        result = save()
+        with self._write() as db:
+            db.execute(
+                "UPDATE pages SET status = 'done', claimed_by = NULL, lease_until = NULL, last_error = NULL, "
+                "id_parent = ?, updated_at = ? WHERE url = ?",
+                (result if isinstance(result, int) else None, time.time(), entry["url"])
+            )
+        return result
+
+    def fail(self, entry, error):
+        """Back to pending for another attempt, or failed once out of attempts"""
+        with self._write() as db:
+            db.execute(
+                "UPDATE pages SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "claimed_by = NULL, lease_until = NULL, last_error = ?, updated_at = ? WHERE url = ?",
+                (self.max_attempts, str(error)[:1000], time.time(), entry["url"])
+            )
+
+    def requeue_orphans(self):
+        """Release pages claimed by processes on this host that are no longer
+        running, or whose lease ran out; claim() does the same as it goes"""
+        with self._write() as db:
+            return self._release_stale(db, time.time())
+
+    def retry_failed(self):
+        with self._write() as db:
+            return db.execute(
+                "UPDATE pages SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+                (time.time(),)
+            ).rowcount
+
+    def stats(self):
+        counts = {"pending": 0, "in_progress": 0, "done": 0, "failed": 0}
+        for row in self._connection().execute("SELECT status, COUNT(*) AS n FROM pages GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return counts
+
+    def failures(self, limit=20):
+        rows = self._connection().execute(
+            "SELECT url, attempts, last_error FROM pages WHERE status = 'failed' ORDER BY updated_at DESC LIMIT ?",
+            (limit,)
+        )
+        return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    crawl_queue = CrawlQueue(sys.argv[2] if len(sys.argv) > 2 else CRAWL_DB)
+    if command == "retry-failed":
+        print(f"Requeued {crawl_queue.retry_failed()} failed pages")
+    elif command == "requeue":
+        print(f"Released {crawl_queue.requeue_orphans()} pages held by dead crawler processes or expired leases")
+    print(json.dumps(crawl_queue.stats()))
+    for failure in crawl_queue.failures():
+        print(f"  failed after {failure['attempts']} attempts: {failure['url']}: {failure['last_error']}")
@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+from metrics import EMBED_BATCH_SIZE
+
+# Collects query texts from concurrent requests for a short window (or until
+# a batch is full) and embeds them with a single upstream call, then fans the
+# vectors back out to the waiting requests.
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_batch_fn, window_ms=EMBED_BATCH_WINDOW_MS, max_batch_size=EMBED_BATCH_MAX_SIZE):
+        """embed_batch_fn(texts, title, dimensionality) is a blocking call
+        returning one vector per text"""
+        self.embed_batch_fn = embed_batch_fn
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._pending = {}  # (title, dimensionality) -> [(text, future)]
+        self._timers = {}   # (title, dimensionality) -> TimerHandle for the window flush
+        self._tasks = set()  # Flushes in progress; the loop only holds weak references to tasks
+
+    async def embed(self, text, title="Vitess Documentation", dimensionality=768):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Only texts with the same embedding config can share an upstream call
+        key = (title, dimensionality)
+        batch = self._pending.setdefault(key, [])
+        batch.append((text, future))
+
+        if len(batch) >= self.max_batch_size:
+            self._schedule_flush(key)
+        elif len(batch) == 1:
+            # First text of a new batch opens the collection window
+            self._timers[key] = loop.call_later(self.window_ms / 1000.0, self._schedule_flush, key)
+        return await future
+
+    def _schedule_flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._flush(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key, batch):
+        title, dimensionality = key
+        texts = [text for text, _ in batch]
+        EMBED_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = await asyncio.to_thread(self.embed_batch_fn, texts, title, dimensionality)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
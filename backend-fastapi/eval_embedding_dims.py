@@ -0,0 +1,114 @@
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from vectors import normalize_rows, truncate_dims, to_storage_dtype, top_k
+
+# Compare reduced-dimensionality / float16 embeddings against the 768-d
+# float32 baseline: recall@k of the exact top-k, vector memory and brute
+# force search latency per query.
+#
+# The corpus vectors come from the active generation (which must be 768-d)
+# and the queries are embedded once with the API; both are cached in
+# embedding_eval_cache.npz so later runs are fully offline. text-embedding-004
+# is Matryoshka-trained, so truncating a 768-d vector and renormalizing gives
+# the same direction as requesting the smaller output_dimensionality.
+#
+# Usage: python eval_embedding_dims.py [k] [queries.txt]
+
+CACHE_FILE = "embedding_eval_cache.npz"
+DIMS = [768, 512, 384, 256, 128]
+DTYPES = ["float32", "float16"]
+
+DEFAULT_QUERIES = [
+    "How do I move tables from one keyspace to another?",
+    "How do I reshard a keyspace?",
+    "What is vtgate?",
+    "How do I take a backup of a tablet?",
+    "How does online DDL work?",
+    "What flags does vtctldclient MoveTables create accept?",
+    "How do I enable query consolidation?",
+    "What is a cell in Vitess topology?",
+    "How do I configure a vindex for sharding?",
+    "How do I upgrade Vitess to a new version?",
+    "How does VReplication work?",
+    "What is the difference between primary and replica tablets?",
+    "How do I monitor Vitess with Prometheus?",
+    "How do I run Vitess on Kubernetes with the operator?",
+    "What is a sequence table?",
+]
+
+
+def load_or_fetch(queries):
+    if os.path.exists(CACHE_FILE):
+        cached = np.load(CACHE_FILE)
+        print(f"Loaded cached corpus and query vectors from {CACHE_FILE}")
+        return cached["corpus"], cached["queries"]
+
+    from main import generation_alias, get_embedding
+
+    collection = generation_alias.active_collection()
+    if collection is None:
+        raise SystemExit("No active generation to evaluate")
+    if int((collection.metadata or {}).get("embedding_dim", 768)) != 768:
+        raise SystemExit(f"Active generation {collection.name} is not 768-d, the baseline needs full vectors")
+
+    print(f"Fetching vectors from {collection.name}...")
+    corpus = []
+    offset = 0
+    while True:
+        page = collection.get(include=['embeddings'], limit=1000, offset=offset)
+        if page['embeddings'] is None or len(page['embeddings']) == 0:
+            break
+        corpus.extend(page['embeddings'])
+        offset += len(page['embeddings'])
+
+    print(f"Embedding {len(queries)} queries...")
+    query_vectors = [get_embedding(query) for query in queries]
+
+    corpus = np.asarray(corpus, dtype=np.float32)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    np.savez(CACHE_FILE, corpus=corpus, queries=query_vectors)
+    return corpus, query_vectors
+
+
+def search_latency_ms(corpus, queries, k, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            top_k(corpus, query[None, :], k)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+if __name__ == "__main__":
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r', encoding='utf-8') as file:
+            queries = [line.strip() for line in file if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+
+    corpus, query_vectors = load_or_fetch(queries)
+    print(f"Corpus: {corpus.shape[0]} vectors, {query_vectors.shape[0]} queries, k={k}\n")
+
+    baseline_ids, _ = top_k(normalize_rows(corpus), normalize_rows(query_vectors), k)
+    baseline_sets = [set(row) for row in baseline_ids]
+
+    print(f"{'config':>14} {'recall@' + str(k):>10} {'memory MiB':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    for dim in DIMS:
+        reduced_queries = truncate_dims(query_vectors, dim)
+        for dtype in DTYPES:
+            reduced_corpus = to_storage_dtype(truncate_dims(corpus, dim), dtype)
+            ids, _ = top_k(reduced_corpus, reduced_queries, k)
+            recall = statistics.mean(
+                len(set(row) & expected) / len(expected) for row, expected in zip(ids, baseline_sets)
+            )
+            p50, p95 = search_latency_ms(reduced_corpus, reduced_queries, k)
+            label = f"{dim}-d {dtype}"
+            print(f"{label:>14} {recall:>10.3f} {reduced_corpus.nbytes / 2**20:>11.2f} {p50:>8.3f} {p95:>8.3f}")
@@ -0,0 +1,129 @@
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from preprocess import matches_version, resolve_version_metadata
+from rerank import tokenize
+
+# Local stand-ins for the query path while an upstream is unavailable:
+# recently computed query embeddings, and a BM25 index over the chunk text
+# of the active generation.
+
+RECENT_EMBEDDINGS_MAX = int(os.getenv("RECENT_EMBEDDINGS_MAX", "2000"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class RecentEmbeddingCache:
+    """LRU of query text -> embedding, filled by every successful query embedding"""
+
+    def __init__(self, max_entries=RECENT_EMBEDDINGS_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, dimensionality):
+        key = (normalize_query(text), dimensionality)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, text, dimensionality, embedding):
+        key = (normalize_query(text), dimensionality)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LexicalIndex:
+    """BM25 over chunk documents, with the same version filtering and result
+    format as the vector path. Postings are kept as flat arrays (CSR layout)
+    so an index can also be served straight from a mmap'd snapshot, see
+    snapshot.py. document(i) and metadata(i) fetch a chunk's text and
+    metadata."""
+
+    def __init__(self, generation, terms, term_offsets, posting_docs, posting_tfs, doc_lengths, document, metadata):
+        self.generation = generation
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.posting_docs = posting_docs
+        self.posting_tfs = posting_tfs
+        self.doc_lengths = doc_lengths
+        self.document = document
+        self.metadata = metadata
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def from_documents(cls, generation, documents, metadatas):
+        postings = {}  # term -> [(doc index, term frequency)]
+        doc_lengths = []
+        for i, document in enumerate(documents):
+            # Titles are short and precise, so they are indexed along with the text
+            terms = tokenize(f"{metadatas[i].get('title', '')} {document}")
+            doc_lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((i, count))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+        posting_docs = np.fromiter((doc for term in terms for doc, _ in postings[term]),
+                                   dtype=np.int32, count=int(term_offsets[-1]))
+        posting_tfs = np.fromiter((min(tf, 65535) for term in terms for _, tf in postings[term]),
+                                  dtype=np.uint16, count=int(term_offsets[-1]))
+        return cls(generation, terms, term_offsets, posting_docs, posting_tfs,
+                   np.asarray(doc_lengths, dtype=np.int32), documents.__getitem__, metadatas.__getitem__)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def search(self, query, n_results, version=None, include_resources=True, allowed=None):
+        """allowed is an optional boolean row mask for the version filter;
+        without it each candidate's metadata is checked"""
+        total = len(self.doc_lengths)
+        scores = np.zeros(total, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.posting_docs[start:end]
+            tfs = self.posting_tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.avg_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+        if allowed is not None:
+            scores[~allowed] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        results = []
+        best = float(scores[candidates[0]]) if len(candidates) else 1.0
+        for i in candidates:
+            metadata = self.metadata(i)
+            if allowed is None and not matches_version(metadata, version, include_resources):
+                continue
+            results.append({
+                'document': self.document(i),
+                'metadata': resolve_version_metadata(metadata, version),
+                # BM25 scores aren't cosine similarities; scale to 0-1 relative to the best hit
+                'similarity_score': float(scores[i]) / best
+            })
+            if len(results) >= n_results:
+                break
+        return results
@@ -0,0 +1,198 @@
+import contextlib
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# A small static copy of the vitess.io docs layout for exercising the
+# scraper offline: a sitemap index, per-version sidebars in div.docs-menu
+# (with collapse toggles, nested lists and span.navlist-tile titles) and
+# article.docs-content pages with headings, code blocks and tables. Some
+# pages are only in the sitemap and some sitemap entries are outside /docs/,
+# like on the real site. Pages also pull in the kind of subresources a
+# browser spends its time on: a blocking script, stylesheet, web font,
+# images and a slow third-party analytics script.
+#
+# Usage: python fixture_site.py [port] [latency_ms] [analytics_ms]
+
+# path -> (title, listed in the sidebar)
+PAGES = {
+    "docs/": ("Documentation", True),
+    "docs/22.0/": ("v22.0 (Development)", True),
+    "docs/22.0/overview/": ("Overview", True),
+    "docs/22.0/overview/architecture/": ("Architecture", True),
+    "docs/22.0/reference/": ("Reference", True),
+    "docs/22.0/reference/features/": ("Features", True),
+    "docs/22.0/reference/features/mysql-replication/": ("MySQL Replication", True),
+    "docs/22.0/reference/programs/vtgate/": ("vtgate", False),
+    "docs/21.0/": ("v21.0 (Stable)", True),
+    "docs/21.0/overview/": ("Overview", True),
+    "docs/21.0/reference/": ("Reference", True),
+    "docs/21.0/reference/features/mysql-replication/": ("MySQL Replication", True),
+    "docs/21.0/reference/programs/vtgate/": ("vtgate", False),
+    "docs/archive/": ("Archives", True),
+    "docs/archive/13.0/": ("v13.0", True),
+    "docs/archive/13.0/reference/features/mysql-replication/": ("MySQL Replication", True),
+    "docs/troubleshoot/": ("Troubleshoot", True),
+    "docs/faq/": ("FAQ", True),
+    "docs/faq/operating-vitess/": ("Operating Vitess", False),
+}
+NON_DOCS_PAGES = ["blog/2024-01-01-release/", "community/"]
+
+
+def docs_pages():
+    return list(PAGES)
+
+
+def render_sidebar(current_path):
+    """All top-level categories, plus the whole tree of current_path's category"""
+    parts = current_path.strip("/").split("/")
+    category = "/".join(parts[:2]) + "/" if len(parts) > 1 else None
+    html = ['<div class="docs-sidebar"><div class="docs-menu">']
+    open_depth = 0
+    for path, (title, listed) in PAGES.items():
+        depth = path.count("/") - 1
+        if not listed or depth == 0 or (depth > 1 and not (category and path.startswith(category))):
+            continue
+        if depth > open_depth:
+            while open_depth < depth:
+                html.append('<ul class="docs-navlist">' if open_depth == 0 else "<ul>")
+                open_depth += 1
+        else:
+            html.append("</li>")
+            while open_depth > depth:
+                html.append("</ul></li>")
+                open_depth -= 1
+        active = ' class="active expanded"' if path == current_path else ""
+        html.append(f'<li{active}><button class="collapse-toggle"></button>'
+                    f'<a href="/{path}"><span class="navlist-tile">{title}</span></a>')
+    html.append("</li>")
+    while open_depth > 1:
+        html.append("</ul></li>")
+        open_depth -= 1
+    html.append("</ul></div></div>")
+    return "".join(html)
+
+
+def render_page(path, title):
+    slug = path.strip("/").split("/")[-1]
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title} | Vitess</title>
+<script src="/js/app.js"></script><link rel="stylesheet" href="/css/app.css">
+<link rel="preload" href="/fonts/inter.woff2" as="font" type="font/woff2" crossorigin>
+<script async src="/analytics/gtag.js"></script></head>
+<body>
+<nav class="navbar"><a href="/">Vitess</a> <a href="/blog/">Blog</a></nav>
+{render_sidebar(path)}
+<article class="docs-content">
+<h1>{title}</h1>
+<p>This page describes <strong>{title}</strong> in the Vitess documentation fixture ({slug}).</p>
+<h2 id="overview">Overview</h2>
+<p>The <code>{slug}</code> page covers keyspaces, shards and <a href="/docs/faq/">frequently asked questions</a>.</p>
+<ul><li>First point about {slug}</li><li>Second point with <em>emphasis</em></li></ul>
+<h2 id="configuration">Configuration</h2>
+<pre><code class="language-sh">vtctldclient --server localhost:15999 GetKeyspaces
+# {slug}
+</code></pre>
+<table><thead><tr><th>Flag</th><th>Default</th></tr></thead>
+<tbody><tr><td><code>--{slug}-timeout</code></td><td>30s</td></tr></tbody></table>
+<p><img src="/images/architecture.png" alt="Architecture"> <img src="/images/{slug}.png" alt="{title}"></p>
+<h3 id="advanced">Advanced</h3>
+<p>More details about {slug}.</p>
+</article>
+<div class="docs-navigation"><a href="/docs/">&lt; Home</a></div>
+<footer>footer</footer>
+</body></html>
+"""
+
+
+def render_sitemaps(base_url):
+    def urlset(paths):
+        entries = "".join(f"<url><loc>{base_url}/{path}</loc></url>" for path in paths)
+        return ('<?xml version="1.0" encoding="utf-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>')
+
+    index = ('<?xml version="1.0" encoding="utf-8"?>'
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             f'<sitemap><loc>{base_url}/sitemap-docs.xml</loc></sitemap>'
+             f'<sitemap><loc>{base_url}/sitemap-site.xml</loc></sitemap>'
+             '</sitemapindex>')
+    return {
+        "sitemap.xml": index,
+        "sitemap-docs.xml": urlset(docs_pages()),
+        "sitemap-site.xml": urlset(NON_DOCS_PAGES),
+    }
+
+
+def build_fixture_site(directory, base_url):
+    pages = {path: render_page(path, title) for path, (title, _) in PAGES.items()}
+    pages.update({path: render_page(path, path.strip("/").split("/")[-1]) for path in NON_DOCS_PAGES})
+    for path, html in pages.items():
+        os.makedirs(os.path.join(directory, path), exist_ok=True)
+        with open(os.path.join(directory, path, "index.html"), "w", encoding="utf-8") as file:
+            file.write(html)
+    for name, xml in render_sitemaps(base_url).items():
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as file:
+            file.write(xml)
+    assets = {
+        "js/app.js": b"document.documentElement.dataset.ready = '1';\n",
+        "css/app.css": b"@font-face { font-family: Inter; src: url(/fonts/inter.woff2); }\nbody { font-family: Inter; }\n",
+        "fonts/inter.woff2": os.urandom(150 * 1024),
+        "analytics/gtag.js": b"window.dataLayer = [];\n",
+        "images/architecture.png": os.urandom(400 * 1024),
+    }
+    for path in PAGES:
+        assets[f"images/{path.strip('/').split('/')[-1]}.png"] = os.urandom(200 * 1024)
+    for name, body in assets.items():
+        os.makedirs(os.path.join(directory, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(directory, name), "wb") as file:
+            file.write(body)
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    latency = 0.0  # Seconds added to every response, to stand in for the network
+    analytics_latency = 0.0  # Extra seconds for /analytics/, a slow third party
+
+    def do_GET(self):
+        delay = self.latency + (self.analytics_latency if self.path.startswith("/analytics/") else 0.0)
+        if delay:
+            time.sleep(delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_fixture_site(port=0, latency_ms=0, analytics_ms=0):
+    """Serve a freshly built fixture site; yields its base URL"""
+    with tempfile.TemporaryDirectory() as directory:
+        handler = type("Handler", (FixtureHandler,), {
+            "latency": latency_ms / 1000, "analytics_latency": analytics_ms / 1000
+        })
+        server = ThreadingHTTPServer(("127.0.0.1", port), functools.partial(handler, directory=directory))
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        build_fixture_site(directory, base_url)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield base_url
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    analytics_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    with serve_fixture_site(port, latency_ms, analytics_ms) as base_url:
+        print(f"Fixture site at {base_url}/docs/ (sitemap {base_url}/sitemap.xml), Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
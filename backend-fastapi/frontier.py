@@ -0,0 +1,283 @@
+import queue
+import threading
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin
+
+# URL frontier for the scraper, built up front instead of by clicking
+# through the sidebar: every page listed in the site's sitemap.xml and/or in
+# the served sidebar of each version, deduplicated, with the section path
+# and version each page is filed under. Fetch workers then pull pages off
+# the frontier concurrently. Plain HTTP and the standard library only;
+# rendering the pages is left to the fetchers.
+
+DOCS_ROOT = "https://vitess.io/docs/"
+SITEMAP_URL = "https://vitess.io/sitemap.xml"
+FETCH_TIMEOUT = 30
+FRONTIER_RETRY_MAX_SECONDS = 30
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def fetch_text(url, timeout=FETCH_TIMEOUT):
+    request = urllib.request.Request(url, headers={"User-Agent": "vitess-rag-scraper"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read().decode(response.headers.get_content_charset() or "utf-8")
+
+
+def normalize_url(url, base=None):
+    """Absolute, without fragment or query, with a trailing slash on directory-style paths"""
+    url = urldefrag(urljoin(base, url) if base else url)[0].split("?")[0]
+    last = url.rsplit("/", 1)[-1]
+    if last and "." not in last:
+        url += "/"
+    return url
+
+
+def get_section_path_from_url(url, docs_root=DOCS_ROOT, version_labels=None):
+    """Extract section path from URL to build proper breadcrumbs. version_labels
+    maps a top-level docs directory ("22.0") to its sidebar title
+    ("v22.0 (Development)")."""
+    if "archive" in url:
+        # Extract path for archived docs
+        parts = url.split("/docs/archive/")
+        if len(parts) > 1:
+            path_parts = parts[1].strip("/").split("/")
+            if path_parts:
+                # Format: ["Archives", "v18.0 (Archived)", "Reference", ...]
+                version = path_parts[0]
+                version_label = f"v{version} (Archived)" if version.replace(".", "").isdigit() else version
+
+                section_path = ["Archives", version_label]
+                section_path.extend(part.capitalize() for part in path_parts[1:] if part)
+                return section_path
+
+    # Default path extraction for non-archived content
+    path_parts = [part for part in url.replace(docs_root, "").strip("/").split("/") if part]
+    if path_parts:
+        section_path = [part.capitalize() for part in path_parts]
+        if version_labels and path_parts[0] in version_labels:
+            section_path[0] = version_labels[path_parts[0]]
+        return section_path
+
+    return ["Unknown"]
+
+
+def page_version(url, section_path, is_archived=False):
+    """The version_or_commonresource a page is filed under"""
+    # Special handling for Archived section - use subsection title as version
+    if is_archived and len(section_path) >= 2:
+        return section_path[1]
+    if section_path and section_path[0]:
+        return section_path[0]
+    # Try to extract version from URL if section_path is empty
+    for part in url.split('/'):
+        if part.startswith('v') and any(c.isdigit() for c in part):
+            return part
+    return "Unknown"
+
+
+def sitemap_urls(sitemap_url):
+    """Page URLs of a sitemap, following sitemap indexes"""
+    urls = []
+    pending = [sitemap_url]
+    seen = set()
+    while pending:
+        current = pending.pop(0)
+        if current in seen:
+            continue
+        seen.add(current)
+        root = ET.fromstring(fetch_text(current))
+        locs = [loc.text.strip() for loc in root.iter(f"{SITEMAP_NS}loc") if loc.text]
+        if root.tag == f"{SITEMAP_NS}sitemapindex":
+            pending.extend(locs)
+        else:
+            urls.extend(locs)
+    return urls
+
+
+class SidebarParser(HTMLParser):
+    """Links of the docs sidebar (div.docs-menu) with their titles and nesting depth"""
+
+    def __init__(self, page_url):
+        super().__init__()
+        self.page_url = page_url
+        self.links = []  # (url, title, depth), depth 1 for top-level categories
+        self._menu_divs = 0  # Open divs inside the menu, 0 when outside it
+        self._list_depth = 0
+        self._link = None
+        self._in_tile = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "div":
+            if self._menu_divs or "docs-menu" in classes:
+                self._menu_divs += 1
+            return
+        if not self._menu_divs:
+            return
+        if tag == "ul":
+            self._list_depth += 1
+        elif tag == "a" and attrs.get("href"):
+            self._link = {"href": attrs["href"], "text": [], "tile": []}
+        elif tag == "span" and "navlist-tile" in classes and self._link is not None:
+            self._in_tile = True
+
+    def handle_endtag(self, tag):
+        if not self._menu_divs:
+            return
+        if tag == "div":
+            self._menu_divs -= 1
+        elif tag == "ul":
+            self._list_depth -= 1
+        elif tag == "span":
+            self._in_tile = False
+        elif tag == "a" and self._link is not None:
+            title = " ".join("".join(self._link["tile"] or self._link["text"]).split())
+            self.links.append((normalize_url(self._link["href"], self.page_url), title, self._list_depth))
+            self._link = None
+
+    def handle_data(self, data):
+        if self._link is not None:
+            self._link["text"].append(data)
+            if self._in_tile:
+                self._link["tile"].append(data)
+
+
+def sidebar_links(page_url):
+    parser = SidebarParser(page_url)
+    parser.feed(fetch_text(page_url))
+    parser.close()
+    return parser.links
+
+
+def version_labels_from_sidebar(links, docs_root=DOCS_ROOT):
+    """Top-level directory -> category title, from the sidebar's top-level links"""
+    labels = {}
+    for url, title, depth in links:
+        if depth == 1 and url.startswith(docs_root) and title:
+            parts = url[len(docs_root):].strip("/").split("/")
+            if len(parts) == 1 and parts[0]:
+                labels[parts[0]] = title
+    return labels
+
+
+def build_frontier(docs_root=DOCS_ROOT, sitemap_url=SITEMAP_URL, sidebars=True, processed_urls=()):
+    """Every docs page under docs_root from the sitemap and/or the sidebars.
+    With sidebars, the sidebar of each top-level category page (one per
+    version; the served sidebar already lists the whole expanded tree) is
+    parsed. Entries are sorted by URL, so pages of a section are fetched
+    together, and pages in processed_urls are left out."""
+    start = time.perf_counter()
+    root_links = sidebar_links(docs_root)
+    labels = version_labels_from_sidebar(root_links, docs_root)
+
+    candidates = {}  # url -> where it was first discovered
+    if sitemap_url:
+        for url in sitemap_urls(sitemap_url):
+            candidates.setdefault(normalize_url(url), "sitemap")
+    if sidebars:
+        candidates.setdefault(normalize_url(docs_root), "sidebar")
+        for category_url, _, depth in root_links:
+            if depth != 1 or not category_url.startswith(docs_root):
+                continue
+            candidates.setdefault(category_url, "sidebar")
+            for url, _, _ in sidebar_links(category_url):
+                candidates.setdefault(url, "sidebar")
+
+    frontier = []
+    for url in sorted(candidates):
+        if not url.startswith(docs_root) or url in processed_urls:
+            continue
+        section_path = get_section_path_from_url(url, docs_root, labels)
+        is_archived = "archive" in url
+        frontier.append({
+            "url": url,
+            "section_path": section_path,
+            "is_archived": is_archived,
+            "version": page_version(url, section_path, is_archived),
+            "source": candidates[url],
+        })
+    print(f"Frontier: {len(frontier)} pages from {len(candidates)} discovered URLs "
+          f"in {time.perf_counter() - start:.1f}s")
+    return frontier
+
+
+class MemoryFrontier:
+    """A frontier list behind the same claim/complete/fail interface as
+    crawl_queue.CrawlQueue, for crawls that don't need to survive a restart"""
+
+    def __init__(self, entries):
+        self._entries = queue.Queue()
+        for entry in entries:
+            self._entries.put(entry)
+
+    def claim(self):
+        try:
+            return self._entries.get_nowait()
+        except queue.Empty:
+            return None
+
+    def complete(self, entry, save):
+        return save()
+
+    def fail(self, entry, error):
+        print(f"Giving up on {entry['url']}: {error}")
+
+
+def fetch_concurrently(frontier, make_fetcher, handle, workers=4):
+    """Run workers threads that claim entries from the frontier (a list, or
+    anything with claim/complete/fail like CrawlQueue). Each worker opens its
+    own fetcher with make_fetcher() -> (fetch(url), close()), since browser
+    sessions can't be shared across threads. handle(entry, content) is
+    called one at a time, in completion order, as the frontier's save step;
+    marking the entry done happens after it, outside that lock. When
+    fetching or handle raises, the entry is failed. Errors from the frontier
+    itself (a locked queue database) are retried with backoff rather than
+    ending the worker. Returns (pages fetched, seconds)."""
+    if isinstance(frontier, list):
+        frontier = MemoryFrontier(frontier)
+    handle_lock = threading.Lock()
+    fetched = [0]
+
+    def locked_handle(entry, content):
+        with handle_lock:
+            return handle(entry, content)
+
+    def retrying(operation, *args):
+        delay = 0.5
+        while True:
+            try:
+                return operation(*args)
+            except Exception as e:
+                print(f"Crawl frontier {operation.__name__} failed, retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, FRONTIER_RETRY_MAX_SECONDS)
+
+    def worker():
+        fetch, close = make_fetcher()
+        try:
+            while True:
+                entry = retrying(frontier.claim)
+                if entry is None:
+                    return
+                try:
+                    content = fetch(entry["url"])
+                    frontier.complete(entry, lambda: locked_handle(entry, content))
+                    with handle_lock:
+                        fetched[0] += 1
+                except Exception as e:
+                    print(f"Error fetching {entry['url']}: {str(e)}")
+                    retrying(frontier.fail, entry, e)
+        finally:
+            close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"fetch-{i}") for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return fetched[0], time.perf_counter() - start
@@ -0,0 +1,231 @@
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers threads of one process
+    fcntl = None
+
+# Blue/green index generations. Every ingestion builds into a fresh
+# collection named <prefix>_g<timestamp>_<random suffix>; query handlers never read a
+# collection directly but resolve the alias, which is the metadata of a
+# small <prefix>_alias collection holding the active and previous
+# generation. Flipping the alias is a single metadata update, so queries
+# see either the old or the new generation, never a half-built one. If the
+# alias names a generation that no longer exists (deleted by hand, or
+# pruned by another deployment), queries use the newest one that does.
+
+ALIAS_REFRESH_SECONDS = float(os.getenv("ALIAS_REFRESH_SECONDS", "5"))
+SMOKE_QUERY_SAMPLES = int(os.getenv("SMOKE_QUERY_SAMPLES", "20"))
+SMOKE_QUERY_MIN_RECALL = float(os.getenv("SMOKE_QUERY_MIN_RECALL", "0.9"))
+GENERATIONS_TO_KEEP = int(os.getenv("GENERATIONS_TO_KEEP", "2"))
+INGEST_LOCK_FILE = os.getenv("INGEST_LOCK_FILE", ".ingest.lock")
+
+
+def new_generation_name(prefix):
+    # Microseconds keep names in build order; the suffix separates rebuilds started at the same instant
+    return f"{prefix}_g{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}_{secrets.token_hex(2)}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class GenerationAlias:
+    def __init__(self, chroma_client, prefix):
+        self.chroma_client = chroma_client
+        self.prefix = prefix
+        self.alias_name = f"{prefix}_alias"
+        self._cached_state = None
+        self._cached_collection = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def _alias_collection(self):
+        return self.chroma_client.get_or_create_collection(name=self.alias_name)
+
+    def read(self):
+        """Current alias state: {"active": name or "", "previous": name or "", ...}"""
+        metadata = self._alias_collection().metadata or {}
+        return {
+            "active": metadata.get("active", ""),
+            "previous": metadata.get("previous", ""),
+            "updated_at": metadata.get("updated_at", ""),
+        }
+
+    def _write(self, active, previous):
+        self._alias_collection().modify(metadata={
+            "active": active,
+            "previous": previous,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        })
+        self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            self._cached_at = 0.0
+
+    def active_collection(self):
+        """Collection the alias points at, re-resolved at most every
+        ALIAS_REFRESH_SECONDS so queries don't pay a round trip each time.
+        Returns None before the first generation has been built."""
+        with self._lock:
+            if time.monotonic() - self._cached_at < ALIAS_REFRESH_SECONDS:
+                return self._cached_collection
+        state = self.read()
+        try:
+            collection = self.chroma_client.get_collection(state["active"]) if state["active"] else None
+        except Exception as e:
+            collection = self._newest_generation()
+            if collection is None:
+                raise
+            print(f"Alias {self.alias_name} points at {state['active']}, which can't be opened ({str(e)}); "
+                  f"using {collection.name}")
+        with self._lock:
+            self._cached_state = state
+            self._cached_collection = collection
+            self._cached_at = time.monotonic()
+        return collection
+
+    def active_name(self):
+        collection = self.active_collection()
+        return collection.name if collection is not None else None
+
+    def flip(self, new_name):
+        state = self.read()
+        self._write(new_name, state["active"])
+        print(f"Alias {self.alias_name} now points at {new_name} (previous: {state['active'] or 'none'})")
+
+    def rollback(self):
+        state = self.read()
+        if not state["previous"]:
+            raise ValueError("No previous generation to roll back to")
+        self._write(state["previous"], state["active"])
+        print(f"Rolled back alias {self.alias_name} to {state['previous']}")
+        return state["previous"]
+
+    def list_generations(self):
+        names = []
+        for collection in self.chroma_client.list_collections():
+            # list_collections returns names in chromadb 0.6 and objects before that
+            name = collection if isinstance(collection, str) else collection.name
+            if name.startswith(f"{self.prefix}_g"):
+                names.append(name)
+        return sorted(names)
+
+    def _newest_generation(self):
+        for name in reversed(self.list_generations()):
+            try:
+                return self.chroma_client.get_collection(name)
+            except Exception:
+                continue
+        return None
+
+    def prune(self, keep=GENERATIONS_TO_KEEP):
+        """Delete old generations, always keeping the active and previous ones"""
+        state = self.read()
+        protected = {state["active"], state["previous"]}
+        generations = self.list_generations()
+        for name in generations[:-keep] if keep > 0 else generations:
+            if name not in protected:
+                self.chroma_client.delete_collection(name)
+                print(f"Deleted old generation {name}")
+
+
+class IngestionLock:
+    """Held while a generation is being built. Besides threads of this
+    process it excludes other worker processes through an flock on
+    INGEST_LOCK_FILE, so N workers never build N generations. The holder
+    writes its host and PID into the file, which is how locked() tells
+    whether a build is running without touching the lock itself."""
+
+    def __init__(self, path=INGEST_LOCK_FILE):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            file.close()
+            self._thread_lock.release()
+            return False
+        file.truncate(0)
+        file.write(json.dumps({"host": socket.gethostname(), "pid": os.getpid(),
+                               "since": datetime.now(timezone.utc).isoformat()}))
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.truncate(0)
+            self._file.flush()
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def holder(self):
+        """{"host", "pid", "since"} of the process building a generation, or None"""
+        if fcntl is None or self._file is not None:
+            return {"host": socket.gethostname(), "pid": os.getpid()} if self._thread_lock.locked() else None
+        try:
+            with open(self.path, "r") as file:
+                holder = json.loads(file.read() or "null")
+        except (OSError, ValueError):
+            return None
+        if not holder:
+            return None
+        # A holder that died keeps its record in the file but not the flock
+        if holder.get("host") == socket.gethostname() and not _pid_alive(int(holder.get("pid", 0))):
+            return None
+        return holder
+
+    def locked(self):
+        return self._thread_lock.locked() or self.holder() is not None
+
+
+def validate_generation(collection, ids, embeddings, expected_count):
+    """Check a freshly built generation before it goes live: the record
+    count must match, and querying with a sample of stored vectors must
+    find those records again (a cheap recall smoke test)."""
+    count = collection.count()
+    report = {"expected_count": expected_count, "count": count, "smoke_queries": 0, "smoke_recall": None}
+    if count != expected_count or count == 0:
+        report["ok"] = False
+        report["reason"] = "record count mismatch" if count != expected_count else "empty generation"
+        return report
+
+    step = max(1, len(ids) // SMOKE_QUERY_SAMPLES)
+    sample = list(range(0, len(ids), step))[:SMOKE_QUERY_SAMPLES]
+    results = collection.query(
+        query_embeddings=[embeddings[i] for i in sample],
+        n_results=min(5, count),
+        include=[]
+    )
+    found = sum(1 for i, result_ids in zip(sample, results['ids']) if ids[i] in result_ids)
+    recall = found / len(sample)
+    report["smoke_queries"] = len(sample)
+    report["smoke_recall"] = recall
+    report["ok"] = recall >= SMOKE_QUERY_MIN_RECALL
+    if not report["ok"]:
+        report["reason"] = f"smoke recall {recall:.2f} below {SMOKE_QUERY_MIN_RECALL}"
+    return report
@@ -0,0 +1,320 @@
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# Streaming HTML -> lightweight Markdown for docs pages. Only the article
+# (article.docs-content by default) is converted: headings keep their level
+# and carry a stable anchor, written as "## Title {#anchor}", code blocks are
+# fenced with their language, lists, tables and blockquotes keep their
+# shape, and inline markup is reduced to text and `code`. Scripts, styles,
+# buttons, images and highlight line numbers are dropped.
+#
+# Anchors are the heading's id attribute (what the site links to), or a
+# Hugo-style slug of the heading text when it has none; repeats get -1, -2
+# suffixes. Section boundaries and anchors survive into vitess_docs.yaml
+# through the heading lines, see split_markdown_sections in preprocess.py.
+#
+# The converter is an html.parser subclass, so pages can also be fed in
+# pieces with MarkdownExtractor.feed and only the output is kept in memory.
+
+Section = namedtuple("Section", ["anchor", "level", "title", "markdown"])
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {"p", "div", "section", "dl", "dt", "dd", "figure", "figcaption", "details", "summary", "hr"}
+SKIP_TAGS = {"script", "style", "noscript", "template", "button", "svg", "nav", "form", "select", "iframe"}
+VOID_TAGS = {"br", "img", "hr", "input", "meta", "link", "source", "wbr", "col", "area", "base", "embed"}
+# Line number gutters of highlighted code, and the hover links next to headings
+SKIP_CLASSES = {"lnt", "ln", "anchor", "hanchor", "header-link", "headerlink", "heading-anchor"}
+
+HEADING_LINE_RE = re.compile(r"^(#{1,6}) (.*?) \{#([^}]*)\}$")
+_PRE_RE = re.compile(r"(<pre\b[^>]*>)(.*?)(</pre>)", re.S)
+_LINE_NUMBER_RE = re.compile(r'<span class="lnt?"[^>]*>.*?</span>', re.S)
+_PRE_TAG_RE = re.compile(r"<(?!/?code\b)[^>]+>")  # <code> stays, it carries the language
+_BR_RE = re.compile(r"<br\s*/?>", re.I)
+_SLUG_DROP_RE = re.compile(r"[^\w\- ]+")
+
+
+def slugify(text):
+    """Hugo's default heading id: lower case, punctuation dropped, spaces to dashes"""
+    return _SLUG_DROP_RE.sub("", text.strip().lower()).replace(" ", "-")
+
+
+def _inline(text):
+    return " ".join(text.split())
+
+
+class MarkdownExtractor(HTMLParser):
+    def __init__(self, article_class="docs-content"):
+        super().__init__(convert_charrefs=True)
+        self.article_class = article_class
+        self.lines = []
+        self.anchors = {}     # anchor -> times used, for de-duplication
+        self._article = 0     # Open article elements, counted once inside the docs article
+        self._skip_tag = None  # Tag of the outermost element whose content is dropped
+        self._skip_depth = 0   # Open elements with that tag name, counted so unclosed children don't matter
+        self._inline = []     # Text of the current block
+        self._heading = None  # (level, anchor) while inside a heading
+        self._pre = None      # Raw text parts while inside <pre>
+        self._pre_lang = ""
+        self._lists = []      # Stack of [ordered, item count, item marker not yet written]
+        self._quote = 0
+        self._table = None    # Rows of the current table
+        self._row = None
+        self._cell = None
+
+    # Output helpers
+
+    def _prefix(self):
+        return "> " * self._quote
+
+    def _emit(self, line):
+        self.lines.append(self._prefix() + line if line else self._prefix().rstrip())
+
+    def _blank(self):
+        if self.lines and self.lines[-1].strip(" >"):
+            self._emit("")
+
+    def _flush(self):
+        text = _inline("".join(self._inline))
+        self._inline = []
+        if not text:
+            return
+        if self._lists:
+            ordered, counter, pending = self._lists[-1]
+            indent = "  " * (len(self._lists) - 1)
+            if pending:
+                self._emit(indent + f"{f'{counter}.' if ordered else '-'} {text}")
+                self._lists[-1][2] = False
+            else:
+                # Continuation text of a list item is indented under its marker
+                self._emit(indent + "  " + text)
+        else:
+            self._emit(text)
+            self._blank()
+
+    def _anchor(self, explicit, title):
+        base = explicit or slugify(title) or "section"
+        count = self.anchors.get(base, 0)
+        self.anchors[base] = count + 1
+        return base if count == 0 else f"{base}-{count}"
+
+    # Parser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        if not self._article:
+            if tag == "article" and self.article_class in classes:
+                self._article = 1
+            return
+        if tag == "article":
+            self._article += 1
+
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag not in VOID_TAGS and (tag in SKIP_TAGS or classes & SKIP_CLASSES):
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+
+        if self._pre is not None:
+            if tag == "code" and not self._pre_lang:
+                self._pre_lang = self._language(attrs, classes)
+            elif tag == "br":
+                self._pre.append("\n")
+            return
+
+        if tag in HEADING_TAGS:
+            self._flush()
+            self._blank()
+            self._heading = (HEADING_TAGS[tag], attrs.get("id"))
+        elif tag == "pre":
+            self._flush()
+            self._pre = []
+            self._pre_lang = self._language(attrs, classes)
+        elif tag in ("ul", "ol"):
+            self._flush()
+            self._lists.append([tag == "ol", 0, False])
+        elif tag == "li":
+            self._flush()
+            if self._lists:
+                self._lists[-1][1] += 1
+                self._lists[-1][2] = True
+        elif tag == "blockquote":
+            self._flush()
+            self._quote += 1
+        elif tag == "table" and "lntable" not in classes:
+            # Line-numbered code is laid out as a table; only its <pre> matters
+            self._flush()
+            self._table = []
+        elif tag == "tr" and self._table is not None:
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+        elif tag == "br":
+            if self._cell is None:
+                self._flush()
+            else:
+                self._cell.append(" ")
+        elif tag == "code":
+            self._text("`")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if not self._article:
+            return
+        if tag == "article":
+            self._article -= 1
+            if not self._article:
+                self._flush()
+            return
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+        if tag in VOID_TAGS:
+            return
+
+        if self._pre is not None:
+            if tag == "pre":
+                code = "".join(self._pre).strip("\n")
+                if code.strip():
+                    self._blank()
+                    self._emit(f"```{self._pre_lang}")
+                    for line in code.split("\n"):
+                        self._emit(line.rstrip())
+                    self._emit("```")
+                    self._blank()
+                self._pre = None
+                self._pre_lang = ""
+            return
+
+        if tag in HEADING_TAGS and self._heading is not None:
+            level, explicit = self._heading
+            title = _inline("".join(self._inline))
+            self._inline = []
+            self._heading = None
+            if title:
+                self._emit(f"{'#' * level} {title} {{#{self._anchor(explicit, title)}}}")
+                self._blank()
+        elif tag in ("ul", "ol"):
+            self._flush()
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._blank()
+        elif tag == "li":
+            self._flush()
+        elif tag == "blockquote":
+            self._flush()
+            # Trailing empty quote lines would glue the next block to the quote
+            while self.lines and self.lines[-1] == self._prefix().rstrip():
+                self.lines.pop()
+            self._quote = max(0, self._quote - 1)
+            self._blank()
+        elif tag in ("td", "th") and self._cell is not None:
+            self._row.append(_inline("".join(self._cell)).replace("|", "\\|"))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._row:
+                self._table.append(self._row)
+            self._row = None
+        elif tag == "table" and self._table is not None:
+            self._emit_table(self._table)
+            self._table = None
+        elif tag == "code":
+            self._text("`")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._article or self._skip_tag is not None:
+            return
+        if self._pre is not None:
+            self._pre.append(data)
+        else:
+            self._text(data)
+
+    # Block helpers
+
+    def _text(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        else:
+            self._inline.append(data)
+
+    def _emit_table(self, rows):
+        width = max(len(row) for row in rows) if rows else 0
+        if not width:
+            return
+        self._blank()
+        for i, row in enumerate(rows):
+            self._emit("| " + " | ".join(row + [""] * (width - len(row))) + " |")
+            if i == 0:
+                self._emit("|" + " --- |" * width)
+        self._blank()
+
+    @staticmethod
+    def _language(attrs, classes):
+        if attrs.get("data-lang"):
+            return attrs["data-lang"]
+        for name in classes:
+            if name.startswith("language-"):
+                return name[len("language-"):]
+        return ""
+
+    def markdown(self):
+        while self.lines and not self.lines[-1].strip(" >"):
+            self.lines.pop()
+        return "\n".join(self.lines)
+
+
+def _flatten_code(match):
+    body = _LINE_NUMBER_RE.sub("", match.group(2))
+    return match.group(1) + _PRE_TAG_RE.sub("", _BR_RE.sub("\n", body)) + match.group(3)
+
+
+def html_to_markdown(html, article_class="docs-content"):
+    """Convert a whole page. Tokenizing tags is nearly all of the cost, so
+    the parser is only fed the article, with the per-line highlighting spans
+    of its code blocks (most of the tags on a docs page) stripped first."""
+    start = re.search(rf"<article\b[^>]*\b{re.escape(article_class)}\b", html)
+    if start is None:
+        return ""
+    end = html.rfind("</article>")
+    article = html[start.start():end + len("</article>") if end > start.start() else len(html)]
+
+    extractor = MarkdownExtractor(article_class)
+    extractor.feed(_PRE_RE.sub(_flatten_code, article))
+    extractor.close()
+    return extractor.markdown()
+
+
+def markdown_sections(markdown):
+    """Split extracted Markdown at its anchored headings. Text before the
+    first heading is a section with an empty anchor (the top of the page)."""
+    sections = []
+    anchor, level, title, lines = "", 0, "", []
+    in_fence = False
+    for line in markdown.split("\n"):
+        if line.startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_LINE_RE.match(line)
+        if match:
+            if any(l.strip() for l in lines):
+                sections.append(Section(anchor, level, title, "\n".join(lines).strip("\n")))
+            anchor, level, title = match.group(3), len(match.group(1)), match.group(2)
+            lines = [f"{match.group(1)} {title}"]
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append(Section(anchor, level, title, "\n".join(lines).strip("\n")))
+    return sections
+
+
+def extract_sections(html, article_class="docs-content"):
+    return markdown_sections(html_to_markdown(html, article_class))
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+import yaml
+
+# Open-loop load generator for the query endpoints. Requests are started on
+# a fixed schedule at the target rate whether or not earlier ones have
+# finished, so a slow server shows up as growing latency rather than a
+# quietly lower request rate. Questions are drawn from golden_queries.yaml.
+#
+# Point main.py at stub_server.py for runs without live services, see
+# clients.py.
+#
+# Usage: python loadgen.py [base_url] [rps] [seconds] [endpoints] [report.json]
+#   e.g. python loadgen.py http://localhost:8000 20 30 query,rawquery-cli
+
+MAX_IN_FLIGHT = 1000  # Requests beyond this are counted as dropped, not sent
+REQUEST_TIMEOUT = 120.0
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+ENDPOINT_PATHS = {"query": "/query", "rawquery-cli": "/rawquery-cli", "enhance-query-cli": "/enhance-query-cli"}
+
+
+def load_questions(path="golden_queries.yaml"):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [entry["query"] for entry in yaml.safe_load(file)["queries"]]
+
+
+def build_payload(endpoint, question):
+    if endpoint == "query":
+        return {"query": question}
+    # Bypass the answer cache so every request exercises the full pipeline
+    return {"query": question, "use_cache": False}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def histogram(latencies):
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for latency in latencies:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if latency <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+async def run(base_url, rps, seconds, endpoints):
+    questions = load_questions()
+    results = {endpoint: {"latencies": [], "statuses": {}, "dropped": 0} for endpoint in endpoints}
+    in_flight = 0
+    tasks = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT,
+                                 limits=httpx.Limits(max_connections=MAX_IN_FLIGHT)) as client:
+
+        async def send(endpoint, question):
+            nonlocal in_flight
+            stats = results[endpoint]
+            start = time.perf_counter()
+            try:
+                response = await client.post(ENDPOINT_PATHS[endpoint], json=build_payload(endpoint, question))
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            finally:
+                in_flight -= 1
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            if status == "200":
+                stats["latencies"].append((time.perf_counter() - start) * 1000)
+
+        total = int(rps * seconds)
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = endpoints[i % len(endpoints)]
+            if in_flight >= MAX_IN_FLIGHT:
+                results[endpoint]["dropped"] += 1
+                continue
+            in_flight += 1
+            tasks.append(asyncio.create_task(send(endpoint, random.choice(questions))))
+        send_elapsed = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return results, send_elapsed, elapsed
+
+
+def summarize(results, rps, elapsed):
+    report = {"target_rps": rps, "elapsed_seconds": elapsed, "histogram_buckets_ms": HISTOGRAM_BUCKETS_MS,
+              "endpoints": {}}
+    for endpoint, stats in results.items():
+        latencies = stats["latencies"]
+        sent = sum(stats["statuses"].values())
+        summary = {
+            "sent": sent,
+            "ok": len(latencies),
+            "dropped": stats["dropped"],
+            "statuses": stats["statuses"],
+            "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "histogram": histogram(latencies),
+        }
+        if latencies:
+            summary["latency_ms"] = {
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies),
+            }
+        report["endpoints"][endpoint] = summary
+    return report
+
+
+def print_report(report):
+    for endpoint, summary in report["endpoints"].items():
+        print(f"\n/{endpoint}: sent {summary['sent']}, ok {summary['ok']}, dropped {summary['dropped']}, "
+              f"{summary['throughput_rps']:.1f} ok/s")
+        print(f"  statuses: {summary['statuses']}")
+        if "latency_ms" in summary:
+            latency = summary["latency_ms"]
+            print(f"  latency ms: p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  "
+                  f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+        peak = max(summary["histogram"]) or 1
+        bounds = [f"<={b}" for b in report["histogram_buckets_ms"]] + [f">{report['histogram_buckets_ms'][-1]}"]
+        for bound, count in zip(bounds, summary["histogram"]):
+            if count:
+                print(f"  {bound:>8} ms {count:>6} {'#' * max(1, 40 * count // peak)}")
+
+
+if __name__ == "__main__":
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    rps = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 30.0
+    endpoints = sys.argv[4].split(",") if len(sys.argv) > 4 else ["query", "rawquery-cli"]
+    report_path = sys.argv[5] if len(sys.argv) > 5 else None
+
+    print(f"Driving {', '.join('/' + e for e in endpoints)} at {rps} req/s for {seconds}s against {base_url}")
+    results, send_elapsed, elapsed = asyncio.run(run(base_url, rps, seconds, endpoints))
+    if send_elapsed > seconds * 1.05:
+        print(f"Warning: the generator itself fell behind schedule ({send_elapsed:.1f}s to send)")
+
+    report = summarize(results, rps, elapsed)
+    print_report(report)
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {report_path}")
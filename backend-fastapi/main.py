@@ -1,14 +1,42 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import chromadb
-from google import genai
+from typing import List, Optional
+import asyncio
 import os
-import yaml
-import uuid
+import threading
+import time
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from google.genai.types import EmbedContentConfig
+from preprocess import (
+    load_yaml_docs, iter_chunk_records, merge_version_metadata, metadata_versions,
+    resolve_version_metadata, build_where_filter
+)
+from rerank import rerank_results
+from context_packing import CONTEXT_TOKEN_BUDGET, format_snippets, pack_context
+from answer_cache import SemanticAnswerCache, answer_cache_scope
+from embedding_batcher import EmbeddingBatcher
+from generations import GenerationAlias, IngestionLock, new_generation_name, validate_generation
+from snapshot import (
+    SIDECAR_DIR, SNAPSHOT_DIR, Snapshot, export_sidecar, export_snapshot, load_sidecar, prune_snapshots,
+    read_chunks, snapshot_path
+)
+from clients import make_gemini_client, make_chroma_client
+from admission import ConcurrencyLimiter, Overloaded, TokenBucketLimiter, client_key
+from circuit_breaker import CircuitOpenError, breaker_stats, get_breaker
+from fallback import LexicalIndex, RecentEmbeddingCache
+from page_index import PAGE_SEARCH_PAGES, restrict_to_pages
+from retrieval import MAX_CHUNKS_PER_PARENT, MMR_FETCH_FACTOR, MMR_LAMBDA, diversify
+from suggest import SUGGEST_LIMIT
+from related import RELATED_IN_RESULTS, RELATED_PAGES_K
+from serialization import CompressionMiddleware, FastJSONResponse, shape_response
+from profiler import PROFILING_ENABLED, collapsed_stacks, is_admin, profile_request, profile_store
+from metrics import (
+    REQUEST_SECONDS, UPSTREAM_ERRORS, UPSTREAM_RETRIES, ADMISSION_REJECTED, FALLBACKS,
+    INGEST_CHUNKS, INGEST_EMBED_SECONDS, INGEST_UPSERT_SECONDS, INGEST_CHUNKS_PER_SECOND,
+    render_metrics, start_request_timer, reset_request_timer, stage
+)
 
 app = FastAPI(
     title="Vitess Documentation Search",
@@ -24,22 +52,103 @@ app.add_middleware(
 )
 
 load_dotenv()
-CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST")
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+TIMING_HEADER_ENABLED = os.getenv("TIMING_HEADER", "false").lower() == "true"  # Always send X-Timing
 
-client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+# Prefix of the index generation collections and their alias; chunks are
+# deduplicated across versions, see preprocess.py
+COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "vitess_docs_v2")
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "256"))
+# Ingestion embeds chunks in batches, behind its own circuit breaker
+# (gemini:embed_content_ingest) so a bulk reindex that hits quota or
+# timeouts doesn't open the breaker of the query path
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "100"))
+INGEST_EMBED_RETRIES = int(os.getenv("INGEST_EMBED_RETRIES", "5"))
 
-chroma_client = chromadb.HttpClient(
-    host=CHROMA_SERVER_HOST, 
-    port=8000
-)
+# Embedding size and storage precision for newly built generations. Each
+# generation records its own settings, and queries follow the active one.
+# Chroma always stores float32, so the dtype only applies to the local
+# snapshot and sidecar matrices.
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")  # float32 or float16
+
+# Longest a request waits for its query embedding before falling back
+EMBED_QUERY_TIMEOUT = float(os.getenv("EMBED_QUERY_TIMEOUT", "2.5"))
+# Longest a request waits for retrieval (Chroma query, rerank, diversify) before falling back
+CHROMA_QUERY_TIMEOUT = float(os.getenv("CHROMA_QUERY_TIMEOUT", "5"))
+LEXICAL_FALLBACK_ENABLED = os.getenv("LEXICAL_FALLBACK", "true").lower() == "true"
+
+# Multi-worker serving (see serve.py): generations are exported to mmap'd
+# snapshots shared by all workers, optionally searched in-process instead of
+# through Chroma, and only the serving parent ingests on startup
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS", "false").lower() == "true"
+LOCAL_VECTOR_SEARCH = os.getenv("LOCAL_VECTOR_SEARCH", "false").lower() == "true"
+SKIP_STARTUP_INGEST = os.getenv("SKIP_STARTUP_INGEST", "false").lower() == "true"
+
+# Production clients by default; see clients.py for pointing them at local stand-ins
+client = make_gemini_client()
+
+chroma_client = make_chroma_client()
 
-# chroma_client = chromadb.PersistentClient(path="vitess_chroma_db")
+# Queries read whichever index generation the alias points at
+generation_alias = GenerationAlias(chroma_client, COLLECTION_NAME)
+ingestion_lock = IngestionLock()
+
+# Generated answers keyed by query embedding, invalidated when the corpus generation changes
+answer_cache = SemanticAnswerCache()
+
+# Per-client budget for the generation endpoints (off unless RATE_LIMIT_PER_MINUTE is set),
+# and a cap on concurrent Gemini generations
+rate_limiter = TokenBucketLimiter()
+generation_limiter = ConcurrencyLimiter("generation")
+
+# Local fallbacks for when the embedding model or Chroma is unavailable
+recent_embeddings = RecentEmbeddingCache()
+lexical_index = None
+snapshot = None
+page_index = None  # Page vectors for two-stage search (used when PAGE_SEARCH_PAGES is set) and related pages
+suggest_index = None  # Title, URL slug and flag typeahead for /suggest
+related_graph = None  # Precomputed see also links between pages
+local_index_lock = threading.Lock()
+
+# Summary returned instead of an answer when generation is saturated or down
+DEGRADED_SUMMARY = "The answer service is unavailable right now, so here are the most relevant documentation excerpts instead."
+
+# Registered before the timing middleware so request timings include compression
+app.add_middleware(CompressionMiddleware)
+
+# Inside the timing middleware, so a profile can pick up the request's stage timings
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_request)
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    timer, token = start_request_timer(request.url.path)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        # Label by route template so path parameters don't explode cardinality
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUEST_SECONDS.observe(timer.total(), path=path, status=status_code)
+        reset_request_timer(token)
+    
+    # Per-stage breakdown on request with an X-Timing header, or always if enabled
+    if TIMING_HEADER_ENABLED or request.headers.get("X-Timing"):
+        response.headers["X-Timing"] = timer.header_value()
+    return response
 
 class QueryRequest(BaseModel):
     query: str
     version: str = "v22.0 (Development)"  # Default to latest version
     n_results: int = 10  # Default value of 10 if not specified
     include_resources: bool = True  # Whether to include common resources in results
+    mmr_lambda: Optional[float] = None  # Relevance vs novelty of results, 1 for plain nearest neighbours (default MMR_LAMBDA)
+    max_per_parent: Optional[int] = None  # Most chunks returned per page, 0 for no cap (default MAX_CHUNKS_PER_PARENT)
+    include_documents: bool = True  # False returns only metadata and scores
+    fields: Optional[List[str]] = None  # Result fields to return, e.g. ["url", "title", "similarity_score"]
 
 class EmbeddingRequest(BaseModel):
     text: str
@@ -52,218 +161,663 @@ class EnhanceQueryCLIRequest(BaseModel):
     version: str = "v22.0 (Development)"
     n_results: int = 10
     include_resources: bool = True
+    rerank: bool = False  # Over-fetch candidates and rescore them before summarization
+    rerank_candidates: int = 50
+    rerank_top_k: int = 5
+    pack_context: bool = True  # Dedupe, merge and trim snippets before summarization
+    context_token_budget: int = CONTEXT_TOKEN_BUDGET
+    use_cache: bool = True  # Reuse answers to semantically similar earlier questions
+    allow_degraded: bool = True  # Return retrieval-only results instead of an error when generation is saturated or failing
+    mmr_lambda: Optional[float] = None  # Relevance vs novelty of results, 1 for plain nearest neighbours (default MMR_LAMBDA)
+    max_per_parent: Optional[int] = None  # Most chunks returned per page, 0 for no cap (default MAX_CHUNKS_PER_PARENT)
+    include_documents: bool = True  # False returns only metadata and scores
+    fields: Optional[List[str]] = None  # Result fields to return, e.g. ["url", "title", "similarity_score"]
 
 class RawQueryCLIRequest(BaseModel):
     query: str
     version: str = "v22.0 (Development)" 
     n_results: int = 10
     include_resources: bool = True
+    rerank: bool = False  # Over-fetch candidates and rescore them before summarization
+    rerank_candidates: int = 50
+    rerank_top_k: int = 5
+    pack_context: bool = True  # Dedupe, merge and trim snippets before summarization
+    context_token_budget: int = CONTEXT_TOKEN_BUDGET
+    use_cache: bool = True  # Reuse answers to semantically similar earlier questions
+    allow_degraded: bool = True  # Return retrieval-only results instead of an error when generation is saturated or failing
+    mmr_lambda: Optional[float] = None  # Relevance vs novelty of results, 1 for plain nearest neighbours (default MMR_LAMBDA)
+    max_per_parent: Optional[int] = None  # Most chunks returned per page, 0 for no cap (default MAX_CHUNKS_PER_PARENT)
+    include_documents: bool = True  # False returns only metadata and scores
+    fields: Optional[List[str]] = None  # Result fields to return, e.g. ["url", "title", "similarity_score"]
+
+def call_upstream(upstream, operation, fn, *args, **kwargs):
+    """Call an upstream service, retrying failures with a short backoff.
+    Every failed attempt and every retry is counted in /metrics. Calls are
+    refused with CircuitOpenError while the upstream's breaker is open."""
+    breaker = get_breaker(upstream, operation)
+    breaker.before_call()
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            breaker.record(True, time.perf_counter() - start)
+            return result
+        except Exception as e:
+            breaker.record(False, time.perf_counter() - start)
+            UPSTREAM_ERRORS.inc(upstream=upstream, operation=operation)
+            if attempt == UPSTREAM_MAX_RETRIES or breaker.is_open():
+                raise
+            UPSTREAM_RETRIES.inc(upstream=upstream, operation=operation)
+            print(f"Retrying {upstream} {operation} after error: {str(e)}")
+            time.sleep(0.2 * (attempt + 1))
 
-def get_embedding(text: str, title="Vitess Documentation"):
-    response = client.models.embed_content(
+def generate_content(contents):
+    response = call_upstream(
+        "gemini", "generate_content",
+        client.models.generate_content,
+        model="gemini-2.0-flash",
+        contents=contents
+    )
+    return response
+
+def get_embedding(text: str, title="Vitess Documentation", dimensionality=768):
+    response = call_upstream(
+        "gemini", "embed_content",
+        client.models.embed_content,
         model="models/text-embedding-004",
         contents=text,
         config=EmbedContentConfig(
             task_type="RETRIEVAL_DOCUMENT",
-            output_dimensionality=768,
+            output_dimensionality=dimensionality,
             title=title,
         ),
     )
     # Return the embedding values from the first content
     return response.embeddings[0].values
 
-def split_content_by_tokens(content, max_tokens=2000, chars_per_token=4):
-    """Fast and reliable content chunking by character count.
-    Converts newlines to spaces and normalizes spacing for consistent processing.
-    """
-    # Normalize newlines to spaces and remove multiple spaces
-    normalized_content = content.replace('\n', ' ').replace('\r', ' ')
-    normalized_content = ' '.join(normalized_content.split())
-    
-    max_chars = max_tokens * chars_per_token
-    
-    # Quick return if content fits in one chunk
-    if len(normalized_content) <= max_chars:
-        return [normalized_content]
-    
-    chunks = []
-    start = 0
-    
-    while start < len(normalized_content):
-        # Determine end position of this chunk
-        end = min(start + max_chars, len(normalized_content))
-        
-        # If we're not at the end of the content, find last space
-        if end < len(normalized_content):
-            # Look for the last space within the chunk
-            last_space = normalized_content.rfind(' ', start, end)
+def get_embeddings(texts, title="Vitess Documentation", dimensionality=768, operation="embed_content"):
+    """Embed several texts with one upstream call"""
+    response = call_upstream(
+        "gemini", operation,
+        client.models.embed_content,
+        model="models/text-embedding-004",
+        contents=texts,
+        config=EmbedContentConfig(
+            task_type="RETRIEVAL_DOCUMENT",
+            output_dimensionality=dimensionality,
+            title=title,
+        ),
+    )
+    return [embedding.values for embedding in response.embeddings]
+
+def get_ingest_embeddings(texts, title="Vitess Documentation", dimensionality=768):
+    """Embed a batch of chunks for ingestion. Retries with a longer backoff
+    than queries can afford, and waits out its own breaker when it opens."""
+    for attempt in range(INGEST_EMBED_RETRIES + 1):
+        try:
+            return get_embeddings(texts, title=title, dimensionality=dimensionality, operation="embed_content_ingest")
+        except CircuitOpenError as e:
+            if attempt == INGEST_EMBED_RETRIES:
+                raise
+            print(f"Ingestion embedding circuit open, waiting {e.retry_after}s")
+            time.sleep(e.retry_after)
+        except Exception as e:
+            if attempt == INGEST_EMBED_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"Ingestion embedding failed, retrying in {delay}s: {str(e)}")
+            time.sleep(delay)
+
+# Query embeddings from concurrent requests are batched into a single upstream call
+embedding_batcher = EmbeddingBatcher(get_embeddings)
+
+async def embed_query(text: str, dimensionality=None):
+    # Query vectors must match the dimensionality of the generation being searched
+    dimensionality = dimensionality or active_embedding_dim()
+    if embedding_batcher.window_ms <= 0:
+        return await asyncio.to_thread(get_embedding, text, dimensionality=dimensionality)
+    return await embedding_batcher.embed(text, dimensionality=dimensionality)
+
+async def embed_query_with_fallback(text: str):
+    """Returns (embedding, degraded_reason). When the embedding upstream
+    fails, times out or has its circuit open, a recently computed embedding
+    of the same text is reused; failing that the embedding is None and the
+    caller falls back to lexical search."""
+    dimensionality = active_embedding_dim()
+    try:
+        embedding = await asyncio.wait_for(embed_query(text, dimensionality), EMBED_QUERY_TIMEOUT)
+    except Exception as e:
+        reason = "embedding timed out" if isinstance(e, asyncio.TimeoutError) else f"embedding failed: {str(e)}"
+        cached = recent_embeddings.get(text, dimensionality)
+        if cached is not None:
+            FALLBACKS.inc(kind="recent_embedding")
+            return cached, f"{reason}, reused a recent embedding"
+        print(f"Query embedding unavailable ({reason})")
+        return None, reason
+    recent_embeddings.put(text, dimensionality, embedding)
+    return embedding, None
+
+def build_enhancement_prompt(query):
+    return f"""
+            You are a search query enhancer for Vitess documentation search system.
+            Your task is to improve the user's search query to make it more effective for semantic search in a vector database.
             
-            if last_space != -1:  # If we found a space
-                end = last_space  # Cut at the space
-            # If no space found (very rare for large chunks), we'd cut at max_chars
-        
-        # Add the chunk and move to next position
-        chunks.append(normalized_content[start:end])
-        start = end + 1  # Skip the space
-    
-    return chunks
+            Original query: "{query}"
+            
+            Enhance this query by:
+            1. Expanding the user query to make it more accurate in vector database search
+            2. Expanding abbreviations like 'CLI' to 'Command Line Interface'
+            3. Including synonyms for technical terms
+            4. Improving specificity while maintaining the original intent
+            
+            Return ONLY the enhanced query text with no explanations or additional text.
+            """
 
-def load_vitess_docs_to_chroma(yaml_path: str):
-    # Load YAML file
-    with open(yaml_path, 'r', encoding='utf-8') as file:
-        data = yaml.safe_load(file)
+def build_summary_prompt(query, formatted_content):
+    return f"""
+You are a technical documentation assistant for Vitess. Your task is to answer the user's question about CLI commands and operations using the provided documentation snippets.
+
+Follow these guidelines when creating your response:
+1. Answer the question clearly and concisely based on the documentation provided
+2. Maintain technical accuracy and use Vitess terminology correctly
+3. Format your response with proper markdown for readability
+4. When referencing specific parts of the documentation, use citations like [1], [2], etc.
+5. For code examples or CLI commands, use proper markdown code blocks with appropriate syntax highlighting
+6. At the end of your response, include a "References" section with numbered links to the source documentation
+7. IMPORTANT: In the References section, ensure each unique URL appears only once. Do not duplicate URLs.
+   Example of correct formatting:
+   References:
+   [1] https://vitess.io/docs/22.0/overview/
+   [2] https://vitess.io/docs/22.0/overview/architecture/
+
+User question: {query}
+
+Here are the documentation snippets:
+{formatted_content}
+"""
+
+def count_chunks_per_parent(metadatas):
+    # A deduplicated chunk counts towards every version's copy of its page
+    parent_ids = {}
+    for metadata in metadatas:
+        for version in metadata_versions(metadata) or [None]:
+            parent_id = resolve_version_metadata(metadata, version).get('id_parent', 'unknown')
+            parent_ids[parent_id] = parent_ids.get(parent_id, 0) + 1
+    return parent_ids
+
+def print_parent_summary(metadatas, label):
+    parent_ids = count_chunks_per_parent(metadatas)
     
-    collection = chroma_client.get_or_create_collection(name="vitess_docs_v1", metadata={"hnsw:space": "cosine"})
+    print(f"\nSummary of Parent IDs {label}:")
+    for parent_id, count in parent_ids.items():
+        print(f"  Parent ID {parent_id}: {count} chunks")
+    print(f"Total unique parent IDs: {len(parent_ids)}")
+
+def build_generation(yaml_path: str):
+    """Build a new index generation from the YAML file, validate it and flip
+    the alias to it. Queries keep using the current generation throughout."""
+    if not ingestion_lock.acquire(blocking=False):
+        print("Ingestion already running, skipping")
+        return None
     
-    # Check if collection is empty
-    if collection.count() == 0:
-        print("ChromaDB collection is empty. Loading Vitess documentation...")
+    try:
+        # Load YAML file
+        docs = load_yaml_docs(yaml_path)
+        
+        generation_name = new_generation_name(COLLECTION_NAME)
+        collection = chroma_client.create_collection(
+            name=generation_name,
+            metadata={
+                "hnsw:space": "cosine",
+                "source": yaml_path,
+                "embedding_dim": EMBEDDING_DIM,
+                "embedding_dtype": EMBEDDING_DTYPE
+            }
+        )
+        print(f"Building generation {generation_name} from {yaml_path} ({EMBEDDING_DIM}-d {EMBEDDING_DTYPE})...")
+        
         documents = []
         embeddings = []
         metadatas = []
         ids_list = []
+        record_positions = {}  # content-addressed ID -> position in the lists above
+        total_records = 0
+        
+        ingest_start = time.perf_counter()
         
-        for doc in data.get('vitess', []):
-            content = doc.get('content', '').strip()
+        pending = []  # Records waiting for the next embedding batch, all of one title
+        pending_positions = {}  # content-addressed ID -> position in pending
+
+        def embed_pending():
+            if not pending:
+                return
+            try:
+                embed_start = time.perf_counter()
+                batch_embeddings = get_ingest_embeddings([record.document for record in pending],
+                                                         title=pending[0].title, dimensionality=EMBEDDING_DIM)
+                INGEST_EMBED_SECONDS.observe(time.perf_counter() - embed_start)
+                for record, embedding in zip(pending, batch_embeddings):
+                    INGEST_CHUNKS.inc(status="embedded")
+                    documents.append(record.document)
+                    embeddings.append(embedding)
+                    metadatas.append(record.metadata)
+                    ids_list.append(record.id)
+                    record_positions[record.id] = len(ids_list) - 1
+                    
+                    # Print with id_parent for tracking
+                    print(f"Processed document: ID {record.metadata.get('id_parent', 'unknown')} - "
+                          f"{record.metadata.get('title', 'Untitled')} (chunk {int(record.metadata['chunk_index']) + 1}"
+                          f"/{record.metadata['total_chunks']})")
+            except Exception as e:
+                INGEST_CHUNKS.inc(len(pending), status="failed")
+                print(f"Error embedding {len(pending)} chunks of {pending[0].title}: {str(e)}")
+            pending.clear()
+            pending_positions.clear()
+        
+        # Normalizing, chunking and metadata construction run in a process pool;
+        # records arrive here in input order through a bounded queue
+        for record in iter_chunk_records(docs):
+            total_records += 1
             
-            if content:
-                # Split content if it exceeds token limit
-                content_chunks = split_content_by_tokens(content)
-                
-                for i, chunk in enumerate(content_chunks):
-                    try:
-                        # Create metadata directly from the YAML entry, excluding content
-                        metadata = {k: str(v) for k, v in doc.items() if k != 'content'}
-                        
-                        # Add only chunk index information
-                        metadata['chunk_index'] = str(i)
-                        metadata['total_chunks'] = str(len(content_chunks))
-                        
-                        # Extract id_parent for logging
-                        id_parent = doc.get('id_parent', 'unknown')
-                        
-                        # Pass the title for embedding context
-                        embedding = get_embedding(chunk, title=doc.get('title', 'Vitess Documentation'))
-                        documents.append(chunk)
-                        embeddings.append(embedding)
-                        metadatas.append(metadata)
-                        ids_list.append(str(uuid.uuid4()))
-                        
-                        # Print with id_parent for tracking
-                        print(f"Processed document: ID {id_parent} - {doc.get('title', 'Untitled')} (chunk {i+1}/{len(content_chunks)})")
-                    except Exception as e:
-                        id_parent = doc.get('id_parent', 'unknown')
-                        print(f"Error processing document chunk {i+1} from ID {id_parent} - {doc.get('title', '')}: {str(e)}")
+            # The same chunk from another version only adds its version to the stored record
+            if record.id in record_positions:
+                merge_version_metadata(metadatas[record_positions[record.id]], record.metadata)
+                INGEST_CHUNKS.inc(status="deduplicated")
+                continue
+            if record.id in pending_positions:
+                merge_version_metadata(pending[pending_positions[record.id]].metadata, record.metadata)
+                INGEST_CHUNKS.inc(status="deduplicated")
+                continue
+            
+            # One batch per title, since the title is passed along for embedding context
+            if pending and (record.title != pending[0].title or len(pending) >= INGEST_EMBED_BATCH_SIZE):
+                embed_pending()
+            pending_positions[record.id] = len(pending)
+            pending.append(record)
+        embed_pending()
         
         try:
-            collection.upsert(
-                ids=ids_list,
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas
-            )
-            print(f"Loaded {len(documents)} document chunks into ChromaDB")
+            # Upsert in batches so a rebuild doesn't hold the Chroma server in one long write
+            for start in range(0, len(ids_list), INGEST_UPSERT_BATCH_SIZE):
+                end = start + INGEST_UPSERT_BATCH_SIZE
+                upsert_start = time.perf_counter()
+                collection.upsert(
+                    ids=ids_list[start:end],
+                    documents=documents[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end]
+                )
+                INGEST_UPSERT_SECONDS.observe(time.perf_counter() - upsert_start)
             
-            # Print summary of parent IDs processed
-            parent_ids = {}
-            for metadata in metadatas:
-                parent_id = metadata.get('id_parent', 'unknown')
-                parent_ids[parent_id] = parent_ids.get(parent_id, 0) + 1
-            
-            print("\nSummary of Parent IDs processed:")
-            for parent_id, count in parent_ids.items():
-                print(f"  Parent ID {parent_id}: {count} chunks")
-            print(f"Total unique parent IDs: {len(parent_ids)}")
+            ingest_seconds = time.perf_counter() - ingest_start
+            chunks_per_second = len(documents) / ingest_seconds if ingest_seconds > 0 else 0.0
+            INGEST_CHUNKS_PER_SECOND.set(chunks_per_second)
+            print(f"Loaded {len(documents)} document chunks into {generation_name} in {ingest_seconds:.1f}s ({chunks_per_second:.1f} chunks/sec)")
+            if documents:
+                print(f"Deduplicated {total_records} chunks across versions into {len(documents)} unique chunks "
+                      f"(dedupe ratio {total_records / len(documents):.2f}x)")
             
+            # Print summary of parent IDs processed
+            print_parent_summary(metadatas, "processed")
         except Exception as e:
             print(f"Error during upsert: {str(e)}")
             for i in range(min(5, len(metadatas))):
                 print(f"Sample metadata {i}: {metadatas[i]}")
+        
+        # Only a generation that passes validation goes live
+        report = validate_generation(collection, ids_list, embeddings, len(ids_list))
+        report["generation"] = generation_name
+        if not report["ok"]:
+            print(f"Generation {generation_name} failed validation ({report['reason']}), keeping current generation")
+            chroma_client.delete_collection(generation_name)
+            return report
+        
+        # Export before the flip so workers find the snapshot (or sidecar) as soon as they see the new alias
+        if SNAPSHOTS_ENABLED:
+            publish_snapshot(collection)
+        else:
+            publish_sidecar(generation_name, documents, metadatas, embeddings)
+        generation_alias.flip(generation_name)
+        generation_alias.prune()
+        state = generation_alias.read()
+        prune_snapshots({state["active"], state["previous"]}, SNAPSHOT_DIR if SNAPSHOTS_ENABLED else SIDECAR_DIR)
+        refresh_local_index()
+        return report
+    finally:
+        ingestion_lock.release()
+
+def load_vitess_docs_to_chroma(yaml_path: str):
+    collection = generation_alias.active_collection()
+    
+    # Build the first generation if the alias doesn't point at one yet
+    if collection is None:
+        print("No active ChromaDB generation. Loading Vitess documentation...")
+        build_generation(yaml_path)
     else:
-        print(f"ChromaDB collection already contains {collection.count()} documents")
+        print(f"ChromaDB generation {collection.name} already contains {collection.count()} documents")
         
         # Print summary of parent IDs in the existing collection
         try:
             results = collection.get(include=['metadatas'])
             if results and 'metadatas' in results and results['metadatas']:
-                parent_ids = {}
-                for metadata in results['metadatas']:
-                    parent_id = metadata.get('id_parent', 'unknown')
-                    parent_ids[parent_id] = parent_ids.get(parent_id, 0) + 1
-                
-                print("\nSummary of Parent IDs in existing collection:")
-                for parent_id, count in parent_ids.items():
-                    print(f"  Parent ID {parent_id}: {count} chunks")
-                print(f"Total unique parent IDs: {len(parent_ids)}")
+                print_parent_summary(results['metadatas'], "in existing collection")
         except Exception as e:
             print(f"Error getting parent ID summary: {str(e)}")
 
+def get_active_collection():
+    collection = generation_alias.active_collection()
+    if collection is None:
+        raise HTTPException(status_code=503, detail="No index generation is active yet")
+    return collection
+
+def active_embedding_dim():
+    collection = generation_alias.active_collection()
+    metadata = collection.metadata if collection is not None and collection.metadata else {}
+    return int(metadata.get("embedding_dim", 768))
+
+def get_corpus_generation():
+    # Cached answers are only valid for the generation they were generated from
+    return generation_alias.active_name()
+
+def publish_snapshot(collection):
+    try:
+        export_snapshot(collection)
+    except Exception as e:
+        print(f"Error exporting snapshot of {collection.name}: {str(e)}")
+
+def publish_sidecar(generation, documents, metadatas, embeddings, dtype=EMBEDDING_DTYPE):
+    try:
+        export_sidecar(generation, documents, metadatas, embeddings, dtype)
+    except Exception as e:
+        print(f"Error exporting sidecar of {generation}: {str(e)}")
+
+def ensure_snapshot():
+    """Export the active generation if it has no snapshot yet. Runs under the
+    ingestion lock, so of several starting workers only one exports."""
+    if not ingestion_lock.acquire(blocking=False):
+        return
+    try:
+        collection = generation_alias.active_collection()
+        if collection is not None and snapshot_path(collection.name) is None:
+            publish_snapshot(collection)
+    finally:
+        ingestion_lock.release()
+
+def loaded_generation():
+    loaded = next((index for index in (lexical_index, page_index, suggest_index, related_graph) if index is not None), None)
+    return loaded.generation if loaded is not None else None
+
+def refresh_local_index():
+    """Point the local indexes at the active generation: its mmap'd snapshot
+    when snapshots are enabled, otherwise an in-memory lexical index and
+    the page index, typeahead and related-pages graph from its sidecar"""
+    global lexical_index, snapshot, page_index, suggest_index, related_graph
+    if not local_index_lock.acquire(blocking=False):
+        return
+    try:
+        collection = generation_alias.active_collection()
+        if collection is None or loaded_generation() == collection.name:
+            return
+        start = time.perf_counter()
+        if SNAPSHOTS_ENABLED:
+            # Never build a private copy per worker; wait for the shared snapshot
+            path = snapshot_path(collection.name)
+            if path is None:
+                return
+            snapshot = Snapshot(path)
+            lexical_index = snapshot.lexical
+            page_index = snapshot.pages
+            suggest_index = snapshot.suggest
+            related_graph = snapshot.related
+            print(f"Mapped snapshot of {collection.name}: {len(snapshot)} chunks in {time.perf_counter() - start:.2f}s")
+        else:
+            # The derived indexes come from the sidecar ingestion wrote; only a
+            # generation without one (built before sidecars) is read here, in a
+            # single pass shared with the lexical index, and gets one written
+            chunks = None
+            sidecar = load_sidecar(collection.name)
+            if sidecar is None:
+                chunks = read_chunks(collection)
+                dtype = (collection.metadata or {}).get("embedding_dtype", "float32")
+                publish_sidecar(collection.name, chunks['documents'], chunks['metadatas'], chunks['embeddings'], dtype)
+                sidecar = load_sidecar(collection.name) or (None, None, None)
+            page_index, suggest_index, related_graph = sidecar
+            print(f"Loaded sidecar of {collection.name} in {time.perf_counter() - start:.2f}s")
+            if LEXICAL_FALLBACK_ENABLED:
+                start = time.perf_counter()
+                if chunks is None:
+                    chunks = read_chunks(collection, include=('documents', 'metadatas'))
+                lexical_index = LexicalIndex.from_documents(collection.name, chunks['documents'], chunks['metadatas'])
+                print(f"Built lexical fallback index for {collection.name}: "
+                      f"{len(lexical_index)} chunks in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        print(f"Error loading local index: {str(e)}")
+    finally:
+        local_index_lock.release()
+
+def refresh_local_index_async():
+    if not local_index_lock.locked():
+        threading.Thread(target=refresh_local_index, daemon=True).start()
+
+def current_local_indexes():
+    """(snapshot, lexical_index, page_index) as loaded, any may be None. A
+    reload is started in the background when the alias has moved to a new
+    generation; until then the previous generation's lexical index still
+    serves as fallback, but its snapshot and page index are not used for
+    vector search."""
+    try:
+        active = generation_alias.active_name()
+    except Exception:
+        active = None  # Chroma unreachable: keep whatever is loaded
+    if active is not None and loaded_generation() != active:
+        refresh_local_index_async()
+    current_snapshot = snapshot if snapshot is not None and snapshot.generation == active else None
+    current_pages = page_index if page_index is not None and page_index.generation == active else None
+    return current_snapshot, lexical_index, current_pages
+
+def search_chunks(request, query_text, query_embedding, n_results):
+    """Vector search of the active generation. Without a query embedding,
+    or if Chroma fails, the lexical index answers instead. With
+    PAGE_SEARCH_PAGES set and a page index loaded, the search is two-stage:
+    the closest pages are picked first and only their chunks are searched.
+    Returns (formatted_results, their embeddings or None, degraded_reason);
+    lexical results come without embeddings."""
+    local_snapshot, local_lexical, local_pages = current_local_indexes()
+    n_pages = PAGE_SEARCH_PAGES if local_pages is not None else 0
+    if query_embedding is not None:
+        try:
+            if LOCAL_VECTOR_SEARCH and local_snapshot is not None:
+                with stage("local_vector_search"):
+                    results, embeddings = local_snapshot.vector_search(
+                        query_embedding, n_results, request.version, request.include_resources, n_pages,
+                        include_embeddings=True
+                    )
+                return results, embeddings, None
+            collection = get_active_collection()
+            where_filter = build_where_filter(request.version, request.include_resources)
+            if n_pages:
+                with stage("page_search"):
+                    page_keys = local_pages.top_page_keys(
+                        query_embedding, n_pages, request.version, request.include_resources
+                    )
+                if not page_keys:
+                    return [], None, None
+                where_filter = restrict_to_pages(where_filter, page_keys)
+            with stage("chroma_query"):
+                results = call_upstream(
+                    "chroma", "query",
+                    collection.query,
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where=where_filter if where_filter else None,
+                    include=['documents', 'metadatas', 'distances', 'embeddings']
+                )
+            with stage("format_results"):
+                embeddings = results.get('embeddings')
+                return (format_query_results(results, request.version),
+                        embeddings[0] if embeddings is not None and len(embeddings) else None, None)
+        except Exception as e:
+            if local_lexical is None:
+                raise
+            print(f"Vector search failed, using lexical index: {str(e)}")
+            reason = "vector search failed, used lexical search"
+    else:
+        reason = "used lexical search"
+        if local_lexical is None:
+            raise HTTPException(status_code=503, detail="Embedding service unavailable and no lexical index is loaded")
+    FALLBACKS.inc(kind="lexical")
+    with stage("lexical_search"):
+        if local_snapshot is not None:
+            results = local_snapshot.lexical_search(query_text, n_results, request.version, request.include_resources)
+        else:
+            results = local_lexical.search(query_text, n_results, request.version, request.include_resources)
+        return results, None, reason
+
+def retrieve(request, query_text, query_embedding, rerank_query=None):
+    """Retrieval shared by the query endpoints: over-fetch candidates with
+    their embeddings, optionally rerank them, then pick the final results
+    with MMR and the per-page cap (see retrieval.py). rerank_query is the
+    text the reranker scores against, the search text by default.
+    Returns (results, where_filter, rerank_stats, degraded_reason)."""
+    rerank = getattr(request, "rerank", False)
+    final_k = request.rerank_top_k if rerank else request.n_results
+    mmr_lambda = MMR_LAMBDA if request.mmr_lambda is None else request.mmr_lambda
+    max_per_parent = MAX_CHUNKS_PER_PARENT if request.max_per_parent is None else request.max_per_parent
+    diversified = mmr_lambda < 1 or max_per_parent > 0
+    n_candidates = max(request.rerank_candidates if rerank else 0,
+                       final_k * MMR_FETCH_FACTOR if diversified else final_k)
+
+    where_filter = build_where_filter(request.version, request.include_resources)
+    results, embeddings, degraded = search_chunks(request, query_text, query_embedding, n_candidates)
+
+    # Rescore every candidate; the final cut is made below
+    rerank_stats = None
+    relevance = None
+    if rerank and results:
+        with stage("rerank"):
+            for i, result in enumerate(results):
+                result['_candidate'] = i
+            results, rerank_stats = rerank_results(
+                rerank_query or query_text, results, len(results), version=request.version
+            )
+            order = [result.pop('_candidate') for result in results]
+            if embeddings is not None:
+                embeddings = [embeddings[i] for i in order]
+            # Rerank scores aren't on the similarity scale and unscored candidates have none, so rank stands in
+            relevance = [len(results) - rank for rank in range(len(results))]
+
+    if diversified and results:
+        with stage("diversify"):
+            results = diversify(results, embeddings, final_k, mmr_lambda, max_per_parent, relevance)
+    results = results[:final_k]
+
+    # See also links from the precomputed graph, a slice per result
+    graph = related_graph
+    if RELATED_IN_RESULTS and graph is not None and graph.generation == loaded_generation():
+        for result in results:
+            # A copy, since local indexes hand out their own metadata dicts
+            metadata = result['metadata']
+            result['metadata'] = {**metadata, 'related': graph.related(metadata.get('id_parent', ''), RELATED_IN_RESULTS) or []}
+    return results, where_filter, rerank_stats, degraded
+
+async def retrieve_with_fallback(request, query_text, query_embedding, rerank_query=None):
+    """retrieve() off the event loop, bounded by CHROMA_QUERY_TIMEOUT. When
+    vector search doesn't finish in time the lexical index answers instead,
+    like it does when the query embedding is unavailable."""
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(retrieve, request, query_text, query_embedding, rerank_query),
+            CHROMA_QUERY_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        if query_embedding is None:
+            raise HTTPException(status_code=504, detail="Search timed out")
+        print(f"Vector search timed out after {CHROMA_QUERY_TIMEOUT}s, using lexical index")
+    results, where_filter, rerank_stats, _ = await asyncio.to_thread(retrieve, request, query_text, None, rerank_query)
+    return results, where_filter, rerank_stats, "vector search timed out, used lexical search"
+
+def degraded_fields(*reasons):
+    reasons = [reason for reason in reasons if reason]
+    return {"degraded": bool(reasons), "degraded_reason": "; ".join(reasons) if reasons else None}
+
+def format_query_results(results, version):
+    formatted_results = []
+    if results['documents'] and results['documents'][0]:
+        for i in range(len(results['documents'][0])):
+            result = {
+                'document': results['documents'][0][i],
+                # Show the URL and id_parent of the requested version's copy of the page
+                'metadata': resolve_version_metadata(results['metadatas'][0][i], version),
+                'similarity_score': 1 - results['distances'][0][i]
+            }
+            formatted_results.append(result)
+    return formatted_results
+
+def enforce_rate_limit(http_request, endpoint):
+    retry_after = rate_limiter.check(client_key(http_request))
+    if retry_after:
+        ADMISSION_REJECTED.inc(endpoint=endpoint, reason="rate_limited")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": str(retry_after)})
+
+def generation_unavailable(endpoint, request, error):
+    """Raise for callers that opted out of degraded answers (429 when
+    overloaded, 503 when the circuit is open, 502 when the upstream failed
+    after retries), otherwise return the reason the answer is degraded"""
+    rejected = isinstance(error, (Overloaded, CircuitOpenError))
+    reason = error.reason if rejected else f"failed: {str(error)}"
+    if not request.allow_degraded:
+        ADMISSION_REJECTED.inc(endpoint=endpoint, reason=error.reason.replace(" ", "_") if rejected else "upstream_error")
+        if not rejected:
+            raise HTTPException(status_code=502, detail=f"Generation failed ({str(error)})")
+        raise HTTPException(
+            status_code=503 if isinstance(error, CircuitOpenError) else 429,
+            detail=f"Generation unavailable ({error.reason})",
+            headers={"Retry-After": str(error.retry_after)}
+        )
+    ADMISSION_REJECTED.inc(endpoint=endpoint, reason="degraded")
+    print(f"Degraded {endpoint} response: generation {reason}")
+    return f"generation {reason}, no summary"
+
+def prepare_index(yaml_path="vitess_docs.yaml"):
+    """Build the first generation if there is none, and export its snapshot"""
+    if os.path.exists(yaml_path):
+        load_vitess_docs_to_chroma(yaml_path)
+    else:
+        print(f"Warning: YAML file {yaml_path} not found")
+    if SNAPSHOTS_ENABLED:
+        ensure_snapshot()
+
 @app.on_event("startup")
 async def startup_db_client():
     try:
-        yaml_path = "vitess_docs.yaml"
-        if os.path.exists(yaml_path):
-            load_vitess_docs_to_chroma(yaml_path)
+        if SKIP_STARTUP_INGEST:
+            print("Index prepared by the serving parent, skipping startup ingestion")
         else:
-            print(f"Warning: YAML file {yaml_path} not found")
+            prepare_index()
+        # Loaded off the event loop; the lexical fallback is unavailable until it finishes
+        refresh_local_index_async()
     except Exception as e:
         print(f"Error initializing ChromaDB: {str(e)}")
 
 @app.post("/query")
 async def query_docs(request: QueryRequest):
     try:
-        query_embedding = get_embedding(request.query)
-        collection = chroma_client.get_collection("vitess_docs_v1")
-        
-        # Build the filter based on version_or_commonresource and resource inclusion
-        where_filter = {}
-        
-        # Use version_or_commonresource field instead of version
-        if request.version:
-            # Create an OR condition to include both the specified version and common resources
-            if request.include_resources:
-                where_filter = {
-                    "$or": [
-                        {"version_or_commonresource": request.version},  # Match specific version
-                        {"title": {"$in": [                             # Include common resources
-                            "Learning Resources", 
-                            "Contribute", 
-                            "Troubleshoot", 
-                            "FAQ", 
-                            "Releases", 
-                            "Roadmap", 
-                            "Design Docs"
-                        ]}}
-                    ]
-                }
-            else:
-                # Just filter by version_or_commonresource
-                where_filter = {"version_or_commonresource": request.version}
-        
-        # Execute the query with appropriate filters
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=request.n_results,
-            where=where_filter if where_filter else None,
-            include=['documents', 'metadatas', 'distances']
-        )
+        with stage("embedding"):
+            query_embedding, embedding_degraded = await embed_query_with_fallback(request.query)
         
-        # Format results
-        formatted_results = []
-        if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
-                result = {
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'similarity_score': 1 - results['distances'][0][i]
-                }
-                formatted_results.append(result)
+        # Search with the version filter and diversify the results
+        formatted_results, where_filter, _, search_degraded = await retrieve_with_fallback(
+            request, request.query, query_embedding
+        )
         
-        return {
+        return FastJSONResponse(shape_response({
             "results": formatted_results,
-            "filter_used": where_filter if where_filter else "None"
-        }
+            "filter_used": where_filter if where_filter else "None",
+            **degraded_fields(embedding_degraded, search_degraded)
+        }, request))
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -271,8 +825,9 @@ async def query_docs(request: QueryRequest):
 @app.post("/test")
 async def test_embedding(request: EmbeddingRequest):
     try:
-        embedding = get_embedding(request.text)
-        return {"embedding": embedding}
+        # Blocking client call with retry sleeps; kept off the event loop
+        embedding = await asyncio.to_thread(get_embedding, request.text)
+        return FastJSONResponse({"embedding": embedding})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -280,8 +835,8 @@ async def test_embedding(request: EmbeddingRequest):
 async def test_gemini_flash(request: TestGeminiRequest):
     try:
         # Generate content using gemini-2.0-flash model
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
+        response = await asyncio.to_thread(
+            generate_content,
             contents=request.prompt
         )
         
@@ -296,6 +851,35 @@ async def test_gemini_flash(request: TestGeminiRequest):
 async def root():
     return {"message": "Vitess Documentation Search API - Use /docs to see the API documentation"}
 
+@app.get("/suggest")
+async def suggest(q: str, version: Optional[str] = "v22.0 (Development)", include_resources: bool = True,
+                  limit: int = SUGGEST_LIMIT):
+    # Typeahead from the loaded index only: no Chroma or Gemini calls, so no alias check either
+    index = suggest_index
+    if index is None:
+        refresh_local_index_async()
+        raise HTTPException(status_code=503, detail="Suggestion index not loaded yet")
+    start = time.perf_counter()
+    suggestions = index.suggest(q, version, include_resources, max(1, min(limit, 50)))
+    return FastJSONResponse({
+        "query": q,
+        "suggestions": suggestions,
+        "generation": index.generation,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+    })
+
+@app.get("/related/{id_parent}")
+async def get_related(id_parent: str, k: int = RELATED_PAGES_K):
+    # Pages closest to this page copy (same version or common resources), precomputed at ingestion
+    graph = related_graph
+    if graph is None:
+        refresh_local_index_async()
+        raise HTTPException(status_code=503, detail="Related pages graph not loaded yet")
+    related = graph.related(id_parent, max(0, k))
+    if related is None:
+        raise HTTPException(status_code=404, detail=f"Page {id_parent} not found in {graph.generation}")
+    return FastJSONResponse({"id_parent": id_parent, "generation": graph.generation, "related": related})
+
 @app.get("/versions")
 async def get_versions():
     try:
@@ -316,27 +900,29 @@ async def get_versions():
         ]
         
         # Get actually available versions in the database
-        collection = chroma_client.get_collection("vitess_docs_v1")
+        collection = get_active_collection()
         results = collection.get(include=['metadatas'])
         
         db_versions = set()
         if results and 'metadatas' in results and results['metadatas']:
             for metadata in results['metadatas']:
-                if metadata and 'version_or_commonresource' in metadata and metadata['version_or_commonresource']:
-                    db_versions.add(metadata['version_or_commonresource'])
+                if metadata:
+                    db_versions.update(v for v in metadata_versions(metadata) if v)
         
         # Return both the predefined list and what's in the database
         return {
             "available_versions": available_versions,
             "database_versions": sorted(list(db_versions))
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/chromadb-stats")
 async def get_chromadb_stats():
     try:
-        collection = chroma_client.get_collection("vitess_docs_v1")
+        collection = get_active_collection()
         
         # Get total count
         total_count = collection.count()
@@ -371,9 +957,9 @@ async def get_chromadb_stats():
                 if not metadata:
                     continue
                     
-                # Track versions
-                version = metadata.get('version_or_commonresource', 'unknown')
-                versions[version] = versions.get(version, 0) + 1
+                # Track versions; a deduplicated chunk counts once for each version it belongs to
+                for version in metadata_versions(metadata) or ['unknown']:
+                    versions[version] = versions.get(version, 0) + 1
                 
                 # Track titles
                 title = metadata.get('title', 'untitled')
@@ -435,8 +1021,10 @@ async def get_chromadb_stats():
         
         return {
             "collection_info": {
-                "name": "vitess_docs_v1",
+                "name": collection.name,
                 "total_records": total_count,
+                # Chunks referenced by all versions per stored chunk
+                "dedupe_ratio": sum(versions.values()) / total_count if total_count else 0,
                 "unique_documents": len(doc_chunk_counts),
                 "multi_chunk_documents": multi_chunk_docs,
                 "max_chunks_per_document": max(doc_chunk_counts.values()) if doc_chunk_counts else 0
@@ -457,14 +1045,102 @@ async def get_chromadb_stats():
             },
             "url_domains": url_domains
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+@app.get("/generations")
+async def get_generations():
+    try:
+        return {
+            "alias": generation_alias.read(),
+            "generations": generation_alias.list_generations(),
+            "ingestion_running": ingestion_lock.locked(),
+            "ingestion_holder": ingestion_lock.holder()
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/reindex")
+async def reindex(background_tasks: BackgroundTasks):
+    yaml_path = "vitess_docs.yaml"
+    if not os.path.exists(yaml_path):
+        raise HTTPException(status_code=404, detail=f"YAML file {yaml_path} not found")
+    if ingestion_lock.locked():
+        raise HTTPException(status_code=409, detail="Ingestion already running")
     
+    # Runs in the threadpool after the response; queries keep using the active generation
+    background_tasks.add_task(build_generation, yaml_path)
+    return {"status": "started", "active_generation": generation_alias.active_name()}
+
+@app.post("/rollback")
+async def rollback_generation():
+    try:
+        active = generation_alias.rollback()
+        refresh_local_index_async()
+        return {"status": "rolled_back", "active_generation": active}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return answer_cache.stats()
+
+@app.get("/circuit-breakers")
+async def get_circuit_breakers():
+    return {
+        "breakers": breaker_stats(),
+        "recent_embeddings": len(recent_embeddings),
+        "lexical_index": lexical_index.generation if lexical_index is not None else None
+    }
+
+@app.get("/local-index")
+async def get_local_index():
+    # Per worker: which generation this process has mapped
+    return {
+        "pid": os.getpid(),
+        "snapshot": snapshot.manifest if snapshot is not None else None,
+        "lexical_index": lexical_index.generation if lexical_index is not None else None,
+        "page_index": {"generation": page_index.generation, "pages": len(page_index)} if page_index is not None else None,
+        "page_search_pages": PAGE_SEARCH_PAGES,
+        "suggest_index": {"generation": suggest_index.generation, "keys": len(suggest_index)} if suggest_index is not None else None,
+        "related_graph": {"generation": related_graph.generation, "page_copies": len(related_graph)} if related_graph is not None else None,
+        "local_vector_search": LOCAL_VECTOR_SEARCH
+    }
+
+def require_admin(request: Request):
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/profiles")
+async def list_profiles(http_request: Request):
+    require_admin(http_request)
+    return {"enabled": PROFILING_ENABLED, "pid": os.getpid(), "profiles": profile_store.list()}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, http_request: Request, format: str = "collapsed"):
+    # collapsed: folded stacks for flamegraph.pl/speedscope; json: everything, stacks as a mapping
+    require_admin(http_request)
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    if format == "json":
+        return FastJSONResponse(profile)
+    return PlainTextResponse(collapsed_stacks(profile))
 
 @app.get("/inspect")
 async def inspect_database():
     try:
-        collection = chroma_client.get_collection("vitess_docs_v1")
+        collection = get_active_collection()
         count = collection.count()
         
         if count == 0:
@@ -482,8 +1158,7 @@ async def inspect_database():
         has_version_field = any('version_or_commonresource' in metadata for metadata in sample['metadatas'])
         version_values = set()
         for metadata in sample['metadatas']:
-            if 'version_or_commonresource' in metadata:
-                version_values.add(metadata['version_or_commonresource'])
+            version_values.update(metadata_versions(metadata))
         
         return {
             "status": "populated",
@@ -504,232 +1179,169 @@ async def inspect_database():
         return {"status": "error", "message": str(e)}
 
 @app.post("/enhance-query-cli")
-async def enhance_query_cli(request: EnhanceQueryCLIRequest):
+async def enhance_query_cli(request: EnhanceQueryCLIRequest, http_request: Request):
     try:
-        # Step 1: Enhance the query for better vector search
-        enhanced_query_response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=f"""
-            You are a search query enhancer for Vitess documentation search system.
-            Your task is to improve the user's search query to make it more effective for semantic search in a vector database.
-            
-            Original query: "{request.query}"
-            
-            Enhance this query by:
-            1. Expanding the user query to make it more accurate in vector database search
-            2. Expanding abbreviations like 'CLI' to 'Command Line Interface'
-            3. Including synonyms for technical terms
-            4. Improving specificity while maintaining the original intent
-            
-            Return ONLY the enhanced query text with no explanations or additional text.
-            """
-        )
+        enforce_rate_limit(http_request, "enhance-query-cli")
+        request_start = time.perf_counter()
+        
+        # Answers are cached against the original query, not the enhanced one
+        cache_embedding = None
+        if request.use_cache:
+            with stage("cache_lookup"):
+                cache_embedding, _ = await embed_query_with_fallback(request.query)
+                cache_scope = answer_cache_scope("enhance-query-cli", request)
+                cached_response = None
+                if cache_embedding is not None:
+                    cached_response, _ = answer_cache.lookup(cache_embedding, cache_scope, get_corpus_generation())
+            if cached_response is not None:
+                return FastJSONResponse(shape_response(cached_response, request))
         
-        enhanced_query = enhanced_query_response.text.strip()
+        # Step 1: Enhance the query for better vector search
+        generation_degraded = None
+        try:
+            async with generation_limiter.slot():
+                with stage("query_enhancement"):
+                    enhanced_query_response = await asyncio.to_thread(
+                        generate_content, contents=build_enhancement_prompt(request.query)
+                    )
+            enhanced_query = enhanced_query_response.text.strip()
+        except Exception as e:
+            # Overloaded, circuit open or failed after retries. Degraded: search
+            # with the question as asked and skip the summary
+            generation_degraded = generation_unavailable("enhance-query-cli", request, e)
+            enhanced_query = request.query
         
         # Step 2: Query the vector database with the enhanced query
-        query_embedding = get_embedding(enhanced_query)
-        collection = chroma_client.get_collection("vitess_docs_v1")
-        
-        # Build the filter based on version and resource inclusion
-        where_filter = {}
-        
-        if request.version:
-            if request.include_resources:
-                where_filter = {
-                    "$or": [
-                        {"version_or_commonresource": request.version},
-                        {"title": {"$in": [
-                            "Learning Resources", 
-                            "Contribute", 
-                            "Troubleshoot", 
-                            "FAQ", 
-                            "Releases", 
-                            "Roadmap", 
-                            "Design Docs"
-                        ]}}
-                    ]
-                }
-            else:
-                where_filter = {"version_or_commonresource": request.version}
-        
-        # Execute the query with appropriate filters
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=request.n_results,
-            where=where_filter if where_filter else None,
-            include=['documents', 'metadatas', 'distances']
-        )
+        with stage("embedding"):
+            query_embedding, embedding_degraded = await embed_query_with_fallback(enhanced_query)
         
-        # Format results
-        formatted_results = []
-        if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
-                result = {
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'similarity_score': 1 - results['distances'][0][i]
-                }
-                formatted_results.append(result)
+        # Search with the version filter, optionally rerank against the original
+        # query, and diversify the results
+        formatted_results, where_filter, rerank_stats, search_degraded = await retrieve_with_fallback(
+            request, enhanced_query, query_embedding, rerank_query=request.query
+        )
         
         # If no results found, return early
         if not formatted_results:
-            return {
+            return FastJSONResponse(shape_response({
                 "enhanced_query": enhanced_query,
                 "summary": "No results found for your query.",
                 "results": [],
-                "filter_used": where_filter if where_filter else "None"
-            }
+                "filter_used": where_filter if where_filter else "None",
+                **degraded_fields(generation_degraded, embedding_degraded, search_degraded)
+            }, request))
             
         # Step 3: Format the results into a structured text for Gemini
-        formatted_content = ""
-        for index, result in enumerate(formatted_results):
-            formatted_content += f"""
-Document {index + 1}: {result['metadata']['title']}
-Content: {result['document']}
-URL: {result['metadata']['url']}
-Version: {result['metadata']['version_or_commonresource']}
-Similarity Score: {(result['similarity_score'] * 100):.1f}%
-"""
+        with stage("prompt_construction"):
+            context_stats = None
+            if request.pack_context:
+                formatted_content, context_stats = pack_context(formatted_results, request.context_token_budget)
+                print(f"Packed context: {context_stats['tokens_before']} -> {context_stats['tokens_after']} tokens")
+            else:
+                formatted_content = format_snippets(formatted_results)
+            prompt = build_summary_prompt(request.query, formatted_content)
         
         # Step 4: Use Gemini to summarize the results based on the original query
-        summary_response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=f"""
-You are a technical documentation assistant for Vitess. Your task is to answer the user's question about CLI commands and operations using the provided documentation snippets.
-
-Follow these guidelines when creating your response:
-1. Answer the question clearly and concisely based on the documentation provided
-2. Maintain technical accuracy and use Vitess terminology correctly
-3. Format your response with proper markdown for readability
-4. When referencing specific parts of the documentation, use citations like [1], [2], etc.
-5. For code examples or CLI commands, use proper markdown code blocks with appropriate syntax highlighting
-6. At the end of your response, include a "References" section with numbered links to the source documentation
-7. IMPORTANT: In the References section, ensure each unique URL appears only once. Do not duplicate URLs.
-   Example of correct formatting:
-   References:
-   [1] https://vitess.io/docs/22.0/overview/
-   [2] https://vitess.io/docs/22.0/overview/architecture/
-
-User question: {request.query}
-
-Here are the documentation snippets:
-{formatted_content}
-"""
-        )
+        if generation_degraded is None:
+            try:
+                async with generation_limiter.slot():
+                    with stage("generation"):
+                        summary_response = await asyncio.to_thread(generate_content, contents=prompt)
+            except Exception as e:
+                generation_degraded = generation_unavailable("enhance-query-cli", request, e)
         
         # Return the enhanced query, Gemini-generated summary, and the raw search results
-        return {
+        response = {
             "enhanced_query": enhanced_query,
-            "summary": summary_response.text,
+            "summary": DEGRADED_SUMMARY if generation_degraded else summary_response.text,
             "results": formatted_results,
-            "filter_used": where_filter if where_filter else "None"
+            "filter_used": where_filter if where_filter else "None",
+            "rerank": rerank_stats,
+            "context": context_stats,
+            "cache": {"hit": False},
+            **degraded_fields(generation_degraded, embedding_degraded, search_degraded)
         }
+        # Degraded answers are never cached
+        if request.use_cache and cache_embedding is not None and not response["degraded"]:
+            latency_ms = (time.perf_counter() - request_start) * 1000
+            answer_cache.store(cache_embedding, cache_scope, get_corpus_generation(), request.query, response, latency_ms)
+        return FastJSONResponse(shape_response(response, request))
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in enhance query CLI: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/rawquery-cli")
-async def raw_query_cli(request: RawQueryCLIRequest):
+async def raw_query_cli(request: RawQueryCLIRequest, http_request: Request):
     try:
+        enforce_rate_limit(http_request, "rawquery-cli")
+        request_start = time.perf_counter()
+        
         # Use the raw query directly for vector search (no enhancement)
-        query_embedding = get_embedding(request.query)
-        collection = chroma_client.get_collection("vitess_docs_v1")
-        
-        # Build the filter based on version and resource inclusion
-        where_filter = {}
-        
-        if request.version:
-            if request.include_resources:
-                where_filter = {
-                    "$or": [
-                        {"version_or_commonresource": request.version},
-                        {"title": {"$in": [
-                            "Learning Resources", 
-                            "Contribute", 
-                            "Troubleshoot", 
-                            "FAQ", 
-                            "Releases", 
-                            "Roadmap", 
-                            "Design Docs"
-                        ]}}
-                    ]
-                }
-            else:
-                where_filter = {"version_or_commonresource": request.version}
-        
-        # Execute the query with appropriate filters
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=request.n_results,
-            where=where_filter if where_filter else None,
-            include=['documents', 'metadatas', 'distances']
-        )
+        with stage("embedding"):
+            query_embedding, embedding_degraded = await embed_query_with_fallback(request.query)
         
-        # Format results
-        formatted_results = []
-        if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
-                result = {
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'similarity_score': 1 - results['distances'][0][i]
-                }
-                formatted_results.append(result)
+        # A semantically similar earlier question skips retrieval and generation
+        cache_scope = answer_cache_scope("rawquery-cli", request)
+        if request.use_cache and query_embedding is not None:
+            with stage("cache_lookup"):
+                cached_response, _ = answer_cache.lookup(query_embedding, cache_scope, get_corpus_generation())
+            if cached_response is not None:
+                return FastJSONResponse(shape_response(cached_response, request))
+        
+        # Search with the version filter, optionally rerank, and diversify the results
+        formatted_results, where_filter, rerank_stats, search_degraded = await retrieve_with_fallback(
+            request, request.query, query_embedding
+        )
         
         # If no results found, return early
         if not formatted_results:
-            return {
+            return FastJSONResponse(shape_response({
                 "summary": "No results found for your query.",
                 "results": [],
-                "filter_used": where_filter if where_filter else "None"
-            }
+                "filter_used": where_filter if where_filter else "None",
+                **degraded_fields(embedding_degraded, search_degraded)
+            }, request))
             
         # Format the results into a structured text for Gemini
-        formatted_content = ""
-        for index, result in enumerate(formatted_results):
-            formatted_content += f"""
-Document {index + 1}: {result['metadata']['title']}
-Content: {result['document']}
-URL: {result['metadata']['url']}
-Version: {result['metadata']['version_or_commonresource']}
-Similarity Score: {(result['similarity_score'] * 100):.1f}%
-"""
+        with stage("prompt_construction"):
+            context_stats = None
+            if request.pack_context:
+                formatted_content, context_stats = pack_context(formatted_results, request.context_token_budget)
+                print(f"Packed context: {context_stats['tokens_before']} -> {context_stats['tokens_after']} tokens")
+            else:
+                formatted_content = format_snippets(formatted_results)
+            prompt = build_summary_prompt(request.query, formatted_content)
         
         # Use Gemini to summarize the results based on the original query
-        summary_response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=f"""
-You are a technical documentation assistant for Vitess. Your task is to answer the user's question about CLI commands and operations using the provided documentation snippets.
-
-Follow these guidelines when creating your response:
-1. Answer the question clearly and concisely based on the documentation provided
-2. Maintain technical accuracy and use Vitess terminology correctly
-3. Format your response with proper markdown for readability
-4. When referencing specific parts of the documentation, use citations like [1], [2], etc.
-5. For code examples or CLI commands, use proper markdown code blocks with appropriate syntax highlighting
-6. At the end of your response, include a "References" section with numbered links to the source documentation
-7. IMPORTANT: In the References section, ensure each unique URL appears only once. Do not duplicate URLs.
-   Example of correct formatting:
-   References:
-   [1] https://vitess.io/docs/22.0/overview/
-   [2] https://vitess.io/docs/22.0/overview/architecture/
-
-User question: {request.query}
-
-Here are the documentation snippets:
-{formatted_content}
-"""
-        )
+        generation_degraded = None
+        try:
+            async with generation_limiter.slot():
+                with stage("generation"):
+                    summary_response = await asyncio.to_thread(generate_content, contents=prompt)
+        except Exception as e:
+            generation_degraded = generation_unavailable("rawquery-cli", request, e)
         
         # Return the Gemini-generated summary and the raw search results
-        return {
-            "summary": summary_response.text,
+        response = {
+            "summary": DEGRADED_SUMMARY if generation_degraded else summary_response.text,
             "results": formatted_results,
-            "filter_used": where_filter if where_filter else "None"
+            "filter_used": where_filter if where_filter else "None",
+            "rerank": rerank_stats,
+            "context": context_stats,
+            "cache": {"hit": False},
+            **degraded_fields(generation_degraded, embedding_degraded, search_degraded)
         }
+        # Degraded answers are never cached
+        if request.use_cache and query_embedding is not None and not response["degraded"]:
+            latency_ms = (time.perf_counter() - request_start) * 1000
+            answer_cache.store(query_embedding, cache_scope, get_corpus_generation(), request.query, response, latency_ms)
+        return FastJSONResponse(shape_response(response, request))
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in raw query CLI: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
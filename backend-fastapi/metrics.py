@@ -0,0 +1,225 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus metrics (text exposition format 0.0.4) and
+# request-scoped timing spans. Stage timings are recorded both into a
+# histogram and into the timer of the current request, which the HTTP
+# middleware can echo back in an X-Timing header.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_current_timer = contextvars.ContextVar("current_timer", default=None)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_value(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["buckets"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+        lines.append(f"{self.name}_bucket{labels} {state['count']}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Query path
+REQUEST_SECONDS = Histogram(
+    "vitess_rag_request_seconds", "End-to-end HTTP request latency", ("path", "status")
+)
+STAGE_SECONDS = Histogram(
+    "vitess_rag_stage_seconds", "Latency of individual query pipeline stages", ("endpoint", "stage")
+)
+UPSTREAM_ERRORS = Counter(
+    "vitess_rag_upstream_errors_total", "Failed calls to upstream services", ("upstream", "operation")
+)
+UPSTREAM_RETRIES = Counter(
+    "vitess_rag_upstream_retries_total", "Retried calls to upstream services", ("upstream", "operation")
+)
+EMBED_BATCH_SIZE = Histogram(
+    "vitess_rag_embed_batch_size", "Number of query texts per batched embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 100)
+)
+
+# Admission control
+ADMISSION_REJECTED = Counter(
+    "vitess_rag_admission_rejected_total", "Requests turned away or degraded by admission control",
+    ("endpoint", "reason")
+)
+LIMITER_IN_FLIGHT = Gauge(
+    "vitess_rag_limiter_in_flight", "Requests holding a concurrency limiter slot", ("limiter",)
+)
+LIMITER_QUEUED = Gauge(
+    "vitess_rag_limiter_queued", "Requests waiting for a concurrency limiter slot", ("limiter",)
+)
+
+# Circuit breakers and fallbacks
+CIRCUIT_STATE = Gauge(
+    "vitess_rag_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("upstream", "operation")
+)
+CIRCUIT_REJECTED = Counter(
+    "vitess_rag_circuit_rejected_total", "Upstream calls refused by an open circuit", ("upstream", "operation")
+)
+FALLBACKS = Counter(
+    "vitess_rag_fallbacks_total", "Requests served from a local fallback", ("kind",)
+)
+
+# Ingestion
+INGEST_CHUNKS = Counter(
+    "vitess_rag_ingest_chunks_total", "Chunks embedded during ingestion", ("status",)
+)
+INGEST_EMBED_SECONDS = Histogram(
+    "vitess_rag_ingest_embed_seconds", "Latency of embedding calls during ingestion"
+)
+INGEST_UPSERT_SECONDS = Histogram(
+    "vitess_rag_ingest_upsert_seconds", "Latency of Chroma upserts during ingestion",
+    buckets=DEFAULT_BUCKETS + (60.0, 120.0, 300.0)
+)
+INGEST_CHUNKS_PER_SECOND = Gauge(
+    "vitess_rag_ingest_chunks_per_second", "Throughput of the last ingestion run"
+)
+
+
+class RequestTimer:
+    """Collects the stage timings of one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header_value(self):
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.spans]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def start_request_timer(endpoint):
+    timer = RequestTimer(endpoint)
+    token = _current_timer.set(timer)
+    return timer, token
+
+
+def reset_request_timer(token):
+    _current_timer.reset(token)
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer = _current_timer.get()
+        endpoint = timer.endpoint if timer is not None else ""
+        STAGE_SECONDS.observe(elapsed, endpoint=endpoint, stage=name)
+        if timer is not None:
+            timer.add(name, elapsed)
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Local cache of fetched pages, so extraction and chunking can be rerun
+# without crawling again. Page HTML is stored gzip-compressed under its
+# SHA-256 (objects/ab/abcdef....html.gz), so an unchanged page is stored
+# once however often it is fetched, and an SQLite index maps each URL to the
+# hash of its latest fetch along with where the page is filed (section path,
+# version). See rebuild_docs.py for regenerating vitess_docs.yaml from it.
+#
+# Usage: python page_cache.py [stats|gc] [cache_dir]
+
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "page_cache")
+PAGE_CACHE_LEVEL = int(os.getenv("PAGE_CACHE_LEVEL", "6"))  # gzip level
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    section_path TEXT NOT NULL,
+    version TEXT NOT NULL,
+    is_archived INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL,
+    fetch_order INTEGER NOT NULL
+);
+"""
+
+
+def object_path(cache_dir, digest):
+    return os.path.join(cache_dir, "objects", digest[:2], f"{digest}.html.gz")
+
+
+def read_object(cache_dir, digest):
+    with gzip.open(object_path(cache_dir, digest), "rb") as file:
+        return file.read().decode("utf-8")
+
+
+class PageCache:
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, level=PAGE_CACHE_LEVEL):
+        self.cache_dir = cache_dir
+        self.level = level
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._local = threading.local()  # One connection per thread
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite3"), timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def put(self, entry, html):
+        """Store a fetched page for a frontier entry; returns its hash"""
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = object_path(self.cache_dir, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "wb") as file:
+                file.write(gzip.compress(data, self.level, mtime=0))
+            os.replace(tmp_path, path)
+
+        db = self._connection()
+        with db:
+            # A refetched URL keeps its place in the fetch order
+            db.execute(
+                "INSERT INTO pages (url, hash, section_path, version, is_archived, fetched_at, fetch_order) "
+                "VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(fetch_order), 0) + 1 FROM pages)) "
+                "ON CONFLICT (url) DO UPDATE SET hash = excluded.hash, section_path = excluded.section_path, "
+                "version = excluded.version, is_archived = excluded.is_archived, fetched_at = excluded.fetched_at",
+                (entry["url"], digest, json.dumps(entry["section_path"]), entry["version"],
+                 int(entry["is_archived"]), time.time())
+            )
+        return digest
+
+    def get(self, url):
+        row = self._connection().execute("SELECT hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return read_object(self.cache_dir, row["hash"]) if row else None
+
+    def entries(self):
+        """Index rows in fetch order, as frontier-style dicts with the page hash"""
+        rows = self._connection().execute("SELECT * FROM pages ORDER BY fetch_order")
+        return [{
+            "url": row["url"],
+            "hash": row["hash"],
+            "section_path": json.loads(row["section_path"]),
+            "version": row["version"],
+            "is_archived": bool(row["is_archived"]),
+        } for row in rows]
+
+    def stats(self):
+        objects = 0
+        compressed = 0
+        for directory, _, names in os.walk(os.path.join(self.cache_dir, "objects")):
+            for name in names:
+                if name.endswith(".html.gz"):
+                    objects += 1
+                    compressed += os.path.getsize(os.path.join(directory, name))
+        return {"urls": len(self), "objects": objects, "compressed_mb": round(compressed / 1e6, 1)}
+
+    def gc(self):
+        """Delete objects no URL points at any more; returns how many"""
+        referenced = {row[0] for row in self._connection().execute("SELECT hash FROM pages")}
+        removed = 0
+        for directory, _, names in os.walk(os.path.join(self.cache_dir, "objects")):
+            for name in names:
+                if name.split(".", 1)[0] not in referenced:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+        return removed
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = PageCache(sys.argv[2] if len(sys.argv) > 2 else PAGE_CACHE_DIR)
+    if command == "gc":
+        print(f"Removed {cache.gc()} unreferenced pages")
+    print(json.dumps(cache.stats()))
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from preprocess import COMMON_RESOURCE_TITLES, metadata_versions, page_key
+from vectors import STORAGE_DTYPES, blocked_scores, normalize_rows
+
+# Page-level index for two-stage (page -> chunk) retrieval. Every docs page
+# gets one vector, the normalized mean of its chunk vectors, so a query
+# first picks the PAGE_SEARCH_PAGES closest pages and then only scores the
+# chunks of those pages. Pages are keyed by page_key rather than id_parent:
+# chunks are shared across versions and a page's id_parent differs per
+# version. A page is visible to a version when any of its chunks is.
+#
+# The chunks of page i are the generation rows
+# chunk_rows[chunk_offsets[i]:chunk_offsets[i + 1]] (CSR layout), which is
+# also how the index is stored in snapshots:
+#   pages.json                    generation, versions and page keys
+#   page_vectors.npy              normalized page vectors, (pages, dim)
+#   page_chunk_offsets.npy        int64 (pages + 1,)
+#   page_chunk_rows.npy           int32 generation rows, grouped by page
+#   page_version_members.npy      bool (versions, pages) membership
+#   page_common_resource.npy      bool (pages,) common resource pages
+
+PAGE_SEARCH_PAGES = int(os.getenv("PAGE_SEARCH_PAGES", "0"))  # Pages picked in the first stage; 0 searches all chunks
+
+
+def restrict_to_pages(where_filter, page_keys):
+    """Chroma where clause for the second stage: the version filter, limited to chunks of page_keys"""
+    page_filter = {"page_key": {"$in": list(page_keys)}}
+    return {"$and": [where_filter, page_filter]} if where_filter else page_filter
+
+
+class PageIndex:
+    def __init__(self, generation, page_keys, vectors, chunk_offsets, chunk_rows, versions,
+                 version_members, common_resource):
+        self.generation = generation
+        self.page_keys = page_keys
+        self.vectors = vectors
+        self.chunk_offsets = chunk_offsets
+        self.chunk_rows = chunk_rows
+        self.versions = versions
+        self.version_members = version_members
+        self.common_resource = common_resource
+        self.version_index = {version: i for i, version in enumerate(versions)}
+        self._masks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_chunks(cls, generation, embeddings, metadatas, dtype="float32"):
+        """Build from a generation's chunk vectors and metadata, in row order"""
+        chunk_keys = [metadata.get('page_key') or page_key(metadata.get('url', '')) for metadata in metadatas]
+        page_keys = sorted(set(chunk_keys))
+        page_ids = {key: i for i, key in enumerate(page_keys)}
+        chunk_pages = np.fromiter((page_ids[key] for key in chunk_keys), dtype=np.int32, count=len(chunk_keys))
+
+        chunk_rows = np.argsort(chunk_pages, kind="stable").astype(np.int32)
+        chunk_offsets = np.zeros(len(page_keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(chunk_pages, minlength=len(page_keys)), out=chunk_offsets[1:])
+
+        embeddings = normalize_rows(embeddings)
+        if len(page_keys):
+            vectors = normalize_rows(np.add.reduceat(embeddings[chunk_rows], chunk_offsets[:-1], axis=0))
+        else:
+            vectors = np.zeros((0, embeddings.shape[-1] if embeddings.ndim == 2 else 0), np.float32)
+
+        versions = sorted({version for metadata in metadatas for version in metadata_versions(metadata)})
+        version_index = {version: i for i, version in enumerate(versions)}
+        version_members = np.zeros((len(versions), len(page_keys)), dtype=bool)
+        common_resource = np.zeros(len(page_keys), dtype=bool)
+        for page, metadata in zip(chunk_pages, metadatas):
+            for version in metadata_versions(metadata):
+                version_members[version_index[version], page] = True
+            if metadata.get('title') in COMMON_RESOURCE_TITLES:
+                common_resource[page] = True
+
+        return cls(generation, page_keys, vectors.astype(STORAGE_DTYPES.get(dtype, np.float32)), chunk_offsets,
+                   chunk_rows, versions, version_members, common_resource)
+
+    def save(self, directory):
+        with open(os.path.join(directory, "pages.json"), "w", encoding="utf-8") as file:
+            json.dump({"generation": self.generation, "versions": self.versions, "page_keys": self.page_keys}, file)
+        np.save(os.path.join(directory, "page_vectors.npy"), self.vectors)
+        np.save(os.path.join(directory, "page_chunk_offsets.npy"), self.chunk_offsets)
+        np.save(os.path.join(directory, "page_chunk_rows.npy"), self.chunk_rows)
+        np.save(os.path.join(directory, "page_version_members.npy"), self.version_members)
+        np.save(os.path.join(directory, "page_common_resource.npy"), self.common_resource)
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved index with mmap, or None if the directory has none"""
+        if not os.path.exists(os.path.join(directory, "pages.json")):
+            return None
+        with open(os.path.join(directory, "pages.json"), "r", encoding="utf-8") as file:
+            info = json.load(file)
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        return cls(info["generation"], info["page_keys"], load("page_vectors.npy"), load("page_chunk_offsets.npy"),
+                   load("page_chunk_rows.npy"), info["versions"], load("page_version_members.npy"),
+                   load("page_common_resource.npy"))
+
+    def __len__(self):
+        return len(self.page_keys)
+
+    def page_mask(self, version, include_resources):
+        """Pages with at least one chunk visible to a query, None when unfiltered"""
+        if not version:
+            return None
+        key = (version, include_resources)
+        with self._lock:
+            if key not in self._masks:
+                index = self.version_index.get(version)
+                mask = np.array(self.version_members[index]) if index is not None else np.zeros(len(self), bool)
+                if include_resources:
+                    mask |= self.common_resource
+                self._masks[key] = mask
+            return self._masks[key]
+
+    def top_pages(self, query_embedding, n_pages, version=None, include_resources=True):
+        """Indices of the n_pages visible pages closest to the query, best first"""
+        if len(self) == 0 or n_pages <= 0:
+            return np.zeros(0, dtype=np.int64)
+        scores = blocked_scores(self.vectors, normalize_rows(np.asarray(query_embedding)[None, :])[0])
+        mask = self.page_mask(version, include_resources)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(n_pages, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top[scores[top] > -np.inf]
+
+    def top_page_keys(self, query_embedding, n_pages, version=None, include_resources=True):
+        return [self.page_keys[i] for i in self.top_pages(query_embedding, n_pages, version, include_resources)]
+
+    def candidate_rows(self, query_embedding, n_pages, version=None, include_resources=True):
+        """Generation rows of every chunk of the top pages, ascending so
+        reading them from a mmap'd matrix goes front to back"""
+        pages = self.top_pages(query_embedding, n_pages, version, include_resources)
+        if len(pages) == 0:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([self.chunk_rows[self.chunk_offsets[page]:self.chunk_offsets[page + 1]]
+                               for page in pages])
+        return np.sort(rows).astype(np.int64)
@@ -0,0 +1,399 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import threading
+from collections import deque, namedtuple
+
+import yaml
+
+from html_extract import markdown_sections
+
+# Compact record handed from the preprocessing pool to the embedding stage
+ChunkRecord = namedtuple("ChunkRecord", ["id", "document", "metadata", "title"])
+
+_DONE = object()
+
+# Chunks are stored once per unique (page, text) across versions. Version
+# membership and the per-version URL and id_parent live in flat metadata
+# keys, since Chroma metadata values can't be lists.
+VERSION_FLAG_PREFIX = "in:"
+VERSION_URL_PREFIX = "url:"
+VERSION_ID_PREFIX = "id_parent:"
+VERSION_KEY_PREFIXES = (VERSION_FLAG_PREFIX, VERSION_URL_PREFIX, VERSION_ID_PREFIX)
+
+_VERSION_PATH_RE = re.compile(r"^(archive/)?\d+\.\d+/")
+
+# Pages shared by every version, included alongside versioned results on request
+COMMON_RESOURCE_TITLES = [
+    "Learning Resources",
+    "Contribute",
+    "Troubleshoot",
+    "FAQ",
+    "Releases",
+    "Roadmap",
+    "Design Docs"
+]
+
+
+def load_yaml_docs(yaml_path):
+    """Load the scraped YAML, using the libyaml loader when it is available."""
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(yaml_path, 'r', encoding='utf-8') as file:
+        data = yaml.load(file, Loader=loader)
+    return data.get('vitess', []) if data else []
+
+
+def split_content_by_tokens(content, max_tokens=2000, chars_per_token=4):
+    """Fast and reliable content chunking by character count.
+    Converts newlines to spaces and normalizes spacing for consistent processing.
+    """
+    # Normalize newlines to spaces and remove multiple spaces
+    normalized_content = content.replace('\n', ' ').replace('\r', ' ')
+    normalized_content = ' '.join(normalized_content.split())
+
+    max_chars = max_tokens * chars_per_token
+
+    # Quick return if content fits in one chunk
+    if len(normalized_content) <= max_chars:
+        return [normalized_content]
+
+    chunks = []
+    start = 0
+
+    while start < len(normalized_content):
+        # Determine end position of this chunk
+        end = min(start + max_chars, len(normalized_content))
+
+        # If we're not at the end of the content, find last space
+        if end < len(normalized_content):
+            # Look for the last space within the chunk
+            last_space = normalized_content.rfind(' ', start, end)
+
+            if last_space != -1:  # If we found a space
+                end = last_space  # Cut at the space
+            # If no space found (very rare for large chunks), we'd cut at max_chars
+
+        # Add the chunk and move to next position
+        chunks.append(normalized_content[start:end])
+        start = end + 1  # Skip the space
+
+    return chunks
+
+
+def _split_blocks(markdown):
+    """Paragraph-level blocks of a section; fenced code stays in one block"""
+    blocks, current, in_fence = [], [], False
+    for line in markdown.split("\n"):
+        if line.startswith("```"):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_long_block(block, max_chars):
+    """Cut a block that is too long by itself at line breaks, or spaces for one
+    long line. Pieces of a code block are each fenced again."""
+    lines = block.split("\n")
+    if lines[0].startswith("```") and len(lines) > 2 and lines[-1].startswith("```"):
+        fence = lines[0]
+        inner = _split_long_block("\n".join(lines[1:-1]), max_chars - len(fence) - 5)
+        return [f"{fence}\n{piece}\n```" for piece in inner]
+    pieces, current = [], ""
+    for line in lines:
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append((current + "\n" + line[:cut]).strip("\n") if current else line[:cut])
+            current, line = "", line[cut:].lstrip()
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_markdown_sections(content, max_tokens=2000, chars_per_token=4, min_tokens=200):
+    """Section-aware chunking of extracted Markdown (see html_extract.py).
+    Consecutive sections are packed into chunks of up to max_tokens, and a
+    new chunk starts at every top-level (h1/h2) section once the current one
+    has min_tokens. A section too long for one chunk is split between
+    paragraphs, never inside a code block unless the block alone is too
+    long, and each piece repeats the section heading. Returns a list of
+    (chunk, anchor, section title) where anchor is that of the chunk's first
+    section, or None when the content has no anchored headings."""
+    sections = markdown_sections(content)
+    if not any(section.anchor for section in sections):
+        return None
+    max_chars = max_tokens * chars_per_token
+    min_chars = min_tokens * chars_per_token
+
+    chunks = []
+    current, anchor, title = [], "", ""
+
+    def close():
+        if current:
+            chunks.append(("\n\n".join(current), anchor, title))
+
+    for section in sections:
+        size = sum(len(part) + 2 for part in current)
+        fits = len(section.markdown) <= max_chars
+        if current and ((fits and size + len(section.markdown) > max_chars) or (section.level <= 2 and size >= min_chars)):
+            close()
+            current = []
+        if not current:
+            anchor, title = section.anchor, section.title
+        if fits:
+            current.append(section.markdown)
+            continue
+
+        # Too long for one chunk: split between paragraphs, heading repeated on each piece
+        heading = section.markdown.split("\n", 1)[0] if section.level else ""
+        blocks = _split_blocks(section.markdown)
+        if heading and blocks and blocks[0] == heading:
+            blocks = blocks[1:]
+        piece = [heading] if heading else []
+        for block in blocks:
+            for part in (_split_long_block(block, max_chars - len(heading) - 2) if len(block) > max_chars // 2 else [block]):
+                if sum(len(p) + 2 for p in current + piece) + len(part) > max_chars and (current or len(piece) > 1):
+                    current.extend(piece)
+                    close()
+                    current, anchor, title = [], section.anchor, section.title
+                    piece = [heading] if heading else []
+                piece.append(part)
+        current.extend(piece)
+    close()
+    return chunks
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def page_key(url):
+    """Version-independent path of a docs page, e.g. both
+    https://vitess.io/docs/22.0/overview/ and
+    https://vitess.io/docs/archive/13.0/overview/ map to /overview"""
+    path = url.split("://", 1)[-1]
+    path = path.split("/", 1)[1] if "/" in path else ""
+    if path.startswith("docs/"):
+        path = path[len("docs/"):]
+    path = _VERSION_PATH_RE.sub("", path)
+    return "/" + path.strip("/")
+
+
+def merge_version_metadata(target, metadata):
+    """Add the version membership keys of metadata to target"""
+    for key, value in metadata.items():
+        if key.startswith(VERSION_KEY_PREFIXES):
+            target[key] = value
+    versions = set(target.get('versions', '').split('|')) | set(metadata.get('versions', '').split('|'))
+    target['versions'] = '|'.join(sorted(v for v in versions if v))
+
+
+def metadata_versions(metadata):
+    return [key[len(VERSION_FLAG_PREFIX):] for key in metadata if key.startswith(VERSION_FLAG_PREFIX)]
+
+
+def build_where_filter(version, include_resources):
+    """Chroma where clause selecting one version's chunks"""
+    if not version:
+        return {}
+    # Chunks carry one membership flag per version they appear in
+    version_filter = {VERSION_FLAG_PREFIX + version: True}
+    if include_resources:
+        # Include both the specified version and common resources
+        return {"$or": [version_filter, {"title": {"$in": COMMON_RESOURCE_TITLES}}]}
+    return version_filter
+
+
+def matches_version(metadata, version, include_resources):
+    """In-process equivalent of build_where_filter for a single record"""
+    if not version:
+        return True
+    if metadata.get(VERSION_FLAG_PREFIX + version):
+        return True
+    return include_resources and metadata.get('title') in COMMON_RESOURCE_TITLES
+
+
+def resolve_version_metadata(metadata, version=None):
+    """Metadata as seen from one version: url, id_parent and version are
+    taken from that version's copy of the page when the chunk belongs to it,
+    and the per-version bookkeeping keys are dropped."""
+    resolved = {k: v for k, v in metadata.items() if not k.startswith(VERSION_KEY_PREFIXES)}
+    if version and metadata.get(VERSION_FLAG_PREFIX + version):
+        resolved['version_or_commonresource'] = version
+        resolved['url'] = metadata.get(VERSION_URL_PREFIX + version, resolved.get('url', ''))
+        resolved['id_parent'] = metadata.get(VERSION_ID_PREFIX + version, resolved.get('id_parent', ''))
+    if resolved.get('anchor') and resolved.get('url'):
+        resolved['section_url'] = f"{resolved['url']}#{resolved['anchor']}"
+    return resolved
+
+
+def preprocess_doc(doc):
+    """Normalize, chunk, hash and build metadata for a single YAML entry.
+    Runs inside the worker processes, so it must stay free of client state.
+    """
+    content = str(doc.get('content', '') or '').strip()
+    if not content:
+        return []
+
+    # Pages scraped as Markdown are chunked along their sections; plain text by size
+    sections = split_markdown_sections(content)
+    if sections is None:
+        sections = [(chunk, None, None) for chunk in split_content_by_tokens(content)]
+    content_chunks = [chunk for chunk, _, _ in sections]
+
+    # Metadata shared by every chunk of this entry, excluding content
+    base_metadata = {k: str(v) for k, v in doc.items() if k != 'content'}
+    id_parent = base_metadata.get('id_parent', 'unknown')
+    title = doc.get('title', 'Vitess Documentation')
+
+    version = base_metadata.get('version_or_commonresource', '')
+    key = page_key(base_metadata.get('url', ''))
+    base_metadata['page_key'] = key
+    base_metadata['versions'] = version
+    base_metadata[VERSION_FLAG_PREFIX + version] = True
+    base_metadata[VERSION_URL_PREFIX + version] = base_metadata.get('url', '')
+    base_metadata[VERSION_ID_PREFIX + version] = id_parent
+
+    records = []
+    for i, (chunk, anchor, section_title) in enumerate(sections):
+        metadata = dict(base_metadata)
+        metadata['chunk_index'] = str(i)
+        metadata['total_chunks'] = str(len(content_chunks))
+        metadata['content_hash'] = content_hash(chunk)
+        if anchor is not None:
+            # Where the chunk starts on the page, for url#anchor citations
+            metadata['anchor'] = anchor
+            metadata['section'] = section_title
+
+        # Content-addressed ID: the same text of the same page in another
+        # version maps to the same record, so it is embedded and stored once
+        chunk_id = content_hash(f"{key}\n{chunk}")
+        records.append(ChunkRecord(chunk_id, chunk, metadata, title))
+    return records
+
+
+def _preprocess_batch(docs):
+    return [preprocess_doc(doc) for doc in docs]
+
+
+def _pool_context():
+    # Not fork: ingestion runs inside the threaded API server, and a forked
+    # child would inherit its locks and threads mid-flight
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _put_batch(result, put, stop):
+    while not result.ready():
+        if stop.is_set():
+            return False
+        result.wait(0.1)
+    for records in result.get():
+        for record in records:
+            if not put(record):
+                return False
+    return True
+
+
+def _produce(docs, workers, chunksize, out_queue, stop):
+    def put(item):
+        # Gives up once the consumer has gone away, instead of blocking forever
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def batches():
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= chunksize:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    pool = None
+    try:
+        if workers <= 1:
+            for doc in docs:
+                for record in preprocess_doc(doc):
+                    if not put(record):
+                        return
+        else:
+            pool = _pool_context().Pool(processes=workers)
+            # At most two batches per worker in flight: the pool works ahead
+            # of the consumer by a bounded amount, and results are taken in
+            # submission order, so IDs and upsert order stay reproducible
+            pending = deque()
+            window = 2 * workers
+            for batch in batches():
+                if stop.is_set():
+                    return
+                pending.append(pool.apply_async(_preprocess_batch, (batch,)))
+                while len(pending) >= window or (pending and pending[0].ready()):
+                    if not _put_batch(pending.popleft(), put, stop):
+                        return
+            while pending:
+                if not _put_batch(pending.popleft(), put, stop):
+                    return
+        put(_DONE)
+    except Exception as e:
+        put(e)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def iter_chunk_records(docs, workers=None, queue_size=None, chunksize=16):
+    """Yield ChunkRecords for all docs in input order.
+    Preprocessing runs in a process pool that is fed a bounded window of
+    batches, and its output goes through a bounded queue, so the I/O-bound
+    embedding stage can consume records while the pool works ahead without
+    the pool racing through the whole corpus. Closing the generator early
+    (the consumer raising or breaking) stops the producer and terminates
+    the pool.
+    """
+    if workers is None:
+        workers = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+    if queue_size is None:
+        queue_size = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce,
+        args=(docs, workers, chunksize, out_queue, stop),
+        daemon=True
+    )
+    producer.start()
+
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,197 @@
+import asyncio
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from metrics import current_timer
+
+# Opt-in statistical profiling of single query requests. A request is
+# profiled when it carries X-Profile with the admin token, or is picked by
+# PROFILE_SAMPLE_RATE. While it runs, a sampler thread records the Python
+# stacks of the serving threads every PROFILE_INTERVAL_MS; the stack counts
+# and the request's stage timings go into a bounded ring buffer, readable
+# through the admin endpoints as collapsed stacks (flamegraph.pl, speedscope,
+# inferno). With neither an admin token nor a sample rate configured the
+# middleware isn't installed at all.
+#
+# The sampler sees whole threads, not requests: stacks of other requests
+# running on the event loop or the threadpool at the same time show up too.
+# Only one request is profiled at a time, and each profile records how many
+# requests were in flight when it started.
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fraction of requests, 0 disables sampling
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILED_PATHS = ("/query", "/rawquery-cli", "/enhance-query-cli")
+
+PROFILING_ENABLED = bool(ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+# Innermost frames of threadpool workers waiting for work; those samples are dropped
+IDLE_FILES = ("threading.py", "queue.py", "thread.py")
+
+
+def is_admin(request):
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of every thread but itself until stopped"""
+
+    def __init__(self, loop_thread, interval=PROFILE_INTERVAL_MS / 1000):
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Blocks until the sampling thread has exited, up to one interval plus
+        a sampling pass; from the event loop use stop_async"""
+        self._stop.set()
+        self._thread.join()
+
+    async def stop_async(self):
+        self._stop.set()
+        await asyncio.to_thread(self._thread.join)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if thread_id != self.loop_thread and os.path.basename(stack[0].co_filename) in IDLE_FILES:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                root = "event-loop" if thread_id == self.loop_thread else names.get(thread_id, str(thread_id))
+                self.samples[";".join([root] + [frame_label(code) for code in reversed(stack)])] += 1
+            self.sample_count += 1
+
+
+class ProfileStore:
+    """Ring buffer of the most recent request profiles"""
+
+    def __init__(self, max_entries=PROFILE_BUFFER_SIZE):
+        self._entries = deque(maxlen=max_entries)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._running = False
+        self.in_flight = 0
+
+    def should_profile(self, request):
+        if request.url.path not in PROFILED_PATHS:
+            return None
+        if request.headers.get("X-Profile") and is_admin(request):
+            trigger = "header"
+        elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = "sample"
+        else:
+            return None
+        with self._lock:
+            if self._running:
+                return None
+            self._running = True
+        return trigger
+
+    def start(self, request, trigger):
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        return {
+            "endpoint": request.url.path,
+            "trigger": trigger,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "concurrent_requests": self.in_flight,
+            "start": time.perf_counter(),
+            "sampler": sampler,
+        }
+
+    def finish(self, profile, status_code, spans):
+        """Store a profile; its sampler must have been stopped"""
+        sampler = profile.pop("sampler")
+        duration = time.perf_counter() - profile.pop("start")
+        with self._lock:
+            self._running = False
+            profile.update({
+                "id": next(self._ids),
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 1),
+                "interval_ms": sampler.interval * 1000,
+                "sample_count": sampler.sample_count,
+                "stages": [{"stage": stage, "ms": round(seconds * 1000, 1)} for stage, seconds in spans],
+                "stacks": sampler.samples,
+            })
+            self._entries.append(profile)
+        return profile["id"]
+
+    def list(self):
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != "stacks"}
+                    for profile in reversed(self._entries)]
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._entries:
+                if profile["id"] == profile_id:
+                    return profile
+        return None
+
+
+def collapsed_stacks(profile):
+    """Brendan Gregg's folded format, one "frame;frame;... count" line per stack.
+    Stage timings are appended as synthetic stages;<name> stacks weighted in
+    sampling intervals, so they line up with the samples in a flamegraph."""
+    lines = [f"{stack} {count}" for stack, count in profile["stacks"].most_common()]
+    for span in profile["stages"]:
+        weight = round(span["ms"] / profile["interval_ms"])
+        if weight:
+            lines.append(f"stages;{span['stage']} {weight}")
+    return "\n".join(lines) + "\n"
+
+
+profile_store = ProfileStore()
+
+
+async def profile_request(request, call_next):
+    """HTTP middleware; only installed when PROFILING_ENABLED"""
+    profile_store.in_flight += 1
+    try:
+        trigger = profile_store.should_profile(request)
+        if trigger is None:
+            return await call_next(request)
+
+        profile = profile_store.start(request, trigger)
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            # Joined off the event loop, so other requests aren't held up by the sampler's last pass
+            await profile["sampler"].stop_async()
+            timer = current_timer()
+            profile_id = profile_store.finish(profile, status_code, timer.spans if timer is not None else [])
+        response.headers["X-Profile-Id"] = str(profile_id)
+        return response
+    finally:
+        profile_store.in_flight -= 1
@@ -0,0 +1,182 @@
+import os
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; appends are then only serialized within the process
+    fcntl = None
+
+from html_extract import html_to_markdown
+from page_cache import PAGE_CACHE_DIR, PageCache, read_object
+
+# Regenerates vitess_docs.yaml from the page cache instead of the network:
+# every cached page is read and converted to Markdown again in a process
+# pool, in the order the pages were first fetched, and the YAML is written
+# in one go. Run it after changing extraction; re-chunking happens at
+# ingestion as usual. Pages without a docs article are left out.
+#
+# Usage: python rebuild_docs.py [vitess_docs.yaml] [workers] [cache_dir]
+
+
+def count_characters(text):
+    """Count characters in text"""
+    if not text:
+        return 0
+    return len(str(text))
+
+
+def estimate_tokens(text):
+    """Estimate tokens based on character count (rough approximation)"""
+    char_count = count_characters(text)
+    # Using the 4 characters per token approximation
+    return (char_count + 3) // 4
+
+
+def build_page_record(url, section_path, content, version):
+    """Create data dictionary for YAML in the exact format requested"""
+    return {
+        "title": section_path[-1] if section_path else "Unknown",
+        "url": url,
+        "content": content,
+        "version_or_commonresource": version,
+        "char_count": count_characters(content),
+        "approx_token_count": estimate_tokens(content)
+    }
+
+
+def format_docs_entry(entry):
+    """One entry in the scraper's YAML layout, content as a literal block"""
+    lines = [
+        f"- id_parent: {entry['id_parent']}",
+        f"  title: {entry['title']}",
+        f"  url: {entry['url']}",
+        "  content: |",
+    ]
+    # Make sure content is a string and indent each of its lines
+    lines.extend(f"    {line}" for line in str(entry['content']).split('\n'))
+    lines.extend([
+        f"  version_or_commonresource: {entry['version_or_commonresource']}",
+        f"  char_count: {entry['char_count']}",
+        f"  approx_token_count: {entry['approx_token_count']}",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def write_docs_yaml(entries, filename="vitess_docs.yaml"):
+    """Write entries in the scraper's YAML layout. Written to a temporary
+    file and renamed, so readers never see half a file."""
+    tmp_filename = f"{filename}.tmp{os.getpid()}"
+    with open(tmp_filename, 'w', encoding='utf-8') as file:
+        file.write("vitess:\n")
+        for entry in entries:
+            file.write(format_docs_entry(entry))
+    os.replace(tmp_filename, filename)
+
+
+class DocsYamlAppender:
+    """Adds entries to the end of a vitess_docs.yaml in write_docs_yaml's
+    layout, so saving a page costs the size of the page, not of the file.
+    Each append holds an flock on the file and first reads whatever other
+    processes appended since this appender last looked (only the id_parent
+    and url lines), so ids stay unique and a page saved twice keeps its
+    first id."""
+
+    def __init__(self, filename="vitess_docs.yaml"):
+        self.filename = filename
+        self.offset = 0
+        self.next_id = 1
+        self.ids = {}  # url -> id_parent
+        self.ends_with_newline = True
+        self._lock = threading.Lock()
+
+    def _catch_up(self, file):
+        file.seek(self.offset)
+        data = file.read()
+        id_parent = None
+        for line in data.split(b"\n"):
+            if line.startswith(b"- id_parent: "):
+                id_parent = int(line[len(b"- id_parent: "):])
+                self.next_id = max(self.next_id, id_parent + 1)
+            elif line.startswith(b"  url: ") and id_parent is not None:
+                self.ids[line[len(b"  url: "):].decode("utf-8")] = id_parent
+        self.offset += len(data)
+        if data:
+            self.ends_with_newline = data.endswith(b"\n")
+
+    def append(self, entry):
+        """Save entry under the next free id_parent and return it, or the id it was saved under before"""
+        with self._lock, open(self.filename, "a+b") as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                self._catch_up(file)
+                if entry["url"] in self.ids:
+                    return self.ids[entry["url"]]
+                entry["id_parent"] = self.next_id
+                text = format_docs_entry(entry)
+                if self.offset == 0:
+                    text = "vitess:\n" + text
+                elif not self.ends_with_newline:
+                    text = "\n" + text
+                # One write per entry, so a reader or a crash sees whole entries
+                data = text.encode("utf-8")
+                file.write(data)
+                file.flush()
+                self.offset += len(data)
+                self.ends_with_newline = True
+                self.ids[entry["url"]] = self.next_id
+                self.next_id += 1
+                return entry["id_parent"]
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def extract_entry(args):
+    """Pool worker: read one cached page and build its YAML record. Workers
+    read the objects themselves, so only hashes and Markdown cross processes."""
+    cache_dir, entry = args
+    content = html_to_markdown(read_object(cache_dir, entry["hash"]))
+    if not content:
+        return None
+    return build_page_record(entry["url"], entry["section_path"], content, entry["version"])
+
+
+def rebuild_docs(yaml_filename="vitess_docs.yaml", workers=None, cache_dir=PAGE_CACHE_DIR):
+    workers = workers or os.cpu_count() or 1
+    cache = PageCache(cache_dir)
+    entries = cache.entries()
+    start = time.perf_counter()
+
+    tasks = [(cache_dir, entry) for entry in entries]
+    if workers <= 1:
+        records = [extract_entry(task) for task in tasks]
+    else:
+        with Pool(processes=workers) as pool:
+            records = list(pool.imap(extract_entry, tasks, chunksize=16))
+    extracted = time.perf_counter()
+
+    docs = []
+    for record in records:
+        if record is not None:
+            record["id_parent"] = len(docs) + 1
+            docs.append(record)
+    write_docs_yaml(docs, yaml_filename)
+    written = time.perf_counter()
+
+    skipped = len(records) - len(docs)
+    print(f"Rebuilt {yaml_filename} from {len(entries)} cached pages ({skipped} without an article) "
+          f"with {workers} workers")
+    print(f"  extract {extracted - start:.2f}s ({len(entries) / max(extracted - start, 1e-9):.0f} pages/s), "
+          f"write {written - extracted:.2f}s, total {written - start:.2f}s")
+    return docs
+
+
+if __name__ == "__main__":
+    yaml_filename = sys.argv[1] if len(sys.argv) > 1 else "vitess_docs.yaml"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    cache_dir = sys.argv[3] if len(sys.argv) > 3 else PAGE_CACHE_DIR
+    rebuild_docs(yaml_filename, workers, cache_dir)
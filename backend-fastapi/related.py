@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy as np
+
+from preprocess import VERSION_ID_PREFIX, VERSION_URL_PREFIX, metadata_versions, page_key
+from vectors import top_k
+
+# "See also" links: a k-nearest-neighbour graph over the page vectors of
+# page_index.py, precomputed when a generation is exported. Nodes are page
+# copies, one per id_parent (a page in one version); a node's neighbours
+# are the closest other pages of the same version and the common resource
+# pages. Scores come from one blocked matrix multiply per version, at most
+# RELATED_BLOCK_ROWS pages at a time.
+#
+# Stored in CSR layout, the neighbours of node i being
+# neighbors[offsets[i]:offsets[i + 1]], best first:
+#   related.json                  generation and nodes [id_parent, title, url, version]
+#   related_offsets.npy           int64 (nodes + 1,)
+#   related_neighbors.npy         int32 node indices
+#   related_scores.npy            float16 cosine similarities
+# so a lookup is a dict access and a slice of k entries.
+
+RELATED_PAGES_K = int(os.getenv("RELATED_PAGES_K", "8"))  # Neighbours stored per page; 0 builds no graph
+RELATED_IN_RESULTS = int(os.getenv("RELATED_IN_RESULTS", "3"))  # See also links on each search result
+RELATED_BLOCK_ROWS = 1024
+
+
+class RelatedGraph:
+    def __init__(self, generation, nodes, offsets, neighbors, scores):
+        self.generation = generation
+        self.nodes = nodes
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.scores = scores
+        self.node_index = {node[0]: i for i, node in enumerate(nodes)}
+
+    @classmethod
+    def from_page_index(cls, pages, metadatas, k=RELATED_PAGES_K, block_rows=RELATED_BLOCK_ROWS):
+        page_ids = {key: i for i, key in enumerate(pages.page_keys)}
+        copies = {}  # (version, page) -> [id_parent, title, url, version]
+        for metadata in metadatas:
+            page = page_ids[metadata.get('page_key') or page_key(metadata.get('url', ''))]
+            for version in metadata_versions(metadata):
+                if (version, page) not in copies:
+                    copies[(version, page)] = [
+                        str(metadata.get(VERSION_ID_PREFIX + version, metadata.get('id_parent', ''))),
+                        metadata.get('title', ''),
+                        metadata.get(VERSION_URL_PREFIX + version, metadata.get('url', '')),
+                        version,
+                    ]
+        order = sorted(copies)
+        nodes = [copies[copy] for copy in order]
+        node_of = {copy: i for i, copy in enumerate(order)}
+        # Common resources seen from another version link to their first copy
+        first_node = {}
+        for (version, page), i in node_of.items():
+            first_node.setdefault(page, i)
+
+        vectors = np.asarray(pages.vectors, dtype=np.float32)
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        neighbors = np.zeros(len(nodes) * k, dtype=np.int32)
+        scores = np.zeros(len(nodes) * k, dtype=np.float16)
+        counts = np.zeros(len(nodes), dtype=np.int64)
+        for version in pages.versions:
+            members = np.asarray(pages.version_members[pages.version_index[version]])
+            version_pages = np.flatnonzero(members)
+            visible = np.flatnonzero(members | np.asarray(pages.common_resource))
+            if len(version_pages) == 0 or k <= 0:
+                continue
+            targets = np.array([node_of.get((version, page), first_node[page]) for page in visible], dtype=np.int32)
+            candidates = vectors[visible]
+            for start in range(0, len(version_pages), block_rows):
+                block = version_pages[start:start + block_rows]
+                # One extra neighbour, since a page is its own nearest
+                indices, block_scores = top_k(candidates, vectors[block], min(k + 1, len(visible)))
+                for page, row, row_scores in zip(block, indices, block_scores):
+                    keep = visible[row] != page
+                    row, row_scores = row[keep][:k], row_scores[keep][:k]
+                    node = node_of[(version, page)]
+                    base = node * k
+                    neighbors[base:base + len(row)] = targets[row]
+                    scores[base:base + len(row)] = row_scores
+                    counts[node] = len(row)
+
+        # Compact the fixed k slots per node into CSR
+        np.cumsum(counts, out=offsets[1:])
+        keep = (np.arange(k)[None, :] < counts[:, None]).ravel() if k > 0 else np.zeros(0, bool)
+        return cls(pages.generation, nodes, offsets, neighbors[keep], scores[keep])
+
+    def save(self, directory):
+        with open(os.path.join(directory, "related.json"), "w", encoding="utf-8") as file:
+            json.dump({"generation": self.generation, "nodes": self.nodes}, file, separators=(",", ":"))
+        np.save(os.path.join(directory, "related_offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "related_neighbors.npy"), self.neighbors)
+        np.save(os.path.join(directory, "related_scores.npy"), self.scores)
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved graph with mmap, or None if the directory has none"""
+        if not os.path.exists(os.path.join(directory, "related.json")):
+            return None
+        with open(os.path.join(directory, "related.json"), "r", encoding="utf-8") as file:
+            info = json.load(file)
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        return cls(info["generation"], info["nodes"], load("related_offsets.npy"),
+                   load("related_neighbors.npy"), load("related_scores.npy"))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def related(self, id_parent, limit=None):
+        """Closest pages to a page copy, best first; None for an unknown id_parent"""
+        node = self.node_index.get(str(id_parent))
+        if node is None:
+            return None
+        start, end = int(self.offsets[node]), int(self.offsets[node + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+        links = []
+        for neighbor, score in zip(self.neighbors[start:end], self.scores[start:end]):
+            id_parent, title, url, version = self.nodes[neighbor]
+            links.append({"id_parent": id_parent, "title": title, "url": url,
+                          "version": version, "score": round(float(score), 4)})
+        return links
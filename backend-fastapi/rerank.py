@@ -0,0 +1,123 @@
+import os
+import re
+import time
+
+# Lightweight second-stage ranking for Chroma hits. The default scorer is
+# feature based (vector similarity, lexical overlap, title and version
+# match) and runs in microseconds per candidate. If RERANK_MODEL names a
+# sentence-transformers cross-encoder and the package is installed, that
+# model is used instead. Either way scoring stops at the time budget and
+# unscored candidates keep their vector similarity.
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "50"))
+
+FEATURE_WEIGHTS = {
+    "similarity": 1.0,
+    "lexical": 0.6,
+    "title": 0.3,
+    "url": 0.2,
+    "version": 0.1,
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "of", "on", "or", "should", "the", "to", "what",
+    "when", "where", "which", "why", "with", "you", "my", "me", "we", "use", "using",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_\-]*")
+_cross_encoder = None
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _overlap(query_terms, text):
+    if not query_terms:
+        return 0.0
+    terms = set(tokenize(text))
+    return len(query_terms & terms) / len(query_terms)
+
+
+def feature_score(query_terms, result, version=None):
+    metadata = result.get('metadata') or {}
+    features = {
+        "similarity": result.get('similarity_score', 0.0),
+        "lexical": _overlap(query_terms, result.get('document', '')),
+        "title": _overlap(query_terms, metadata.get('title', '')),
+        "url": _overlap(query_terms, metadata.get('url', '').replace('/', ' ')),
+        "version": 1.0 if version and metadata.get('version_or_commonresource') == version else 0.0,
+    }
+    return sum(FEATURE_WEIGHTS[name] * value for name, value in features.items())
+
+
+def _get_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None and RERANK_MODEL:
+        try:
+            from sentence_transformers import CrossEncoder
+            _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+            print(f"Loaded rerank model {RERANK_MODEL}")
+        except Exception as e:
+            print(f"Rerank model {RERANK_MODEL} unavailable, using feature scorer: {str(e)}")
+            _cross_encoder = False
+    return _cross_encoder or None
+
+
+def rerank_results(query, results, top_k, version=None, budget_ms=None):
+    """Rescore results and return (best top_k results, stats).
+    Candidates are scored in their original vector order until the budget
+    runs out; the rest fall back to their similarity score.
+    """
+    if budget_ms is None:
+        budget_ms = RERANK_BUDGET_MS
+    start = time.perf_counter()
+    deadline = start + budget_ms / 1000.0
+
+    scores = [result.get('similarity_score', 0.0) for result in results]
+    scored = 0
+    model = _get_cross_encoder()
+
+    if model is not None:
+        # Score in small batches so the budget is checked between model calls
+        batch_size = 8
+        for offset in range(0, len(results), batch_size):
+            if time.perf_counter() >= deadline:
+                break
+            batch = results[offset:offset + batch_size]
+            batch_scores = model.predict([(query, result.get('document', '')) for result in batch])
+            for i, score in enumerate(batch_scores):
+                scores[offset + i] = float(score)
+            scored += len(batch)
+        if scored < len(results):
+            # Keep model scores and fallback similarities on comparable footing
+            # by ranking unscored candidates after the scored ones
+            for i in range(scored, len(results)):
+                scores[i] = float("-inf")
+    else:
+        query_terms = set(tokenize(query))
+        for i, result in enumerate(results):
+            if time.perf_counter() >= deadline:
+                break
+            scores[i] = feature_score(query_terms, result, version)
+            scored += 1
+
+    order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)[:top_k]
+    reranked = []
+    for i in order:
+        result = dict(results[i])
+        result['rerank_score'] = scores[i] if scores[i] != float("-inf") else None
+        reranked.append(result)
+
+    stats = {
+        "scorer": RERANK_MODEL if model is not None else "features",
+        "candidates": len(results),
+        "scored": scored,
+        "returned": len(reranked),
+        "budget_ms": budget_ms,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        "budget_exhausted": scored < len(results),
+    }
+    return reranked, stats
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+from preprocess import page_key
+from vectors import normalize_rows
+
+# Result selection shared by the query endpoints. Search over-fetches
+# candidates together with their vectors, and the final results are picked
+# by Maximal Marginal Relevance: each pick maximizes
+#   lambda * relevance - (1 - lambda) * max similarity to the picks so far,
+# so near-duplicate chunks (adjacent chunks of one page, the same text in a
+# common resource) stop crowding out other pages. A per-page cap on top of
+# that limits how many chunks of one id_parent can be returned.
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1 ranks by relevance only
+MMR_FETCH_FACTOR = int(os.getenv("MMR_FETCH_FACTOR", "4"))  # Candidates fetched per result returned
+MAX_CHUNKS_PER_PARENT = int(os.getenv("MAX_CHUNKS_PER_PARENT", "2"))  # 0 for no cap
+
+
+def parent_key(result):
+    metadata = result.get('metadata') or {}
+    return metadata.get('id_parent') or page_key(metadata.get('url', ''))
+
+
+def mmr_select(relevance, embeddings, k, mmr_lambda=MMR_LAMBDA, groups=None, max_per_group=0):
+    """Indices of up to k candidates in pick order. relevance is rescaled to
+    0-1 over the candidates so lambda means the same for any score; without
+    embeddings only the group cap applies. The pairwise similarities are
+    one matrix product, and each pick is a vectorized update of every
+    candidate's redundancy."""
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    spread = float(relevance.max() - relevance.min())
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(count, np.float32)
+
+    if embeddings is not None and mmr_lambda < 1:
+        vectors = normalize_rows(embeddings)
+        similarity = vectors @ vectors.T
+    else:
+        similarity = None
+    redundancy = np.zeros(count, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    if max_per_group and groups is not None:
+        _, group_ids = np.unique(np.asarray([str(group) for group in groups]), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int32)
+
+    selected = []
+    while len(selected) < k and available.any():
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        if similarity is not None:
+            np.maximum(redundancy, similarity[pick], out=redundancy)
+        if max_per_group and groups is not None:
+            group = group_ids[pick]
+            group_counts[group] += 1
+            if group_counts[group] >= max_per_group:
+                available[group_ids == group] = False
+    return selected
+
+
+def diversify(results, embeddings, k, mmr_lambda=MMR_LAMBDA, max_per_parent=MAX_CHUNKS_PER_PARENT, relevance=None):
+    """Pick k of the ranked candidates with MMR and the per-page cap. embeddings
+    are the candidates' vectors in the same order (None for lexical results);
+    relevance defaults to the similarity scores."""
+    if relevance is None:
+        relevance = [result.get('similarity_score', 0.0) for result in results]
+    groups = [parent_key(result) for result in results] if max_per_parent else None
+    picks = mmr_select(relevance, embeddings, k, mmr_lambda, groups, max_per_parent)
+    return [results[i] for i in picks]
@@ -0,0 +1,162 @@
+import gzip
+import json
+import os
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+# Response encoding for the query endpoints: orjson when installed (falling
+# back to the standard library), trimming of result fields the client did
+# not ask for, and gzip/brotli compression of large bodies. gzip is
+# Starlette's GZipMiddleware; brotli is used only if the brotli package is
+# installed and the client prefers it, and only for bodies sent in one
+# piece (streamed responses go out uncompressed to those clients).
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # Low qualities are fast enough per request
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+# Keys of a query result; any other requested field is looked up in its metadata
+RESULT_KEYS = ("document", "similarity_score")
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _default(value):
+    # numpy arrays and scalars from the caches and the lexical index
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered straight from plain dicts and lists. Handlers
+    return it directly so FastAPI skips jsonable_encoder, which walks every
+    value of the response in Python."""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def shape_results(results, include_documents=True, fields=None):
+    """Drop the chunk text and/or keep only the requested fields of each
+    result. fields may name result keys (document, similarity_score) or
+    metadata keys (url, title, ...); metadata keys stay under "metadata"."""
+    if include_documents and not fields:
+        return results
+    shaped = []
+    for result in results:
+        if fields:
+            item = {key: result[key] for key in RESULT_KEYS if key in fields and key in result}
+            metadata = result.get('metadata') or {}
+            item['metadata'] = {key: metadata[key] for key in fields if key in metadata}
+        else:
+            item = dict(result)
+        if not include_documents:
+            item.pop('document', None)
+        shaped.append(item)
+    return shaped
+
+
+def shape_response(response, request):
+    """Apply a request's include_documents/fields options to a response"""
+    if request.include_documents and not request.fields:
+        return response
+    return {**response, "results": shape_results(response.get("results", []), request.include_documents, request.fields)}
+
+
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing bodies of at least minimum_size for
+    clients that accept it: brotli when negotiated, gzip otherwise"""
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and brotli is not None:
+            if choose_encoding(Headers(scope=scope).get("accept-encoding", "")) == "br":
+                await BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+                return
+        await self.gzip(scope, receive, send)
+
+
+class BrotliResponder:
+    def __init__(self, app, minimum_size):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.started = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body part shows whether it can be compressed
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.started:
+            await self.send(message)
+            return
+
+        self.started = True
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        body = message.get("body", b"")
+        if (not message.get("more_body", False) and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+            body = compress(body, "br")
+            headers["Content-Encoding"] = "br"
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            message = {**message, "body": body}
+        await self.send(self.start_message)
+        await self.send(message)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+# Multi-worker entry point. The parent process builds the first generation
+# if there is none and exports the active generation's snapshot, once; then
+# uvicorn starts the workers, which skip startup ingestion and mmap that
+# snapshot, so vectors, chunk text, metadata and lexical postings are held
+# once in the page cache and shared by all of them. Each worker still has
+# its own answer cache, rate limiter buckets and /metrics counters.
+#
+# Usage: python serve.py [workers] [port]
+#   workers defaults to WEB_CONCURRENCY or the number of CPUs
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+
+    # Set before main is imported, in this process and the workers it spawns
+    os.environ.setdefault("SNAPSHOTS", "true")
+    os.environ.setdefault("LOCAL_VECTOR_SEARCH", "true")
+
+    import uvicorn
+    from main import prepare_index
+
+    prepare_index()
+    os.environ["SKIP_STARTUP_INGEST"] = "true"
+    print(f"Starting {workers} workers on port {port}")
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
@@ -0,0 +1,282 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from fallback import LexicalIndex
+from page_index import PageIndex
+from related import RELATED_PAGES_K, RelatedGraph
+from suggest import SuggestIndex
+from preprocess import COMMON_RESOURCE_TITLES, metadata_versions, resolve_version_metadata
+from vectors import STORAGE_DTYPES, blocked_scores, normalize_rows
+
+# Read-only, on-disk copies of index generations for multi-worker serving.
+# Each generation is exported once to SNAPSHOT_DIR/<generation>/ as flat
+# .npy arrays and byte blobs, and every worker opens it with mmap, so the
+# vectors, chunk text, metadata and lexical postings live once in the OS
+# page cache no matter how many workers read them. Workers only keep small
+# per-process structures (the term dictionary and version masks).
+#
+# Layout:
+#   manifest.json                 generation, count, dim, dtype, versions
+#   embeddings.npy                normalized vectors, (count, dim)
+#   documents.bin/_offsets.npy    UTF-8 chunk texts and their byte offsets
+#   metadata.bin/_offsets.npy     JSON metadata per chunk and byte offsets
+#   version_members.npy           bool (versions, count) membership
+#   common_resource.npy           bool (count,) common resource pages
+#   terms.json, term_offsets.npy, posting_docs.npy, posting_tfs.npy,
+#   doc_lengths.npy               BM25 postings in CSR layout
+#   pages.json, page_*.npy        page vectors for two-stage search, see page_index.py
+#   suggest.json                  typeahead names, see suggest.py
+#   related.json, related_*.npy   related-pages graph in CSR layout, see related.py
+#
+# Without snapshots, a generation still gets a sidecar in
+# SIDECAR_DIR/<generation>/ holding just the last three (page index,
+# typeahead, related pages), written by ingestion from the chunks it
+# already has in memory, so serving processes load them instead of each
+# rebuilding them from a full read of the collection.
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SIDECAR_DIR = os.getenv("SIDECAR_DIR", "sidecars")
+
+
+def _write_blob(directory, name, items):
+    encoded = [item.encode("utf-8") for item in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as file:
+        for item in encoded:
+            file.write(item)
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+def read_chunks(collection, include=('documents', 'metadatas', 'embeddings'), page_size=1000):
+    """Every chunk of a generation in one paged pass, as {'ids': [...], column: [...]}"""
+    chunks = {name: [] for name in ('ids',) + tuple(include)}
+    offset = 0
+    while True:
+        page = collection.get(include=list(include), limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        for name, values in chunks.items():
+            values.extend(page[name])
+        offset += len(page['ids'])
+    return chunks
+
+
+def _save_derived_indexes(directory, generation, matrix, documents, metadatas, dtype):
+    """Page index, related-pages graph and typeahead, from one set of chunks"""
+    if len(metadatas):
+        pages = PageIndex.from_chunks(generation, matrix, metadatas, dtype)
+        pages.save(directory)
+        if RELATED_PAGES_K:
+            RelatedGraph.from_page_index(pages, metadatas).save(directory)
+    SuggestIndex.from_chunks(generation, documents, metadatas).save(os.path.join(directory, "suggest.json"))
+
+
+def _publish(tmp_path, final_path):
+    shutil.rmtree(final_path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, final_path)
+    except OSError:
+        # Another process published the same generation in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def export_snapshot(collection, snapshot_dir=SNAPSHOT_DIR, page_size=1000):
+    """Write a generation to snapshot_dir/<generation>. Built in a temporary
+    directory and renamed into place, so readers never see a partial one."""
+    start = time.perf_counter()
+    chunks = read_chunks(collection, page_size=page_size)
+    ids, documents, metadatas, embeddings = chunks['ids'], chunks['documents'], chunks['metadatas'], chunks['embeddings']
+
+    collection_metadata = collection.metadata or {}
+    dtype = collection_metadata.get("embedding_dtype", "float32")
+    versions = sorted({version for metadata in metadatas for version in metadata_versions(metadata)})
+
+    final_path = os.path.join(snapshot_dir, collection.name)
+    tmp_path = f"{final_path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32)) if embeddings else np.zeros((0, 0), np.float32)
+    np.save(os.path.join(tmp_path, "embeddings.npy"), matrix.astype(STORAGE_DTYPES.get(dtype, np.float32)))
+    _write_blob(tmp_path, "documents", documents)
+    _write_blob(tmp_path, "metadata", [json.dumps(metadata, separators=(",", ":")) for metadata in metadatas])
+
+    members = np.zeros((len(versions), len(ids)), dtype=bool)
+    version_index = {version: i for i, version in enumerate(versions)}
+    for row, metadata in enumerate(metadatas):
+        for version in metadata_versions(metadata):
+            members[version_index[version], row] = True
+    np.save(os.path.join(tmp_path, "version_members.npy"), members)
+    np.save(os.path.join(tmp_path, "common_resource.npy"),
+            np.array([metadata.get('title') in COMMON_RESOURCE_TITLES for metadata in metadatas], dtype=bool))
+
+    lexical = LexicalIndex.from_documents(collection.name, documents, metadatas)
+    with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as file:
+        json.dump(sorted(lexical.term_ids, key=lexical.term_ids.get), file)
+    np.save(os.path.join(tmp_path, "term_offsets.npy"), lexical.term_offsets)
+    np.save(os.path.join(tmp_path, "posting_docs.npy"), lexical.posting_docs)
+    np.save(os.path.join(tmp_path, "posting_tfs.npy"), lexical.posting_tfs)
+    np.save(os.path.join(tmp_path, "doc_lengths.npy"), lexical.doc_lengths)
+    _save_derived_indexes(tmp_path, collection.name, matrix, documents, metadatas, dtype)
+    with open(os.path.join(tmp_path, "ids.json"), "w", encoding="utf-8") as file:
+        json.dump(ids, file)
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump({
+            "generation": collection.name,
+            "count": len(ids),
+            "embedding_dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "embedding_dtype": dtype,
+            "versions": versions,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }, file, indent=2)
+
+    _publish(tmp_path, final_path)
+    print(f"Exported snapshot of {collection.name}: {len(ids)} chunks in {time.perf_counter() - start:.1f}s")
+    return final_path
+
+
+def export_sidecar(generation, documents, metadatas, embeddings, dtype="float32", sidecar_dir=SIDECAR_DIR):
+    """Write the derived indexes of a generation to sidecar_dir/<generation>,
+    from chunks already in memory (in any order: the page index of a sidecar
+    is used by page key, never by row)"""
+    start = time.perf_counter()
+    final_path = os.path.join(sidecar_dir, generation)
+    tmp_path = f"{final_path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    matrix = np.asarray(embeddings, dtype=np.float32) if len(embeddings) else np.zeros((0, 0), np.float32)
+    _save_derived_indexes(tmp_path, generation, matrix, documents, metadatas, dtype)
+    _publish(tmp_path, final_path)
+    print(f"Exported sidecar of {generation}: {len(documents)} chunks in {time.perf_counter() - start:.1f}s")
+    return final_path
+
+
+def load_sidecar(generation, sidecar_dir=SIDECAR_DIR):
+    """(page index, suggest index, related graph) of a generation, any may
+    be None, or None if the generation has no sidecar"""
+    path = os.path.join(sidecar_dir, generation)
+    if not os.path.isdir(path):
+        return None
+    return PageIndex.load(path), SuggestIndex.load(os.path.join(path, "suggest.json")), RelatedGraph.load(path)
+
+
+def snapshot_path(generation, snapshot_dir=SNAPSHOT_DIR):
+    path = os.path.join(snapshot_dir, generation)
+    return path if os.path.exists(os.path.join(path, "manifest.json")) else None
+
+
+def prune_snapshots(keep, snapshot_dir=SNAPSHOT_DIR):
+    """Delete snapshots (or sidecars) of generations not in keep. Workers that still have
+    one mapped keep reading it until they switch; the files go away once
+    the last mapping is closed."""
+    if not os.path.isdir(snapshot_dir):
+        return
+    for name in os.listdir(snapshot_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+            print(f"Deleted {os.path.join(snapshot_dir, name)}")
+
+
+class Snapshot:
+    """A generation snapshot opened read-only with mmap"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        self.generation = self.manifest["generation"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.embeddings = load("embeddings.npy")
+        self.documents = np.memmap(os.path.join(path, "documents.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "documents.bin")) else np.zeros(0, np.uint8)
+        self.document_offsets = load("documents_offsets.npy")
+        self.metadata_blob = np.memmap(os.path.join(path, "metadata.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "metadata.bin")) else np.zeros(0, np.uint8)
+        self.metadata_offsets = load("metadata_offsets.npy")
+        self.version_members = load("version_members.npy")
+        self.common_resource = load("common_resource.npy")
+        self.version_index = {version: i for i, version in enumerate(self.manifest["versions"])}
+        self.pages = PageIndex.load(path)  # None for snapshots exported before page vectors
+        self.suggest = SuggestIndex.load(os.path.join(path, "suggest.json"))  # Likewise before typeahead
+        self.related = RelatedGraph.load(path)
+        self._masks = {}
+        self._lock = threading.Lock()
+
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as file:
+            terms = json.load(file)
+        self.lexical = LexicalIndex(
+            self.generation, terms, load("term_offsets.npy"), load("posting_docs.npy"),
+            load("posting_tfs.npy"), load("doc_lengths.npy"), self.document, self.metadata
+        )
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    def document(self, i):
+        return bytes(self.documents[self.document_offsets[i]:self.document_offsets[i + 1]]).decode("utf-8")
+
+    def metadata(self, i):
+        return json.loads(bytes(self.metadata_blob[self.metadata_offsets[i]:self.metadata_offsets[i + 1]]))
+
+    def version_mask(self, version, include_resources):
+        """Rows visible to a query, the in-process equivalent of build_where_filter"""
+        if not version:
+            return None
+        key = (version, include_resources)
+        with self._lock:
+            if key not in self._masks:
+                index = self.version_index.get(version)
+                mask = np.array(self.version_members[index]) if index is not None else np.zeros(len(self), bool)
+                if include_resources:
+                    mask |= self.common_resource
+                self._masks[key] = mask
+            return self._masks[key]
+
+    def vector_search(self, query_embedding, n_results, version=None, include_resources=True, n_pages=0,
+                      include_embeddings=False):
+        """Exact cosine search, formatted like format_query_results. With
+        n_pages, only the chunks of the n_pages closest pages are scored.
+        include_embeddings returns (results, their vectors as float32 rows)."""
+        if len(self) == 0:
+            return ([], None) if include_embeddings else []
+        query = normalize_rows(np.asarray(query_embedding)[None, :])[0]
+        mask = self.version_mask(version, include_resources)
+        if n_pages and self.pages is not None:
+            rows = self.pages.candidate_rows(query, n_pages, version, include_resources)
+            if len(rows) == 0:
+                return ([], None) if include_embeddings else []
+            scores = np.asarray(self.embeddings[rows]).astype(np.float32, copy=False) @ query
+            if mask is not None:
+                scores[~mask[rows]] = -np.inf
+        else:
+            rows = None
+            scores = blocked_scores(self.embeddings, query)
+            if mask is not None:
+                scores[~mask] = -np.inf
+        k = min(n_results, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[scores[top] > -np.inf]
+        matches = top if rows is None else rows[top]
+        results = [{
+            'document': self.document(i),
+            'metadata': resolve_version_metadata(self.metadata(i), version),
+            'similarity_score': float(score)
+        } for i, score in zip(matches, scores[top])]
+        if include_embeddings:
+            return results, np.asarray(self.embeddings[matches], dtype=np.float32)
+        return results
+
+    def lexical_search(self, query, n_results, version=None, include_resources=True):
+        return self.lexical.search(query, n_results, version, include_resources,
+                                   allowed=self.version_mask(version, include_resources))
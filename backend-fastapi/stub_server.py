@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Stand-in for the Gemini REST API, for load testing without quota. It
+# serves the endpoints the google-genai SDK calls for embed_content and
+# generate_content, so main.py runs unchanged with
+#
+#   GEMINI_BASE_URL=http://localhost:8081 CHROMA_MODE=ephemeral uvicorn main:app
+#
+# Embeddings are deterministic: words are feature-hashed into the vector,
+# so the same text always gets the same vector and texts sharing words
+# land close together, which keeps retrieval results stable across runs.
+# Latency and error rate are set from the environment or at runtime via
+# POST /stub/config (set embed latency to 0 while the app ingests on startup).
+#
+# Usage: python stub_server.py [port]
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_\-]*")
+
+
+class StubConfig(BaseModel):
+    embed_latency_ms: float = float(os.getenv("STUB_EMBED_LATENCY_MS", "80"))
+    generate_latency_ms: float = float(os.getenv("STUB_GENERATE_LATENCY_MS", "800"))
+    jitter_ms: float = float(os.getenv("STUB_JITTER_MS", "20"))  # Uniform +/- added to each latency
+    error_rate: float = float(os.getenv("STUB_ERROR_RATE", "0"))  # Share of calls answered with 503
+    answer_words: int = int(os.getenv("STUB_ANSWER_WORDS", "200"))
+
+
+app = FastAPI(title="Gemini stub")
+config = StubConfig()
+call_counts = {"embed": 0, "generate": 0, "errors": 0}
+
+
+def stub_embedding(text, dimensionality=768):
+    vector = [0.0] * dimensionality
+    tokens = _TOKEN_RE.findall(text.lower()) or [text]
+    for token in tokens:
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensionality
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def stub_answer(prompt):
+    # Echo some prompt words so answers differ per question
+    words = _TOKEN_RE.findall(prompt.lower())[:config.answer_words] or ["stub"]
+    return "Stub answer: " + " ".join(words)
+
+
+async def simulate(kind):
+    call_counts[kind] += 1
+    base = config.embed_latency_ms if kind == "embed" else config.generate_latency_ms
+    delay = max(0.0, base + random.uniform(-config.jitter_ms, config.jitter_ms))
+    await asyncio.sleep(delay / 1000.0)
+    if random.random() < config.error_rate:
+        call_counts["errors"] += 1
+        return JSONResponse(status_code=503, content={
+            "error": {"code": 503, "message": "Stub injected error", "status": "UNAVAILABLE"}
+        })
+    return None
+
+
+def content_text(content):
+    return " ".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+
+def embed_request(body):
+    text = content_text(body.get("content"))
+    return {"values": stub_embedding(text, int(body.get("outputDimensionality") or 768))}
+
+
+@app.post("/{api_version}/models/{model_action}")
+async def models_action(api_version: str, model_action: str, request: Request):
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+
+    if action in ("embedContent", "batchEmbedContents"):
+        error = await simulate("embed")
+        if error is not None:
+            return error
+        if action == "embedContent":
+            return {"embedding": embed_request(body)}
+        return {"embeddings": [embed_request(r) for r in body.get("requests", [])]}
+
+    if action == "generateContent":
+        error = await simulate("generate")
+        if error is not None:
+            return error
+        prompt = " ".join(content_text(c) for c in body.get("contents", []))
+        answer = stub_answer(prompt)
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": answer}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(answer) // 4,
+                "totalTokenCount": (len(prompt) + len(answer)) // 4
+            },
+            "modelVersion": model
+        }
+
+    return JSONResponse(status_code=404, content={
+        "error": {"code": 404, "message": f"Unsupported action {action}", "status": "NOT_FOUND"}
+    })
+
+
+@app.get("/stub/config")
+async def get_config():
+    return {"config": config.dict(), "calls": call_counts}
+
+
+@app.post("/stub/config")
+async def update_config(new_config: StubConfig):
+    global config
+    config = new_config
+    return {"config": config.dict()}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    uvicorn.run(app, host="127.0.0.1", port=port)
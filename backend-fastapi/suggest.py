@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from preprocess import COMMON_RESOURCE_TITLES, VERSION_URL_PREFIX, metadata_versions, page_key
+
+# Typeahead over page titles, URL slugs and CLI flag names, for jumping to a
+# page without an embedding search. Every name is indexed under a lower
+# case key, plus one key per later word ("MoveTables" is also found as
+# "tables", "vtctldclient_movetables" as "movetables"), in one sorted list;
+# a lookup is a bisect to the first key with the prefix and a scan of the
+# keys that follow. Suggestions are scoped by version like the vector
+# search: each entry knows the URL of its page in every version it is in,
+# and the sorted subset for a version is made once, when the index is
+# loaded. A flag is suggested once, linking to the page with the shortest
+# path that mentions it (usually the program's reference page).
+#
+# Built from the chunks of a generation at ingestion, and exported with
+# snapshots or sidecars (suggest.json) so workers only load it.
+
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "10"))
+SUGGEST_SCAN = 200  # Prefix matches ranked per lookup; very short prefixes stop here
+
+KIND_ORDER = {"title": 0, "flag": 1, "url": 2}
+
+_FLAG_RE = re.compile(r"(?<![\w-])--[a-z][a-z0-9]*(?:[-_.][a-z0-9]+)*")
+_WORD_BREAK_RE = re.compile(r"[\s_\-/.]+|(?<=[a-z0-9])(?=[A-Z])")
+
+
+def normalize_key(text):
+    return " ".join(text.lower().split())
+
+
+def suffix_keys(text):
+    """The key of text and of every later word in it, camelCase words included"""
+    keys = [normalize_key(text)]
+    for match in _WORD_BREAK_RE.finditer(text):
+        if 0 < match.end() < len(text):
+            key = normalize_key(text[match.end():])
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+
+class SuggestIndex:
+    def __init__(self, generation, entries):
+        # entries: [key, text, kind, {version: url}, common resource, key is the whole name], sorted by key
+        self.generation = generation
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+        self._scopes = {}
+        self._lock = threading.Lock()
+        for version in sorted({version for entry in entries for version in entry[3] if version}):
+            self._scope(version, True)
+            self._scope(version, False)
+
+    @classmethod
+    def from_chunks(cls, generation, documents, metadatas):
+        names = {}  # (kind, text, page key) -> [{version: url}, common resource]
+        flags = {}  # flag -> [{version: (path length, page key, url)}, common resource]
+        for document, metadata in zip(documents, metadatas):
+            key = metadata.get('page_key') or page_key(metadata.get('url', ''))
+            urls = {version: metadata.get(VERSION_URL_PREFIX + version, metadata.get('url', ''))
+                    for version in metadata_versions(metadata)} or {"": metadata.get('url', '')}
+            common = metadata.get('title') in COMMON_RESOURCE_TITLES
+
+            slug = key.rstrip("/").rsplit("/", 1)[-1]
+            for kind, text in (("title", metadata.get('title', '')), ("url", slug)):
+                if not text or text == "Unknown":
+                    continue
+                name = names.setdefault((kind, text, key), [{}, False])
+                name[0].update(urls)
+                name[1] = name[1] or common
+            for flag in set(_FLAG_RE.findall(document or "")):
+                pages = flags.setdefault(flag, [{}, False])
+                for version, url in urls.items():
+                    pages[0][version] = min(pages[0].get(version, (len(key), key, url)), (len(key), key, url))
+                pages[1] = pages[1] or common
+
+        entries = []
+        for (kind, text, _), (urls, common) in names.items():
+            for i, key in enumerate(suffix_keys(text)):
+                entries.append([key, text, kind, urls, common, i == 0])
+        for flag, (pages, common) in flags.items():
+            # Flags are typed with their dashes, so they only get their own key
+            entries.append([flag, flag, "flag", {version: url for version, (_, _, url) in pages.items()}, common, True])
+        entries.sort(key=lambda entry: (entry[0], not entry[5], KIND_ORDER[entry[2]], len(entry[1])))
+        return cls(generation, entries)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"generation": self.generation, "entries": self.entries}, file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(data["generation"], data["entries"])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _scope(self, version, include_resources):
+        """(keys, entry positions) visible to a version, still in key order"""
+        if not version:
+            return self.keys, None
+        scope = (version, include_resources)
+        with self._lock:
+            if scope not in self._scopes:
+                positions = [i for i, entry in enumerate(self.entries)
+                             if version in entry[3] or (include_resources and entry[4])]
+                self._scopes[scope] = ([self.keys[i] for i in positions], positions)
+            return self._scopes[scope]
+
+    def suggest(self, prefix, version=None, include_resources=True, limit=SUGGEST_LIMIT):
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return []
+        keys, positions = self._scope(version, include_resources)
+        start = bisect_left(keys, prefix)
+        matches = []
+        for i in range(start, min(start + SUGGEST_SCAN, len(keys))):
+            if not keys[i].startswith(prefix):
+                break
+            matches.append(i if positions is None else positions[i])
+
+        # Exact names first, then names starting with the prefix rather than a later
+        # word, then titles before flags before slugs, then shorter names
+        matches.sort(key=lambda i: (self.entries[i][0] != prefix, not self.entries[i][5],
+                                    KIND_ORDER[self.entries[i][2]], len(self.entries[i][1])))
+        suggestions = []
+        seen = set()
+        for i in matches:
+            _, text, kind, urls, _, _ = self.entries[i]
+            url = urls.get(version) if version in urls else next(iter(urls.values()), "")
+            if (kind, text, url) in seen:
+                continue
+            seen.add((kind, text, url))
+            suggestions.append({"text": text, "kind": kind, "url": url})
+            if len(suggestions) >= limit:
+                break
+        return suggestions
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from answer_cache import SemanticAnswerCache, answer_cache_scope
+
+# Run with: python -m pytest test_answer_cache.py (or python test_answer_cache.py)
+
+
+def make_request(**overrides):
+    fields = dict(version=None, include_resources=False, n_results=5, rerank=True, rerank_top_k=20,
+                  mmr_lambda=0.7, max_per_parent=2, pack_context=True, context_token_budget=3000)
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def test_hit_within_same_scope():
+    cache = SemanticAnswerCache(threshold=0.95)
+    scope = answer_cache_scope("rawquery-cli", make_request())
+    cache.store([1.0, 0.0, 0.0], scope, "gen-1", "what is vtgate", {"summary": "cached"}, 120.0)
+    answer, similarity = cache.lookup([1.0, 0.01, 0.0], answer_cache_scope("rawquery-cli", make_request()), "gen-1")
+    assert answer["summary"] == "cached"
+    assert similarity > 0.95
+
+
+def test_context_budget_is_part_of_scope():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], answer_cache_scope("rawquery-cli", make_request(context_token_budget=3000)),
+                "gen-1", "what is vtgate", {"summary": "cached"}, 120.0)
+    answer, _ = cache.lookup([1.0, 0.0, 0.0], answer_cache_scope("rawquery-cli", make_request(context_token_budget=500)),
+                             "gen-1")
+    assert answer is None
+    answer, _ = cache.lookup([1.0, 0.0, 0.0], answer_cache_scope("rawquery-cli", make_request(pack_context=False)),
+                             "gen-1")
+    assert answer is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_generation_change_clears_cache():
+    cache = SemanticAnswerCache(threshold=0.95)
+    scope = answer_cache_scope("enhance-query-cli", make_request())
+    cache.store([0.0, 1.0], scope, "gen-1", "vreplication", {"summary": "cached"}, 80.0)
+    answer, _ = cache.lookup([0.0, 1.0], scope, "gen-2")
+    assert answer is None
+    assert cache.stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,85 @@
+import sys
+import time
+
+from fixture_site import PAGES, serve_fixture_site
+from frontier import build_frontier, fetch_concurrently, fetch_text, sidebar_links
+
+# Checks frontier discovery against the local fixture site: the sitemap and
+# sidebar modes find the expected pages with the expected section paths and
+# versions, and concurrent fetch workers cover the frontier exactly once and
+# finish faster than a single worker. No browser or network needed.
+#
+# Usage: python testsitemap.py [workers] [latency_ms]
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def run(workers, latency_ms):
+    passed = True
+    with serve_fixture_site(latency_ms=latency_ms) as base_url:
+        docs_root = f"{base_url}/docs/"
+        expected = {f"{base_url}/{path}" for path in PAGES}
+        listed = {f"{base_url}/{path}" for path, (_, in_sidebar) in PAGES.items() if in_sidebar}
+
+        from_sitemap = build_frontier(docs_root, f"{base_url}/sitemap.xml", sidebars=False)
+        urls = {entry["url"] for entry in from_sitemap}
+        passed &= check(urls == expected, f"sitemap frontier has all {len(expected)} docs pages and nothing else")
+
+        from_sidebars = build_frontier(docs_root, None, sidebars=True)
+        urls = {entry["url"] for entry in from_sidebars}
+        passed &= check(urls == listed, f"sidebar frontier has the {len(listed)} pages listed in the sidebars")
+
+        combined = build_frontier(docs_root, f"{base_url}/sitemap.xml", sidebars=True)
+        by_url = {entry["url"]: entry for entry in combined}
+        passed &= check(set(by_url) == expected, "sitemap + sidebar frontier has every page once")
+
+        expectations = {
+            "docs/22.0/reference/features/mysql-replication/":
+                (["v22.0 (Development)", "Reference", "Features", "Mysql-replication"], "v22.0 (Development)"),
+            "docs/21.0/reference/programs/vtgate/":
+                (["v21.0 (Stable)", "Reference", "Programs", "Vtgate"], "v21.0 (Stable)"),
+            "docs/archive/13.0/reference/features/mysql-replication/":
+                (["Archives", "v13.0 (Archived)", "Reference", "Features", "Mysql-replication"], "v13.0 (Archived)"),
+            "docs/faq/operating-vitess/": (["FAQ", "Operating-vitess"], "FAQ"),
+        }
+        for path, (section_path, version) in expectations.items():
+            entry = by_url.get(f"{base_url}/{path}", {})
+            passed &= check(entry.get("section_path") == section_path and entry.get("version") == version,
+                            f"{path} -> {' > '.join(entry.get('section_path', []))} [{entry.get('version')}]")
+
+        top_level = [url for url, _, depth in sidebar_links(docs_root) if depth == 1]
+        passed &= check(len(top_level) == 5, f"root sidebar has {len(top_level)} top-level categories")
+
+        skip = {f"{base_url}/docs/faq/"}
+        resumed = build_frontier(docs_root, f"{base_url}/sitemap.xml", processed_urls=skip)
+        passed &= check(len(resumed) == len(expected) - 1, "already processed URLs are left out")
+
+        timings = {}
+        for count in sorted({1, workers}):
+            seen = []
+
+            def make_fetcher():
+                return fetch_text, lambda: None
+
+            def handle(entry, content):
+                seen.append((entry["url"], "docs-content" in content))
+
+            fetched, timings[count] = fetch_concurrently(combined, make_fetcher, handle, count)
+            passed &= check(sorted(url for url, _ in seen) == sorted(by_url) and all(ok for _, ok in seen),
+                            f"{count} workers fetched each of {fetched} pages once in {timings[count]:.2f}s")
+        if workers > 1 and latency_ms:
+            passed &= check(timings[workers] < timings[1] / 2,
+                            f"{workers} workers are {timings[1] / timings[workers]:.1f}x faster than one")
+    return passed
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    start = time.perf_counter()
+    ok = run(workers, latency_ms)
+    print(f"{'All checks passed' if ok else 'Some checks FAILED'} in {time.perf_counter() - start:.1f}s")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,45 @@
+import numpy as np
+
+# Small numpy helpers shared by ingestion and the offline evaluation scripts.
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def truncate_dims(matrix, dim):
+    """Matryoshka-style reduction: keep the leading dims and renormalize,
+    which matches asking the model for output_dimensionality=dim"""
+    return normalize_rows(np.asarray(matrix)[..., :dim])
+
+
+def to_storage_dtype(matrix, dtype):
+    return np.asarray(matrix).astype(STORAGE_DTYPES[dtype])
+
+
+def top_k(corpus, queries, k):
+    """Exact cosine top-k for normalized rows. float16 corpora are scored in
+    float32 so only storage precision changes, not the arithmetic."""
+    scores = np.asarray(queries, dtype=np.float32) @ np.asarray(corpus).astype(np.float32, copy=False).T
+    k = min(k, scores.shape[1])
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.arange(scores.shape[0])[:, None]
+    order = np.argsort(-scores[rows, indices], axis=1)
+    return indices[rows, order], scores[rows, indices[rows, order]]
+
+
+def blocked_scores(corpus, query, block_rows=8192):
+    """Cosine scores of one normalized query against every corpus row,
+    converting at most block_rows rows to float32 at a time so float16 or
+    mmap'd corpora are never copied whole"""
+    query = np.asarray(query, dtype=np.float32)
+    scores = np.empty(corpus.shape[0], dtype=np.float32)
+    for start in range(0, corpus.shape[0], block_rows):
+        block = np.asarray(corpus[start:start + block_rows]).astype(np.float32, copy=False)
+        scores[start:start + block_rows] = block @ query
+    return scores
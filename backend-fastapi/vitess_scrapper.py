@@ -2,23 +2,39 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException, WebDriverException
+import threading
 import time
 import yaml
 import os
+import sys
 from datetime import datetime
+from crawl_queue import CRAWL_DB, CrawlQueue
+from html_extract import html_to_markdown
+from page_cache import PAGE_CACHE_DIR, PageCache
+from rebuild_docs import DocsYamlAppender, build_page_record
+from frontier import DOCS_ROOT, SITEMAP_URL, build_frontier, fetch_concurrently, get_section_path_from_url, page_version
 
-def count_characters(text):
-    """Count characters in text"""
-    if not text:
-        return 0
-    return len(str(text))
+# Usage: python vitess_scrapper.py [frontier|rediscover|walk] [workers]
+#   frontier (default): discover every page up front from sitemap.xml and the
+#   per-version sidebars into the crawl queue (first run only), then fetch
+#   with concurrent browser sessions; rerun to resume an interrupted crawl
+#   rediscover: like frontier, but queue pages added to the site since
+#   walk: the original click-through of the sidebar from a start URL
 
-def estimate_tokens(text):
-    """Estimate tokens based on character count (rough approximation)"""
-    char_count = count_characters(text)
-    # Using the 4 characters per token approximation
-    return (char_count + 3) // 4
+FETCH_WORKERS = int(os.getenv("SCRAPER_WORKERS", "4"))
+# Pages a tuned browser session loads before it is replaced, to cap Chrome's memory growth
+DRIVER_RECYCLE_PAGES = int(os.getenv("DRIVER_RECYCLE_PAGES", "200"))
+
+# Requests the tuned driver never makes: only the HTML (and the site's own
+# scripts, which render nothing the scraper reads) are needed for article text
+BLOCKED_RESOURCE_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm",
+    "*google-analytics.com*", "*googletagmanager.com*", "*/analytics/*", "*doubleclick.net*",
+    "*algolia*", "*youtube.com*",
+]
 
 def setup_driver(headless=True):
     print("Setting up the WebDriver.")
@@ -31,7 +47,81 @@ def setup_driver(headless=True):
     
     return webdriver.Chrome(options=options)
 
-def get_page_content(driver, url):
+def setup_tuned_driver(headless=True):
+    """Chrome for bulk page fetching: returns as soon as the DOM is parsed
+    (eager page load) and never downloads images, stylesheets, fonts, media
+    or analytics, which are blocked through the DevTools protocol"""
+    options = webdriver.ChromeOptions()
+    options.page_load_strategy = 'eager'
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--window-size=1280,1024')
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--disable-background-networking')
+    options.add_argument('--disable-features=Translate,MediaRouter,OptimizationHints')
+    options.add_argument('--mute-audio')
+    options.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.default_content_setting_values.notifications': 2,
+    })
+
+    driver = webdriver.Chrome(options=options)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCE_PATTERNS})
+    # Served from the browser cache across the many pages of one session
+    driver.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': False})
+    return driver
+
+class DriverSession:
+    """A tuned driver reused across pages. It is replaced after
+    recycle_pages pages, since Chrome's memory grows with every navigation,
+    and whenever the browser stops responding."""
+
+    def __init__(self, headless=True, recycle_pages=DRIVER_RECYCLE_PAGES):
+        self.headless = headless
+        self.recycle_pages = recycle_pages
+        self.driver = None
+        self.pages = 0
+        self.launches = 0
+
+    def _start(self):
+        self.close()
+        self.driver = setup_tuned_driver(self.headless)
+        self.pages = 0
+        self.launches += 1
+
+    def fetch(self, url):
+        if self.driver is None or self.pages >= self.recycle_pages:
+            self._start()
+        self.pages += 1
+        html = get_page_html(self.driver, url)
+        if not html and not self.alive():
+            print(f"Browser session died on {url}, starting a new one")
+            self._start()
+            self.pages += 1
+            html = get_page_html(self.driver, url)
+        return html
+
+    def alive(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+
+def get_page_html(driver, url):
+    """The rendered page's HTML once its docs article is present, or "" on failure"""
     try:
         print(f"Navigating to URL: {url}")
         driver.get(url)
@@ -40,87 +130,48 @@ def get_page_content(driver, url):
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, "article.docs-content"))
         )
-        
-        print("Extracting main content from the page.")
-        main_content = driver.find_element(By.CSS_SELECTOR, "article.docs-content")
-        content_text = main_content.text
-        
-        print(f"Content extracted from {url}: {content_text[:100]}...")  # Print first 100 characters for debugging
-        return content_text
+        return driver.page_source
     except Exception as e:
         print(f"Error on page {url}: {str(e)}")
         return ""
 
+def get_page_content(driver, url):
+    html = get_page_html(driver, url)
+    if not html:
+        return ""
+    print("Extracting main content from the page.")
+    # Markdown keeps headings (with anchors), code blocks and tables for section-aware chunking
+    content_text = html_to_markdown(html)
+    
+    print(f"Content extracted from {url}: {content_text[:100]}...")  # Print first 100 characters for debugging
+    return content_text
+
+_yaml_appenders = {}
+_yaml_appenders_lock = threading.Lock()
+
 def save_to_yaml(data_item, filename="vitess_docs.yaml"):
-    """Save the data to a YAML file in the specified format with proper pipe character for content"""
+    """Append the data to the YAML file in the specified format with proper pipe character for content.
+    Returns the page's id_parent, the existing one when the URL was saved before, or None on failure."""
     try:
-        # Load existing data if file exists, otherwise create new structure
-        yaml_dict = {"vitess": []}
-        
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'r', encoding='utf-8') as file:
-                    file_content = file.read().strip()
-                    if file_content and file_content != "vitess:":
-                        yaml_dict = yaml.safe_load(file_content)
-                    # If file just contains "vitess:" with no entries, we'll use our empty list
-            except Exception as e:
-                print(f"Error reading existing YAML file: {str(e)}, creating new file")
-        
-        # Determine the next ID
-        next_id = 1
-        if yaml_dict and "vitess" in yaml_dict and yaml_dict["vitess"]:
-            # Get the highest ID and increment by 1
-            existing_ids = [item.get("id_parent", 0) for item in yaml_dict["vitess"]]
-            if existing_ids:
-                next_id = max(existing_ids) + 1
-        
-        # Add ID to the data item
-        data_item["id_parent"] = next_id
-        
-        # Add the new item to the list
-        if "vitess" not in yaml_dict:
-            yaml_dict["vitess"] = []
-        yaml_dict["vitess"].append(data_item)
-        
-        # Create a properly formatted YAML file manually
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.write("vitess:\n")
-            
-            for entry in yaml_dict["vitess"]:
-                file.write(f"- id_parent: {entry['id_parent']}\n")
-                file.write(f"  title: {entry['title']}\n")
-                file.write(f"  url: {entry['url']}\n")
-                file.write("  content: |\n")
-                
-                # Make sure content is a string and split by lines
-                content_str = str(entry['content'])
-                for line in content_str.split('\n'):
-                    # Ensure each line has proper indentation
-                    file.write(f"    {line}\n")
-                
-                file.write(f"  version_or_commonresource: {entry['version_or_commonresource']}\n")
-                file.write(f"  char_count: {entry['char_count']}\n")
-                file.write(f"  approx_token_count: {entry['approx_token_count']}\n")
-        
-        print(f"Data saved to {filename} with ID {next_id}")
-        return next_id
+        with _yaml_appenders_lock:
+            appender = _yaml_appenders.get(os.path.abspath(filename))
+            if appender is None:
+                appender = _yaml_appenders[os.path.abspath(filename)] = DocsYamlAppender(filename)
+        data_item.pop("id_parent", None)
+        saved_id = appender.append(data_item)
+        if "id_parent" in data_item:
+            print(f"Data saved to {filename} with ID {saved_id}")
+        else:
+            # Saving a page again (a crawl resumed after dying mid-save) keeps its entry
+            print(f"{data_item['url']} already saved with ID {saved_id}")
+        return saved_id
     except Exception as e:
         print(f"Error saving to YAML: {str(e)}")
         return None
 
-def scrape_docs_recursive(driver, base_url, start_url=None):
-    """
-    Scrape the documentation in a systematic way without hardcoding,
-    optionally starting from a specific URL
-    """
-    processed_urls = set()  # Track processed URLs to avoid loops
-    yaml_filename = "vitess_docs.yaml"
-    total_saved = 0
-    max_retries = 3  # Limit retries to avoid infinite loops
-    sections_to_skip = 3  # Skip first 3 sections
-    
-    # Load already processed URLs from YAML file
+def load_processed_urls(yaml_filename="vitess_docs.yaml"):
+    """URLs already saved to the YAML file, so a rerun picks up where it stopped"""
+    processed_urls = set()
     if os.path.exists(yaml_filename):
         try:
             with open(yaml_filename, 'r', encoding='utf-8') as file:
@@ -134,35 +185,27 @@ def scrape_docs_recursive(driver, base_url, start_url=None):
             print(f"Loaded {len(processed_urls)} already processed URLs from YAML file")
         except Exception as e:
             print(f"Error reading YAML file: {str(e)}")
+    return processed_urls
+
+def scrape_docs_recursive(driver, base_url, start_url=None):
+    """
+    Scrape the documentation in a systematic way without hardcoding,
+    optionally starting from a specific URL
+    """
+    processed_urls = set()  # Track processed URLs to avoid loops
+    yaml_filename = "vitess_docs.yaml"
+    total_saved = 0
+    max_retries = 3  # Limit retries to avoid infinite loops
+    sections_to_skip = 3  # Skip first 3 sections
+    
+    # Load already processed URLs from YAML file
+    processed_urls.update(load_processed_urls(yaml_filename))
     
     # Remove the starting URL from processed_urls to force reprocessing it
     if start_url and start_url in processed_urls:
         processed_urls.remove(start_url)
         print(f"Removed starting URL from processed list to reprocess it")
     
-    def get_section_path_from_url(url):
-        """Extract section path from URL to build proper breadcrumbs"""
-        if "archive" in url:
-            # Extract path for archived docs
-            parts = url.split("/docs/archive/")
-            if len(parts) > 1:
-                path_parts = parts[1].strip("/").split("/")
-                if path_parts:
-                    # Format: ["Archives", "v18.0 (Archived)", "Reference", ...]
-                    version = path_parts[0]
-                    version_label = f"v{version} (Archived)" if version.replace(".", "").isdigit() else version
-                    
-                    section_path = ["Archives", version_label]
-                    section_path.extend(part.capitalize() for part in path_parts[1:] if part)
-                    return section_path
-        
-        # Default path extraction for non-archived content
-        path_parts = url.replace("https://vitess.io/docs/", "").strip("/").split("/")
-        if path_parts:
-            return [part.capitalize() for part in path_parts]
-        
-        return ["Unknown"]
-    
     def scrape_page(url, section_path, is_archived=False):
         """Scrape a single page and print its information"""
         nonlocal total_saved
@@ -179,35 +222,7 @@ def scrape_docs_recursive(driver, base_url, start_url=None):
             print(f"No content found at {url}, skipping")
             return
             
-        char_count = count_characters(content)
-        approx_token_count = estimate_tokens(content)
-        
-        # Extract version from URL or path more reliably
-        version = "Unknown"
-        
-        # Special handling for Archived section - use subsection title as version
-        if is_archived and len(section_path) >= 2:
-            # Use the immediate subsection under Archived as version
-            version = section_path[1]
-        elif section_path and section_path[0]:
-            version = section_path[0]
-        else:
-            # Try to extract version from URL if section_path is empty
-            url_parts = url.split('/')
-            for part in url_parts:
-                if part.startswith('v') and any(c.isdigit() for c in part):
-                    version = part
-                    break
-        
-        # Create data dictionary for YAML in the exact format requested
-        data = {
-            "title": section_path[-1] if section_path else "Unknown",
-            "url": url,
-            "content": content,
-            "version_or_commonresource": version,
-            "char_count": char_count,
-            "approx_token_count": approx_token_count
-        }
+        data = build_page_record(url, section_path, content, page_version(url, section_path, is_archived))
         
         # Save to YAML file - id_parent will be assigned in the save_to_yaml function
         saved_id = save_to_yaml(data, yaml_filename)
@@ -575,7 +590,74 @@ def scrape_from_section(headless=True, start_url=None):
         time.sleep(2)
         driver.quit()
 
+def scrape_from_frontier(headless=True, workers=FETCH_WORKERS, docs_root=DOCS_ROOT, sitemap_url=SITEMAP_URL,
+                         yaml_filename="vitess_docs.yaml", queue_path=CRAWL_DB, rediscover=False,
+                         cache_dir=PAGE_CACHE_DIR):
+    """
+    Build the full URL frontier up front from the sitemap and the per-version
+    sidebars, then fetch it with concurrent, tuned browser sessions. The
+    frontier and each page's progress live in the crawl queue database, so a
+    rerun resumes where the last one stopped, and several scraper processes
+    can work through the same queue. Raw HTML of every fetched page goes to
+    the page cache, so vitess_docs.yaml can be rebuilt without crawling again
+    (see rebuild_docs.py).
+    """
+    crawl_queue = CrawlQueue(queue_path)
+    released = crawl_queue.requeue_orphans()
+    if released:
+        print(f"Released {released} pages held by crawler processes that are gone")
+
+    if rediscover or not len(crawl_queue):
+        added = crawl_queue.add(build_frontier(docs_root, sitemap_url, sidebars=True))
+        print(f"Queued {added} new pages")
+        if added and os.path.exists(yaml_filename) and added == len(crawl_queue):
+            # First run against output from a crawl that predates the queue; the only time the YAML is read
+            crawl_queue.mark_done(load_processed_urls(yaml_filename))
+    print(f"Crawl queue {queue_path}: {crawl_queue.stats()}")
+    page_cache = PageCache(cache_dir)
+    total_saved = 0
+
+    def make_fetcher():
+        # One browser session per worker; WebDriver sessions aren't thread-safe
+        session = DriverSession(headless)
+
+        def fetch(url):
+            # Extract here rather than in save_page, which runs one page at a time
+            html = session.fetch(url)
+            return html, html_to_markdown(html) if html else ""
+
+        return fetch, session.close
+
+    def save_page(entry, page):
+        nonlocal total_saved
+        html, content = page
+        if html:
+            # Cached even when extraction finds nothing, so the page can be redone offline
+            page_cache.put(entry, html)
+        if not content:
+            raise ValueError("no content found")
+        data = build_page_record(entry["url"], entry["section_path"], content, entry["version"])
+        saved_id = save_to_yaml(data, yaml_filename)
+        if saved_id is None:
+            raise IOError(f"could not save to {yaml_filename}")
+        total_saved += 1
+        return saved_id
+
+    fetched, seconds = fetch_concurrently(crawl_queue, make_fetcher, save_page, workers)
+
+    print("\n===== Scraping Summary =====")
+    print(f"Crawl queue: {crawl_queue.stats()}")
+    print(f"Fetched {fetched} pages with {workers} workers in {seconds:.1f}s "
+          f"({fetched / seconds if seconds else 0:.2f} pages/s)")
+    print(f"Total pages saved: {total_saved}")
+    return total_saved, yaml_filename
+
 if __name__ == "__main__":
-    # Start scraping from the specified URL
-    start_url = "https://vitess.io/docs/archive/13.0/reference/features/mysql-replication/"
-    scrape_from_section(headless=True, start_url=start_url)
\ No newline at end of file
+    mode = sys.argv[1] if len(sys.argv) > 1 else "frontier"
+    if mode == "walk":
+        # Start scraping from the specified URL
+        start_url = "https://vitess.io/docs/archive/13.0/reference/features/mysql-replication/"
+        scrape_from_section(headless=True, start_url=start_url)
+    else:
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else FETCH_WORKERS
+        scrape_from_frontier(headless=True, workers=workers, rediscover=mode == "rediscover")